@@ -1,4 +1,175 @@
-from pydantic_ai import Agent, Tool
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
 
+from pydantic import TypeAdapter
+from pydantic_ai import Agent
+from pydantic_ai.models import Model
 
+from .cache import LLMCache, cache_key
 
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+
+# name -> function returning the Agent keyword arguments (system prompt, output type, ...)
+_agent_configs: dict[str, Callable[[], dict[str, Any]]] = {}
+_agents: dict[str, Agent] = {}
+# name -> (hash of prompt, output schema and model, adapter for the output type)
+_agent_versions: dict[str, tuple[str, TypeAdapter]] = {}
+_model_override: Model | str | None = None
+# Re-entrant because building an agent opens the cache, which takes the lock too
+_lock = threading.RLock()
+
+_cache: LLMCache | None = None
+_cache_enabled = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+
+
+def register_agent(name: str) -> Callable[[Callable[[], dict[str, Any]]], Callable[[], dict[str, Any]]]:
+    """
+    Decorator registering the config function for a named agent. The function is
+    only called, and the Agent only built, the first time the agent is requested.
+    """
+    def decorator(config: Callable[[], dict[str, Any]]) -> Callable[[], dict[str, Any]]:
+        with _lock:
+            _agent_configs[name] = config
+            _agents.pop(name, None)
+        return config
+
+    return decorator
+
+
+def get_agent(name: str) -> Agent:
+    """Returns the shared Agent registered under name, building it on first use."""
+    agent = _agents.get(name)
+    if agent is not None:
+        return agent
+
+    with _lock:
+        # Another thread may have built it while we were waiting for the lock
+        agent = _agents.get(name)
+        if agent is None:
+            if name not in _agent_configs:
+                raise KeyError(f"No agent registered under '{name}'")
+
+            kwargs = dict(_agent_configs[name]())
+            kwargs.setdefault("model", DEFAULT_MODEL)
+            if _model_override is not None:
+                kwargs["model"] = _model_override
+
+            agent = Agent(**kwargs)
+            _agents[name] = agent
+            _agent_versions[name] = _agent_version(kwargs)
+
+            if _cache_enabled:
+                get_cache().invalidate(name, keep_version=_agent_versions[name][0])
+
+    return agent
+
+
+def set_model(model: Model | str | None) -> None:
+    """
+    Swaps the model behind every registered agent, e.g. for a
+    pydantic_ai.models.test.TestModel in tests. None restores each agent's own model.
+    """
+    global _model_override
+
+    with _lock:
+        _model_override = model
+        # Agents are rebuilt lazily against the new model
+        _agents.clear()
+        _agent_versions.clear()
+
+
+@contextmanager
+def override_model(model: Model | str) -> Iterator[None]:
+    """Context manager version of set_model that restores the previous model on exit."""
+    previous = _model_override
+    set_model(model)
+    try:
+        yield
+    finally:
+        set_model(previous)
+
+
+def _agent_version(kwargs: dict[str, Any]) -> tuple[str, TypeAdapter]:
+    adapter = TypeAdapter(kwargs.get("output_type", str))
+    model = kwargs["model"]
+    fingerprint = json.dumps(
+        {
+            "model": model if isinstance(model, str) else f"{type(model).__name__}:{getattr(model, 'model_name', '')}",
+            "system_prompt": kwargs.get("system_prompt"),
+            "instructions": kwargs.get("instructions"),
+            "output_schema": adapter.json_schema(),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(fingerprint.encode()).hexdigest()[:16], adapter
+
+
+def get_cache() -> LLMCache:
+    """Returns the process-wide LLM result cache, opening it on first use."""
+    global _cache
+
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = LLMCache()
+
+    return _cache
+
+
+def set_cache(cache: LLMCache | None, enabled: bool = True) -> None:
+    """Replaces the LLM result cache, e.g. with LLMCache(path=None) in tests, or disables caching."""
+    global _cache, _cache_enabled
+
+    with _lock:
+        _cache = cache
+        _cache_enabled = enabled
+
+
+def _cached_output(name: str, prompt: Any) -> tuple[str, Any]:
+    version, adapter = _agent_versions[name]
+    key = cache_key(name, version, prompt)
+    cached = get_cache().get(key)
+
+    return key, adapter.validate_json(cached) if cached is not None else None
+
+
+def _store_output(name: str, key: str, output: Any) -> None:
+    version, adapter = _agent_versions[name]
+    get_cache().set(key, name, version, adapter.dump_json(output).decode())
+
+
+def run_agent_sync(name: str, prompt: Any) -> Any:
+    """Runs the named agent and returns its output, serving repeated prompts from the LLM cache."""
+    agent = get_agent(name)
+    if not _cache_enabled:
+        return agent.run_sync(prompt).output
+
+    key, output = _cached_output(name, prompt)
+    if output is not None:
+        return output
+
+    output = agent.run_sync(prompt).output
+    _store_output(name, key, output)
+
+    return output
+
+
+async def run_agent(name: str, prompt: Any) -> Any:
+    """Async version of run_agent_sync."""
+    agent = get_agent(name)
+    if not _cache_enabled:
+        return (await agent.run(prompt)).output
+
+    key, output = _cached_output(name, prompt)
+    if output is not None:
+        return output
+
+    output = (await agent.run(prompt)).output
+    _store_output(name, key, output)
+
+    return output
@@ -0,0 +1,174 @@
+"""
+Content-addressed cache for LLM agent outputs.
+
+Entries are keyed by a hash of the agent name, the agent version (a hash of its
+system prompt, output schema and model) and the normalised prompt, so changing
+a prompt or model never serves stale answers. Lookups hit an in-memory LRU
+first and fall back to a SQLite file shared across processes and restarts.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "4096"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_text(text: str) -> str:
+    """Lowercases, collapses whitespace and strips trailing punctuation so trivially different requests share an entry."""
+    return _WHITESPACE.sub(" ", text).strip().lower().rstrip(".!?")
+
+
+def normalise_payload(payload: Any) -> Any:
+    if isinstance(payload, str):
+        return normalise_text(payload)
+    if hasattr(payload, "model_dump"):
+        return normalise_payload(payload.model_dump())
+    if isinstance(payload, dict):
+        return {str(k): normalise_payload(v) for k, v in payload.items()}
+    if isinstance(payload, (list, tuple, set)):
+        items = [normalise_payload(v) for v in payload]
+        return sorted(items, key=repr) if isinstance(payload, set) else items
+    return payload
+
+
+def cache_key(agent_name: str, agent_version: str, payload: Any) -> str:
+    body = json.dumps(
+        [agent_name, agent_version, normalise_payload(payload)],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: str | None = DEFAULT_CACHE_PATH,
+        ttl_seconds: float | None = DEFAULT_TTL_SECONDS,
+        max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+    ):
+        # path=None keeps the cache in memory only
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "writes": 0}
+
+        self._db = None
+        if path is not None:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    agent TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_agent ON llm_cache (agent, version)")
+            self._db.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached JSON value for key, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                created_at, value = self._memory[key]
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self._counters["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if not self._expired(created_at):
+                        self._remember(key, created_at, value)
+                        self._counters["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["expired"] += 1
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, agent_name: str, agent_version: str, value: str) -> None:
+        created_at = time.time()
+        with self._lock:
+            self._remember(key, created_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, agent, version, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, agent_name, agent_version, value, created_at),
+                )
+                self._db.commit()
+            self._counters["writes"] += 1
+
+    def invalidate(self, agent_name: str, keep_version: str | None = None) -> int:
+        """
+        Drops on-disk entries for an agent, except those for keep_version. Called
+        when an agent is (re)built so entries from old prompts do not linger.
+        """
+        with self._lock:
+            # Memory entries are not tagged with their agent, and stale versions can never be hit anyway
+            self._memory.clear()
+            if self._db is None:
+                return 0
+
+            if keep_version is None:
+                cursor = self._db.execute("DELETE FROM llm_cache WHERE agent = ?", (agent_name,))
+            else:
+                cursor = self._db.execute(
+                    "DELETE FROM llm_cache WHERE agent = ? AND version != ?", (agent_name, keep_version)
+                )
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        lookups = hits + counters["misses"]
+        return {
+            **counters,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
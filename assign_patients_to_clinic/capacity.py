@@ -0,0 +1,159 @@
+"""
+Capacity-aware assignment of referrals to clinics.
+
+Referrals are handled one at a time, most urgent first and oldest first
+within a priority. Each takes the nearest candidate clinic that still has a
+vacant new slot, or failing that the nearest with a vacant follow-up slot,
+and that clinic's count goes down by one. So a clinic with 3 vacant slots
+gets at most 3 patients. Referrals left without a clinic are reported with
+the reason.
+
+Candidates are (patient_index, clinic_index, distance_m) pairs, as from
+ClinicIndex.query. Run `python -m assign_patients_to_clinic.capacity` from
+the repository root for a benchmark at 50k referrals x 25k clinics.
+"""
+import sys
+import os
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from assign_patients_to_clinic.clinic_index import ClinicIndex, _synthetic
+
+# Vacant slot columns, in the order they are used up
+SLOT_COLUMNS = ("total_vacant_slots_new", "total_vacant_slots_followup")
+# Most urgent first; other priorities go after these
+PRIORITY_ORDER = ("Urgent 2WW", "Urgent", "Routine")
+
+NO_CANDIDATES = "no clinic of the recommended type in range"
+NO_CAPACITY = "no vacant slots left in range"
+
+
+@dataclass
+class CapacityAssignment:
+    # One row per assigned referral: patient_index, clinic_index, slot_type, distance_m
+    assignments: pd.DataFrame
+    # One row per referral left over: patient_index, reason
+    unassigned: pd.DataFrame
+    # Vacant slots left per clinic, indexed like the clinics frame
+    remaining: pd.DataFrame
+
+    def summary(self) -> str:
+        reasons = self.unassigned["reason"].value_counts()
+        lines = [f"Assigned {len(self.assignments)} referrals, {len(self.unassigned)} unassigned"]
+        lines += [f"  {count} {reason}" for reason, count in reasons.items()]
+        return "\n".join(lines)
+
+
+def referral_order(referrals: pd.DataFrame, priority_col: str = "priority", date_col: str = "date_referral_received") -> np.ndarray:
+    """Positions of the referrals in processing order: by priority, then date received."""
+    rank_of = {priority: i for i, priority in enumerate(PRIORITY_ORDER)}
+    if priority_col in referrals.columns:
+        rank = referrals[priority_col].astype(object).map(rank_of).fillna(len(PRIORITY_ORDER)).to_numpy()
+    else:
+        rank = np.zeros(len(referrals))
+
+    if date_col in referrals.columns:
+        dates = pd.to_datetime(referrals[date_col], errors="coerce", utc=True).dt.tz_localize(None)
+        # Referrals without a date go last within their priority
+        date_key = np.where(dates.isna().to_numpy(), np.iinfo(np.int64).max, dates.to_numpy().astype("datetime64[ns]").astype(np.int64))
+    else:
+        date_key = np.zeros(len(referrals), dtype=np.int64)
+
+    return np.lexsort((date_key, rank))
+
+
+def assign_with_capacity(
+    referrals: pd.DataFrame,
+    clinics: pd.DataFrame,
+    candidates: pd.DataFrame,
+    slot_columns: tuple[str, ...] = SLOT_COLUMNS,
+    priority_col: str = "priority",
+    date_col: str = "date_referral_received",
+) -> CapacityAssignment:
+    """Assigns each referral (indexed like candidates' patient_index) a clinic slot, respecting vacant slots."""
+    order = referral_order(referrals, priority_col, date_col)
+    n = len(referrals)
+
+    # Candidates grouped by referral position, nearest first
+    patient_pos = referrals.index.get_indexer(candidates["patient_index"])
+    clinic_pos = clinics.index.get_indexer(candidates["clinic_index"])
+    distance = candidates["distance_m"].to_numpy(dtype=np.float64)
+    valid = (patient_pos >= 0) & (clinic_pos >= 0)
+    patient_pos, clinic_pos, distance = patient_pos[valid], clinic_pos[valid], distance[valid]
+    by_patient = np.lexsort((distance, patient_pos))
+    patient_pos, clinic_pos, distance = patient_pos[by_patient], clinic_pos[by_patient], distance[by_patient]
+    starts = np.searchsorted(patient_pos, np.arange(n + 1))
+
+    capacity = [clinics[column].fillna(0).clip(lower=0).to_numpy(dtype=np.int64).copy() for column in slot_columns]
+
+    assigned_patient, assigned_clinic, assigned_slot, assigned_distance = [], [], [], []
+    unassigned_patient, unassigned_reason = [], []
+    for position in order:
+        start, end = starts[position], starts[position + 1]
+        if start == end:
+            unassigned_patient.append(position)
+            unassigned_reason.append(NO_CANDIDATES)
+            continue
+
+        chosen = None
+        for slot, vacant in enumerate(capacity):
+            for j in range(start, end):
+                if vacant[clinic_pos[j]] > 0:
+                    vacant[clinic_pos[j]] -= 1
+                    chosen = j, slot
+                    break
+            if chosen is not None:
+                break
+
+        if chosen is None:
+            unassigned_patient.append(position)
+            unassigned_reason.append(NO_CAPACITY)
+            continue
+
+        j, slot = chosen
+        assigned_patient.append(position)
+        assigned_clinic.append(clinic_pos[j])
+        assigned_slot.append(slot_columns[slot])
+        assigned_distance.append(distance[j])
+
+    assignments = pd.DataFrame({
+        "patient_index": referrals.index.to_numpy()[np.asarray(assigned_patient, dtype=np.int64)],
+        "clinic_index": clinics.index.to_numpy()[np.asarray(assigned_clinic, dtype=np.int64)],
+        "slot_type": assigned_slot,
+        "distance_m": assigned_distance,
+    })
+    unassigned = pd.DataFrame({
+        "patient_index": referrals.index.to_numpy()[np.asarray(unassigned_patient, dtype=np.int64)],
+        "reason": unassigned_reason,
+    })
+    remaining = pd.DataFrame(dict(zip(slot_columns, capacity)), index=clinics.index)
+    return CapacityAssignment(assignments, unassigned, remaining)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    referrals, clinics = _synthetic(50_000, 25_000, ["GP Clinic", "Nurse Clinic", "Phlebotomy"])
+    referrals["priority"] = rng.choice(list(PRIORITY_ORDER), len(referrals), p=[0.05, 0.15, 0.8])
+    referrals["date_referral_received"] = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 180, len(referrals)), unit="D")
+    clinics["total_vacant_slots_new"] = rng.integers(0, 4, len(clinics))
+    clinics["total_vacant_slots_followup"] = rng.integers(0, 3, len(clinics))
+
+    start = time.perf_counter()
+    candidates = ClinicIndex(clinics).query(referrals)
+    search_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = assign_with_capacity(referrals, clinics, candidates)
+    assign_time = time.perf_counter() - start
+
+    print(f"Candidate search {search_time:.2f}s ({len(candidates)} pairs), assignment {assign_time:.2f}s")
+    print(result.summary())
+
+    used = result.assignments.groupby(["clinic_index", "slot_type"]).size().unstack(fill_value=0)
+    for column in SLOT_COLUMNS:
+        over = (used.get(column, 0) > clinics.loc[used.index, column]).sum()
+        print(f"Clinics over {column}: {over}")
@@ -0,0 +1,196 @@
+"""
+Nearest-clinic search over a point index.
+
+patients_to_clinic.py used to buffer every referral by 5km (a polygon in Web
+Mercator) and spatially join all clinics against all buffers. ClinicIndex
+instead builds one tree per clinic_type_name over the clinic coordinates, once,
+and answers a radius query per patient against only the tree of the clinic type
+recommended for them, optionally keeping the k nearest.
+
+metric="mercator" (the default) reproduces the old join exactly: distances are
+measured in EPSG:3857 metres, like the buffers were, and candidates are checked
+against the same 64-sided polygon GEOS draws for a point buffer, rather than a
+true circle. metric="haversine" uses a BallTree on great-circle distance, for
+real metres on the ground.
+
+Run `python -m assign_patients_to_clinic.clinic_index` from the repository root
+for a benchmark against the buffer + sjoin path at 50k patients x 25k clinics.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree, KDTree
+
+# Mean Earth radius, for haversine distances
+EARTH_RADIUS_M = 6_371_008.8
+# Sphere radius of EPSG:3857
+WEB_MERCATOR_RADIUS_M = 6_378_137.0
+DEFAULT_RADIUS_M = 5000
+# Segments per quarter circle in a GEOS/shapely point buffer
+BUFFER_QUAD_SEGS = 16
+
+
+def web_mercator(lat, lon) -> np.ndarray:
+    """(x, y) in EPSG:3857 metres for arrays of latitude and longitude in degrees."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([WEB_MERCATOR_RADIUS_M * lon, WEB_MERCATOR_RADIUS_M * np.log(np.tan(np.pi / 4 + lat / 2))])
+
+
+def within_buffer_polygon(dx: np.ndarray, dy: np.ndarray, radius: float, quad_segs: int = BUFFER_QUAD_SEGS) -> np.ndarray:
+    """
+    Whether offsets (dx, dy) from a point fall inside its buffer(radius)
+    polygon: a regular polygon with 4 * quad_segs vertices on the circle,
+    the first at angle 0.
+    """
+    step = np.pi / (2 * quad_segs)
+    # Angle from the start of the polygon edge the offset points at
+    theta = np.mod(np.arctan2(dy, dx), step)
+    return np.hypot(dx, dy) * np.cos(theta - step / 2) < radius * np.cos(step / 2)
+
+
+class ClinicIndex:
+    def __init__(
+        self,
+        clinics: pd.DataFrame,
+        metric: str = "mercator",
+        type_col: str = "clinic_type_name",
+        lat_col: str = "lat",
+        lon_col: str = "long",
+    ):
+        if metric not in ("mercator", "haversine"):
+            raise ValueError(f"Unknown metric '{metric}', expected 'mercator' or 'haversine'")
+        self.metric = metric
+
+        clinics = clinics.dropna(subset=[lat_col, lon_col, type_col])
+        # clinic_type_name -> (tree, clinic points, clinic index labels)
+        self._trees: dict[str, tuple[KDTree | BallTree, np.ndarray, np.ndarray]] = {}
+        for clinic_type, group in clinics.groupby(type_col, observed=True, sort=False):
+            points = self._points(group[lat_col], group[lon_col])
+            tree = KDTree(points) if metric == "mercator" else BallTree(points, metric="haversine")
+            self._trees[str(clinic_type)] = (tree, points, group.index.to_numpy())
+
+    def _points(self, lat, lon) -> np.ndarray:
+        if self.metric == "mercator":
+            return web_mercator(lat, lon)
+        return np.radians(np.column_stack([np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)]))
+
+    def query(
+        self,
+        patients: pd.DataFrame,
+        radius_m: float = DEFAULT_RADIUS_M,
+        k: int | None = None,
+        type_col: str = "appointment_type_recommendation",
+        lat_col: str = "lat",
+        lon_col: str = "long",
+    ) -> pd.DataFrame:
+        """
+        Clinics of each patient's recommended type within radius_m, nearest
+        first, at most k per patient (all of them if k is None). Returns one
+        row per (patient, clinic) pair: the patient's and the clinic's index
+        labels in the input frames, and the distance in metres.
+        """
+        frames = []
+        patients = patients.dropna(subset=[lat_col, lon_col, type_col])
+
+        for clinic_type, group in patients.groupby(type_col, observed=True, sort=False):
+            if str(clinic_type) not in self._trees:
+                continue
+            tree, clinic_points, clinic_labels = self._trees[str(clinic_type)]
+
+            patient_points = self._points(group[lat_col], group[lon_col])
+            radius = radius_m if self.metric == "mercator" else radius_m / EARTH_RADIUS_M
+            neighbours, distances = tree.query_radius(patient_points, radius, return_distance=True, sort_results=True)
+
+            counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+            if not counts.sum():
+                continue
+            patient_pos = np.repeat(np.arange(len(group)), counts)
+            clinic_pos = np.concatenate(neighbours)
+            distance = np.concatenate(distances)
+
+            if self.metric == "mercator":
+                offsets = clinic_points[clinic_pos] - patient_points[patient_pos]
+                inside = within_buffer_polygon(offsets[:, 0], offsets[:, 1], radius_m)
+                patient_pos, clinic_pos, distance = patient_pos[inside], clinic_pos[inside], distance[inside]
+            else:
+                distance = distance * EARTH_RADIUS_M
+
+            frames.append(pd.DataFrame({
+                "patient_index": group.index.to_numpy()[patient_pos],
+                "clinic_index": clinic_labels[clinic_pos],
+                "distance_m": distance,
+            }))
+
+        if not frames:
+            return pd.DataFrame({"patient_index": [], "clinic_index": [], "distance_m": []})
+
+        pairs = pd.concat(frames, ignore_index=True)
+        if k is not None:
+            pairs = pairs[pairs.groupby("patient_index", sort=False).cumcount() < k].reset_index(drop=True)
+        return pairs
+
+
+def sjoin_candidates(
+    patients: pd.DataFrame,
+    clinics: pd.DataFrame,
+    radius_m: float = DEFAULT_RADIUS_M,
+    type_col: str = "appointment_type_recommendation",
+) -> pd.DataFrame:
+    """The old buffer + sjoin candidate pairs (patient_index, clinic_index), for comparison."""
+    import geopandas as gpd
+
+    gdf_patients = gpd.GeoDataFrame(
+        patients[[type_col]], geometry=gpd.points_from_xy(patients["long"], patients["lat"]), crs="EPSG:4326"
+    ).to_crs(epsg=3857)
+    gdf_clinics = gpd.GeoDataFrame(
+        clinics[["clinic_type_name"]], geometry=gpd.points_from_xy(clinics["long"], clinics["lat"]), crs="EPSG:4326"
+    ).to_crs(epsg=3857)
+    gdf_patients["buffer"] = gdf_patients.buffer(radius_m)
+
+    joined = gpd.sjoin(gdf_clinics, gdf_patients.set_geometry("buffer"), how="inner", predicate="within")
+    joined = joined[joined["clinic_type_name"] == joined[type_col]]
+    return pd.DataFrame({"patient_index": joined["index_right"].to_numpy(), "clinic_index": joined.index.to_numpy()})
+
+
+def _synthetic(n_patients: int, n_clinics: int, clinic_types: list[str], seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Spread over England and Wales, so a 5km radius holds a handful of clinics
+    rng = np.random.default_rng(seed)
+    clinics = pd.DataFrame({
+        "lat": rng.uniform(50.5, 54.5, n_clinics),
+        "long": rng.uniform(-4.5, 0.5, n_clinics),
+        "clinic_type_name": rng.choice(clinic_types, n_clinics),
+    })
+    patients = pd.DataFrame({
+        "lat": rng.uniform(50.5, 54.5, n_patients),
+        "long": rng.uniform(-4.5, 0.5, n_patients),
+        "appointment_type_recommendation": rng.choice(clinic_types, n_patients),
+    })
+    return patients, clinics
+
+
+if __name__ == "__main__":
+    patients, clinics = _synthetic(50_000, 25_000, ["GP Clinic", "Nurse Clinic", "Phlebotomy"])
+
+    start = time.perf_counter()
+    index = ClinicIndex(clinics)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = index.query(patients)
+    query_time = time.perf_counter() - start
+    print(f"ClinicIndex: built in {build_time * 1000:.0f}ms, {len(pairs)} pairs in {query_time * 1000:.0f}ms")
+
+    start = time.perf_counter()
+    nearest = ClinicIndex(clinics, metric="haversine").query(patients, k=3)
+    print(f"ClinicIndex (haversine, k=3): {len(nearest)} pairs in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    try:
+        start = time.perf_counter()
+        legacy = sjoin_candidates(patients, clinics)
+        print(f"buffer + sjoin: {len(legacy)} pairs in {(time.perf_counter() - start) * 1000:.0f}ms")
+    except ImportError:
+        print("geopandas not installed, skipping the buffer + sjoin comparison")
+    else:
+        same = set(zip(pairs["patient_index"], pairs["clinic_index"])) == set(zip(legacy["patient_index"], legacy["clinic_index"]))
+        print(f"Same candidate pairs: {same}")
@@ -0,0 +1,123 @@
+"""
+Clinic geocoding, as a cached stage.
+
+GP Clinics.csv has no coordinates, only a free-text location per clinic.
+geocode_locations gives each unique location a lat/long either from a
+lookup (e.g. PostcodeTable, a local postcode -> lat/long file, for real data)
+or, by default, synthetically: each location is put at random within 5km of
+one of a few postcode anchors. The synthetic draws are vectorised but take
+the same random numbers, in the same order, as the old per-location loop in
+patients_to_clinic.py, so the coordinates are unchanged.
+
+The result is written once under .cache/geocoding, keyed by the locations and
+the geocoder, and read back by every later run.
+"""
+import hashlib
+import os
+import sys
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.tables import REPO_ROOT
+
+GEOCODE_CACHE_DIR = os.getenv("GEOCODE_CACHE_DIR", os.path.join(REPO_ROOT, ".cache", "geocoding"))
+# Bump when the geocoding changes so cached coordinates are rebuilt
+GEOCODE_VERSION = 1
+
+# Postcodes with approximate coords
+POSTCODE_COORDS = {
+    "AB0": (57.15, -2.10),   # Aberdeen area
+    "AL1": (51.75, -0.33),   # St Albans
+    "B1":  (52.48, -1.90),   # Birmingham
+}
+SYNTHETIC_SEED = 42
+MAX_OFFSET_KM = 5
+# 1 degree latitude ≈ 111 km
+KM_PER_DEGREE = 111
+
+# Takes locations, returns a frame of lat and long aligned with them (NaN where unknown)
+Geocoder = Callable[[pd.Series], pd.DataFrame]
+
+
+def normalise_postcode(postcodes: pd.Series) -> pd.Series:
+    return postcodes.astype(str).str.upper().str.replace(r"\s+", "", regex=True)
+
+
+class PostcodeTable:
+    """Geocoder over a local postcode -> lat/long file, for locations that are postcodes."""
+
+    def __init__(self, path: str, postcode_col: str = "postcode", lat_col: str = "lat", lon_col: str = "long"):
+        self.path = path
+        table = pd.read_csv(path, usecols=[postcode_col, lat_col, lon_col])
+        table = table.assign(postcode=normalise_postcode(table[postcode_col])).drop_duplicates("postcode")
+        self.coords = table.set_index("postcode")[[lat_col, lon_col]].set_axis(["lat", "long"], axis=1)
+
+    def __call__(self, locations: pd.Series) -> pd.DataFrame:
+        return self.coords.reindex(normalise_postcode(locations).to_numpy()).reset_index(drop=True)
+
+    def __repr__(self) -> str:
+        return f"PostcodeTable({self.path!r})"
+
+
+def synthetic_coords(
+    locations: pd.Series,
+    postcode_coords: dict[str, tuple[float, float]] = POSTCODE_COORDS,
+    seed: int = SYNTHETIC_SEED,
+    max_offset_km: float = MAX_OFFSET_KM,
+) -> pd.DataFrame:
+    """Random coordinates within max_offset_km of a randomly chosen postcode anchor per location."""
+    rng = np.random.RandomState(seed)
+    postcode_keys = list(postcode_coords.keys())
+    assigned_postcodes = rng.choice(postcode_keys, size=len(locations))
+
+    anchors = np.array([postcode_coords[key] for key in postcode_keys])[
+        pd.Index(postcode_keys).get_indexer(assigned_postcodes)
+    ].reshape(-1, 2)
+    max_offset = max_offset_km / KM_PER_DEGREE
+    # One (lat, lon) pair per location, drawn in the same order as the old loop
+    offsets = rng.uniform(-max_offset, max_offset, size=(len(locations), 2))
+
+    return pd.DataFrame({
+        "postcode_anchor": assigned_postcodes,
+        "lat": anchors[:, 0] + offsets[:, 0],
+        # Longitude scaling depends on latitude
+        "long": anchors[:, 1] + offsets[:, 1] / np.cos(np.radians(anchors[:, 0])),
+    })
+
+
+def _cache_path(locations: pd.Series, geocoder: Geocoder | None) -> str:
+    digest = hashlib.sha256(f"{GEOCODE_VERSION}|{geocoder!r}|{POSTCODE_COORDS}|{SYNTHETIC_SEED}".encode())
+    # The synthetic draws depend on the order of the locations, so it is part of the key
+    digest.update("\n".join(locations.astype(str)).encode())
+    return os.path.join(GEOCODE_CACHE_DIR, f"locations-{digest.hexdigest()[:16]}.parquet")
+
+
+def geocode_locations(locations, geocoder: Geocoder | None = None, use_cache: bool = True) -> pd.DataFrame:
+    """
+    One row per location with its lat and long (and postcode_anchor for the
+    synthetic geocoder), read from the cache when these locations have been
+    geocoded before.
+    """
+    locations = pd.Series(np.asarray(locations, dtype=object), name="location")
+    path = _cache_path(locations, geocoder)
+    if use_cache and os.path.exists(path):
+        return pd.read_parquet(path)
+
+    coords = synthetic_coords(locations) if geocoder is None else geocoder(locations)
+    result = pd.concat([locations, coords.reset_index(drop=True)], axis=1)
+
+    if use_cache:
+        os.makedirs(GEOCODE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        result.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    return result
+
+
+def geocode_clinics(clinics: pd.DataFrame, geocoder: Geocoder | None = None, location_col: str = "location") -> pd.DataFrame:
+    """clinics with lat and long columns added from their location."""
+    coords = geocode_locations(clinics[location_col].dropna().unique(), geocoder=geocoder)
+    return clinics.merge(coords, left_on=location_col, right_on="location", how="left")
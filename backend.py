@@ -1,8 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Literal, Tuple, Optional
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Literal, Tuple, Optional
 from datetime import datetime
+import asyncio
 import sys
 import os
 
@@ -12,9 +13,21 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from modelling.patient import Patient
 
 # Use mock routing for demonstration without requiring API keys
-from pharmacy_route.mock_route import mock_route_patient as route_patient
 USE_REAL_ROUTING = False
 
+if USE_REAL_ROUTING:
+    from pharmacy_route.pharmacy import route_patient_async
+else:
+    from pharmacy_route.mock_route import mock_route_patient as route_patient
+
+    async def route_patient_async(patient: Patient):
+        # Keyword routing is cheap and never blocks, so it can run on the event loop
+        return route_patient(patient)
+
+# Upper bounds for POST /triage/batch
+MAX_BATCH_SIZE = int(os.getenv("TRIAGE_MAX_BATCH_SIZE", "20000"))
+MAX_CONCURRENT_ROUTES = int(os.getenv("TRIAGE_MAX_CONCURRENCY", "16"))
+
 app = FastAPI(title="Medical Triaging API", version="1.0.0")
 
 # Add CORS middleware to allow frontend requests
@@ -73,6 +86,19 @@ class TriageResult(BaseModel):
     message: str
     provider_matches: Optional[list[ProviderMatch]] = None
 
+class BatchTriageItem(BaseModel):
+    """Result for a single entry of a batch triage request"""
+    index: int = Field(description="Position of the patient in the submitted batch")
+    patient_id: Optional[str] = None
+    result: Optional[TriageResult] = None
+    error: Optional[str] = None
+
+class BatchTriageResult(BaseModel):
+    """Response model for batch triage, in the same order as the request"""
+    results: list[BatchTriageItem]
+    succeeded: int
+    failed: int
+
 def generate_provider_matches(patient_data: PatientRequest, recommended_provider: str, urgency_level: int = 0) -> list[ProviderMatch]:
     """Generate realistic provider matches based on patient preferences and provider availability"""
 
@@ -201,90 +227,145 @@ def generate_provider_matches(patient_data: PatientRequest, recommended_provider
 
     return []
 
+@app.on_event("startup")
+async def load_routing_lookups():
+    """Load lookup tables used by the router once, before serving requests"""
+    if USE_REAL_ROUTING:
+        from pharmacy_route.nearest_pharmacy import get_nearest_pharmacy_index
+        await asyncio.to_thread(get_nearest_pharmacy_index)
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Medical Triaging API is running", "status": "healthy"}
 
+def build_patient(patient_data: PatientRequest) -> Patient:
+    """Convert a frontend request into the internal Patient model"""
+    # Convert date string to datetime object
+    date_of_birth = datetime.strptime(patient_data.date_of_birth, "%Y-%m-%d")
+
+    return Patient(
+        family_id=patient_data.family_id,
+        id=patient_data.id,
+        issue=patient_data.issue,
+        contact_preferences=patient_data.contact_preferences,
+        date_of_birth=date_of_birth,
+        sex=patient_data.sex,
+        history=patient_data.history,
+        patient_is_on_cancer_pathway=patient_data.patient_is_on_cancer_pathway,
+        total_requests=patient_data.total_requests,
+        has_cardiovascular_disease=patient_data.has_cardiovascular_disease,
+        has_digestive_disease=patient_data.has_digestive_disease,
+        has_musculoskeletal_disease=patient_data.has_musculoskeletal_disease,
+        has_respiratory_disease=patient_data.has_respiratory_disease,
+    )
+
+def build_triage_result(patient_data: PatientRequest, patient: Patient, result) -> TriageResult:
+    """Turn the output of route_patient into the API response"""
+    # Parse the result - it returns a tuple like ("pharmacist", None) or ("GP", urgency_info)
+    if isinstance(result, tuple) and len(result) == 2:
+        recommended_provider, urgency_info = result
+    else:
+        # Handle case where only provider is returned
+        recommended_provider = result
+        urgency_info = None
+
+    # Convert urgency info to our model if it exists
+    urgency_data = None
+    if urgency_info:
+        urgency_data = UrgencyInfo(
+            urgency=urgency_info.urgency,
+            keywords=urgency_info.keywords,
+            relevant_patient_history=urgency_info.relevant_patient_history
+        )
+
+    # Generate appropriate message
+    if recommended_provider == "pharmacist":
+        message = f"Patient can be treated by a pharmacist for their condition: {patient_data.issue}"
+    elif recommended_provider == "nurse":
+        message = f"Patient should see a nurse for their condition: {patient_data.issue}"
+    else:  # GP
+        urgency_text = ""
+        if urgency_data:
+            if urgency_data.urgency == 0:
+                urgency_text = " (routine appointment within 30 days)"
+            elif urgency_data.urgency == 1:
+                urgency_text = " (appointment within 2 weeks)"
+            elif urgency_data.urgency == 2:
+                urgency_text = " (urgent appointment needed)"
+        message = f"Patient should see a GP for their condition: {patient_data.issue}{urgency_text}"
+
+    # Generate provider matches based on recommendations and patient preferences
+    urgency_level = urgency_data.urgency if urgency_data else 0
+    provider_matches = generate_provider_matches(patient_data, recommended_provider, urgency_level)
+
+    return TriageResult(
+        recommended_provider=recommended_provider,
+        urgency_info=urgency_data,
+        patient_age=patient.age,
+        message=message,
+        provider_matches=provider_matches
+    )
+
 @app.post("/triage", response_model=TriageResult)
 async def triage_patient(patient_data: PatientRequest):
     """
     Triage a patient and return recommendation for care provider
     """
     try:
-        # Convert date string to datetime object
-        date_of_birth = datetime.strptime(patient_data.date_of_birth, "%Y-%m-%d")
-
-        # Create Patient object
-        patient = Patient(
-            family_id=patient_data.family_id,
-            id=patient_data.id,
-            issue=patient_data.issue,
-            contact_preferences=patient_data.contact_preferences,
-            date_of_birth=date_of_birth,
-            sex=patient_data.sex,
-            history=patient_data.history,
-            patient_is_on_cancer_pathway=patient_data.patient_is_on_cancer_pathway,
-            total_requests=patient_data.total_requests,
-            has_cardiovascular_disease=patient_data.has_cardiovascular_disease,
-            has_digestive_disease=patient_data.has_digestive_disease,
-            has_musculoskeletal_disease=patient_data.has_musculoskeletal_disease,
-            has_respiratory_disease=patient_data.has_respiratory_disease,
-        )
+        patient = build_patient(patient_data)
 
-        # Route the patient using the existing function
-        result = route_patient(patient)
-
-        # Parse the result - it returns a tuple like ("pharmacist", None) or ("GP", urgency_info)
-        if isinstance(result, tuple) and len(result) == 2:
-            recommended_provider, urgency_info = result
-        else:
-            # Handle case where only provider is returned
-            recommended_provider = result
-            urgency_info = None
-
-        # Convert urgency info to our model if it exists
-        urgency_data = None
-        if urgency_info:
-            urgency_data = UrgencyInfo(
-                urgency=urgency_info.urgency,
-                keywords=urgency_info.keywords,
-                relevant_patient_history=urgency_info.relevant_patient_history
-            )
+        # Route the patient without blocking the event loop
+        result = await route_patient_async(patient)
 
-        # Generate appropriate message
-        if recommended_provider == "pharmacist":
-            message = f"Patient can be treated by a pharmacist for their condition: {patient_data.issue}"
-        elif recommended_provider == "nurse":
-            message = f"Patient should see a nurse for their condition: {patient_data.issue}"
-        else:  # GP
-            urgency_text = ""
-            if urgency_data:
-                if urgency_data.urgency == 0:
-                    urgency_text = " (routine appointment within 30 days)"
-                elif urgency_data.urgency == 1:
-                    urgency_text = " (appointment within 2 weeks)"
-                elif urgency_data.urgency == 2:
-                    urgency_text = " (urgent appointment needed)"
-            message = f"Patient should see a GP for their condition: {patient_data.issue}{urgency_text}"
-
-        # Generate provider matches based on recommendations and patient preferences
-        urgency_level = urgency_data.urgency if urgency_data else 0
-        provider_matches = generate_provider_matches(patient_data, recommended_provider, urgency_level)
-
-        return TriageResult(
-            recommended_provider=recommended_provider,
-            urgency_info=urgency_data,
-            patient_age=patient.age,
-            message=message,
-            provider_matches=provider_matches
-        )
+        return build_triage_result(patient_data, patient, result)
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing patient data: {str(e)}")
 
+async def triage_batch_item(index: int, raw_patient: dict[str, Any], semaphore: asyncio.Semaphore) -> BatchTriageItem:
+    """Validate, route and build the result for one entry of a batch, capturing any error"""
+    try:
+        patient_data = PatientRequest.model_validate(raw_patient)
+    except ValidationError as e:
+        return BatchTriageItem(index=index, error=f"Invalid patient data: {e.errors(include_url=False)}")
+
+    try:
+        patient = build_patient(patient_data)
+    except ValueError as e:
+        return BatchTriageItem(index=index, patient_id=patient_data.id, error=f"Invalid date format: {str(e)}")
+
+    try:
+        # Cap how many patients are being routed (and so how many LLM calls are in flight) at once
+        async with semaphore:
+            result = await route_patient_async(patient)
+        triage_result = build_triage_result(patient_data, patient, result)
+    except Exception as e:
+        return BatchTriageItem(index=index, patient_id=patient_data.id, error=f"Error processing patient data: {str(e)}")
+
+    return BatchTriageItem(index=index, patient_id=patient_data.id, result=triage_result)
+
+@app.post("/triage/batch", response_model=BatchTriageResult)
+async def triage_patients_batch(patients: list[dict[str, Any]]):
+    """
+    Triage a list of patients concurrently.
+
+    Results are returned in input order; an invalid or failing entry gets an
+    error on its own item rather than failing the whole batch.
+    """
+    if len(patients) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(patients)} patients (max {MAX_BATCH_SIZE})")
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_ROUTES)
+    results = await asyncio.gather(
+        *(triage_batch_item(index, raw_patient, semaphore) for index, raw_patient in enumerate(patients))
+    )
+
+    failed = sum(1 for item in results if item.error is not None)
+    return BatchTriageResult(results=results, succeeded=len(results) - failed, failed=failed)
+
 @app.get("/health")
 async def health_check():
     """Extended health check with system info"""
@@ -294,6 +375,24 @@ async def health_check():
         "service": "Medical Triaging API"
     }
 
+@app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    """Hit/miss counters for the LLM triage result cache in this worker"""
+    if not USE_REAL_ROUTING:
+        return {"enabled": False}
+
+    from agent.agent import get_cache
+    return {"enabled": True, **get_cache().stats()}
+
+@app.get("/rules/stats")
+async def rules_stats():
+    """Share of requests routed by the deterministic rules without an LLM call"""
+    if not USE_REAL_ROUTING:
+        return {"enabled": False}
+
+    from pharmacy_route.pharmacy import RULE_ENGINE
+    return {"enabled": True, **RULE_ENGINE.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
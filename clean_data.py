@@ -1,8 +1,11 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime
 import json
 
+from modelling.age import ages, get_reference_date
+from modelling.feature_store import comorbidity_features, request_counts
+from modelling.tables import load_path
+
 def create_enhanced_numerical_dataset_for_priority(
     # File paths for all datasets
     gp_request_path="data/GP Request.csv",
@@ -33,12 +36,12 @@ def create_enhanced_numerical_dataset_for_priority(
 
     # --- 1. Load All Datasets ---
     try:
-        gp_request = pd.read_csv(gp_request_path)
-        patients = pd.read_csv(patients_path)
-        comorbidities = pd.read_csv(comorbidities_path)
-        registrations = pd.read_csv(registrations_path)
-        clinics = pd.read_csv(clinics_path)
-        ons_survey = pd.read_csv(ons_survey_path)
+        gp_request = load_path(gp_request_path)
+        patients = load_path(patients_path)
+        comorbidities = load_path(comorbidities_path)
+        registrations = load_path(registrations_path)
+        clinics = load_path(clinics_path)
+        ons_survey = load_path(ons_survey_path)
         print("All datasets loaded successfully.")
     except FileNotFoundError as e:
         print(f"Error loading files: {e}. Please ensure all CSV files are in the correct directory.")
@@ -46,13 +49,8 @@ def create_enhanced_numerical_dataset_for_priority(
 
     # --- 2. Feature Engineering (Same as before) ---
     print("Engineering features...")
-    patients["date_of_birth"] = pd.to_datetime(patients["date_of_birth"])
-    today = datetime.now()
-    age = today.year - patients["date_of_birth"].dt.year
-    birthday_not_passed = (today.month < patients["date_of_birth"].dt.month) | \
-                          ((today.month == patients["date_of_birth"].dt.month) & \
-                           (today.day < patients["date_of_birth"].dt.day))
-    patients["age"] = age - birthday_not_passed.astype(int)
+    today = get_reference_date()
+    patients["age"] = ages(patients["date_of_birth"], today)
     patients_processed = patients[["person_id", "age", "sex"]].rename(columns={"person_id": "patient_id"})
 
     registrations = registrations[registrations["is_latest_registration"] == True]
@@ -60,12 +58,8 @@ def create_enhanced_numerical_dataset_for_priority(
     registrations["time_with_practice_days"] = (today - registrations["registration_start_date"]).dt.days
     registrations_processed = registrations[["patient_id", "time_with_practice_days", "High_Level_Health_Geography"]]
     
-    comorbidity_counts = comorbidities.groupby("patient_id").size().reset_index(name="comorbidity_count")
-    comorb_pivot = comorbidities.assign(value=1).pivot_table(
-        index="patient_id", columns="Condition_Category", values="value", fill_value=0
-    ).add_prefix("has_").reset_index()
-
-    request_counts = gp_request.groupby("patient_id").size().reset_index(name="total_requests")
+    comorbidity_table = comorbidity_features(comorbidities, category_col="Condition_Category")
+    request_count_table = request_counts(gp_request)
 
     ons_experience = ons_survey[ons_survey['Question_ID'] == 'GPP-013'].copy()
     score_mapping = {'Very good': 2, 'Fairly good': 1, 'Neither good nor poor': 0, 'Fairly poor': -1, 'Very poor': -2, 'Don’t know': 0}
@@ -91,9 +85,8 @@ def create_enhanced_numerical_dataset_for_priority(
     print("Merging all data sources...")
     df = gp_request.merge(patients_processed, on="patient_id", how="left")
     df = df.merge(registrations_processed, on="patient_id", how="left")
-    df = df.merge(comorbidity_counts, on="patient_id", how="left")
-    df = df.merge(comorb_pivot, on="patient_id", how="left")
-    df = df.merge(request_counts, on="patient_id", how="left")
+    df = df.merge(comorbidity_table, on="patient_id", how="left")
+    df = df.merge(request_count_table, on="patient_id", how="left")
     df = df.merge(ons_scores, left_on='High_Level_Health_Geography', right_on='Demographic_breakdown', how='left')
     df['gp_availability'] = gp_availability
     df['nurse_availability'] = nurse_availability
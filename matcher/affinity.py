@@ -0,0 +1,203 @@
+"""
+Batched, cached patient/caregiver affinity scoring.
+
+rank_professionals used to make one blocking LLM call per caregiver. The
+AffinityScorer scores one patient against every candidate caregiver in a
+single structured call ("affinity_batch" agent, one score per specialism),
+caches scores per (issue, comorbidities, specialism), and falls back to a
+local word-overlap score when the LLM fails or does not answer within the
+latency budget. A call that overruns the budget keeps running in the
+background and fills the cache for next time.
+"""
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Annotated
+
+from pydantic import BaseModel, Field
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agent.agent import register_agent, run_agent_sync
+from agent.cache import normalise_text
+
+DEFAULT_LATENCY_BUDGET_SECONDS = float(os.getenv("AFFINITY_LATENCY_BUDGET_SECONDS", "5"))
+DEFAULT_MAX_CACHE_ENTRIES = int(os.getenv("AFFINITY_CACHE_ENTRIES", "65536"))
+AFFINITY_LLM_ENABLED = os.getenv("AFFINITY_LLM_ENABLED", "1") != "0"
+
+_WORD = re.compile(r"[a-z]+")
+# Stems are word prefixes, so e.g. "cardiovascular" and "cardiology" meet at "cardio"
+STEM_LENGTH = 6
+STOPWORDS = {"and", "the", "with", "for", "of", "in", "on", "a", "an", "to", "my", "i", "is", "have", "has", "disease", "general"}
+
+
+class BatchPatientContext(BaseModel):
+    patient_issue: str | None = Field(
+        description="Optional, the issue the patient currently has and would like to book an appointment for right now.",
+    )
+    patient_history: list[str] | None = Field(
+        description="A summary of the patient's history.",
+    )
+    caregiver_specialties: list[str] = Field(
+        description="The specialty of each candidate caregiver, in order.",
+    )
+
+
+@register_agent("affinity_batch")
+def affinity_batch_agent_config() -> dict:
+    return dict(
+        model="claude-3-haiku-20240307",
+        instructions=(
+            "You are a medical assistant. For each caregiver specialty, in the order given, give a score from 1-5 of how well "
+            "the patient and caregiver are matched based on the patient's history, current issue, and the caregiver's specialty. "
+            "1 means average. Return exactly one score per specialty."
+        ),
+        output_type=list[Annotated[int, Field(ge=1, le=5)]],
+    )
+
+
+def _stems(text: str) -> set[str]:
+    return {word[:STEM_LENGTH] for word in _WORD.findall(text.lower()) if word not in STOPWORDS}
+
+
+def local_affinity_score(patient_issue: str | None, patient_history: list[str] | None, caregiver_specialty: str | None) -> int:
+    """Overlap of patient and specialty word stems, mapped onto the agent's 1-5 scale."""
+    patient_stems = _stems(" ".join([patient_issue or "", *(h.replace("_", " ") for h in patient_history or [])]))
+    specialty_stems = _stems(caregiver_specialty or "")
+    if not patient_stems or not specialty_stems:
+        return 1
+
+    overlap = len(patient_stems & specialty_stems) / min(len(patient_stems), len(specialty_stems))
+    return 1 + round(4 * overlap)
+
+
+class AffinityScorer:
+    def __init__(
+        self,
+        latency_budget_seconds: float = DEFAULT_LATENCY_BUDGET_SECONDS,
+        use_llm: bool = AFFINITY_LLM_ENABLED,
+        max_cache_entries: int = DEFAULT_MAX_CACHE_ENTRIES,
+    ):
+        self.latency_budget_seconds = latency_budget_seconds
+        self.use_llm = use_llm
+        self.max_cache_entries = max_cache_entries
+
+        self._cache: OrderedDict[tuple, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="affinity")
+
+        self.cache_hits = 0
+        self.llm_calls = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _patient_key(patient_issue: str | None, patient_history: list[str] | None) -> tuple:
+        return normalise_text(patient_issue or ""), tuple(sorted(patient_history or []))
+
+    def _get(self, key: tuple) -> int | None:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _set(self, key: tuple, score: int) -> None:
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+
+    def scores(self, patient_issue: str | None, patient_history: list[str] | None, caregiver_specialties: list[str | None]) -> list[int]:
+        """Returns one 1-5 score per caregiver specialty, with at most one LLM call for the uncached ones."""
+        patient_key = self._patient_key(patient_issue, patient_history)
+        results: dict[str, int] = {}
+        missing: list[str] = []
+
+        for specialty in dict.fromkeys(s or "" for s in caregiver_specialties):
+            if not patient_issue and not patient_history and not specialty:
+                results[specialty] = 1
+            elif (score := self._get((*patient_key, normalise_text(specialty)))) is not None:
+                results[specialty] = score
+                self.cache_hits += 1
+            else:
+                missing.append(specialty)
+
+        if missing:
+            results.update(self._score_missing(patient_key, patient_issue, patient_history, missing))
+
+        return [results[s or ""] for s in caregiver_specialties]
+
+    def score(self, patient_issue: str | None, patient_history: list[str] | None, caregiver_specialty: str | None) -> int:
+        return self.scores(patient_issue, patient_history, [caregiver_specialty])[0]
+
+    def _score_missing(self, patient_key: tuple, patient_issue: str | None, patient_history: list[str] | None, specialties: list[str]) -> dict[str, int]:
+        fallback = {s: local_affinity_score(patient_issue, patient_history, s) for s in specialties}
+        if not self.use_llm:
+            self.fallbacks += len(specialties)
+            return fallback
+
+        prompt = BatchPatientContext(patient_issue=patient_issue, patient_history=patient_history, caregiver_specialties=specialties)
+
+        def store(future) -> None:
+            # Runs whenever the call finishes, also after the caller has moved on with the fallback
+            if future.cancelled() or future.exception() is not None:
+                return
+            output = future.result()
+            if len(output) == len(specialties):
+                for specialty, score in zip(specialties, output):
+                    self._set((*patient_key, normalise_text(specialty)), score)
+
+        self.llm_calls += 1
+        future = self._executor.submit(run_agent_sync, "affinity_batch", prompt)
+        future.add_done_callback(store)
+
+        try:
+            output = future.result(timeout=self.latency_budget_seconds)
+        except FutureTimeoutError:
+            print(f"Affinity LLM call exceeded {self.latency_budget_seconds}s, using local scores")
+            output = None
+        except Exception as e:
+            print(f"Affinity LLM call failed ({e}), using local scores")
+            output = None
+
+        if output is None or len(output) != len(specialties):
+            self.fallbacks += len(specialties)
+            return fallback
+
+        return dict(zip(specialties, output))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._cache)
+        return {
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "fallbacks": self.fallbacks,
+            "cache_entries": entries,
+        }
+
+
+_scorer: AffinityScorer | None = None
+_scorer_lock = threading.Lock()
+
+
+def get_affinity_scorer() -> AffinityScorer:
+    global _scorer
+
+    if _scorer is None:
+        with _scorer_lock:
+            if _scorer is None:
+                _scorer = AffinityScorer()
+
+    return _scorer
+
+
+def set_affinity_scorer(scorer: AffinityScorer | None) -> None:
+    """Replaces the shared scorer, e.g. with AffinityScorer(use_llm=False) offline."""
+    global _scorer
+
+    with _scorer_lock:
+        _scorer = scorer
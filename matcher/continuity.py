@@ -0,0 +1,194 @@
+"""
+Continuity-of-care index.
+
+Holds, per patient, how often and when they last saw each caregiver, and per
+family the caregivers any member has seen, so continuity and family scores are
+dictionary lookups instead of scans over each caregiver's appointment history.
+Built once from GP Appointment.csv (read in chunks; an appointment's caregiver
+is its clinic's care_professional_id in GP Clinics.csv) and updated as match
+books appointments. In-memory caregivers' completed_appts are merged in the
+first time a caregiver is scored (include_caregiver).
+
+Families from Patient.csv are households (postcode + first address line),
+keyed by person_id in family_of, so a Patient is looked up by its id. A
+Patient.family_id seen on a booking for a patient with a known household is
+remembered as another name for that household (family_alias), so other
+members carrying the same family_id find it too.
+"""
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.appointments import APPOINTMENTS_PATH, CLINICS_PATH, caregiver_of_clinic, completed, read_appointments
+
+PATIENTS_PATH = "data/Patient.csv"
+
+
+@dataclass
+class Visits:
+    count: int = 0
+    last_visit: datetime | None = None
+
+
+def household_id(postcode: str, address_line_1: str) -> str:
+    """Family id shared by patients at the same address."""
+    return f"{postcode.upper().replace(' ', '')}|{address_line_1.strip().lower()}"
+
+
+class ContinuityIndex:
+    def __init__(self):
+        self.visits: dict[str, dict[str, Visits]] = {}
+        self.family_caregivers: dict[str, set[str]] = {}
+        self.family_of: dict[str, str] = {}
+        # Patient.family_id -> household id, for family ids that name a known household
+        self.family_alias: dict[str, str] = {}
+        # Caregiver id -> how many of its completed_appts have been merged in
+        self._merged_appts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Locks cannot be copied or pickled; each copy gets its own
+        return {k: v for k, v in self.__dict__.items() if k != "_lock"}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _add(self, patient_id: str, caregiver_id: str, count: int, last_visit: datetime | None, family_id: str | None) -> None:
+        visits = self.visits.setdefault(patient_id, {}).setdefault(caregiver_id, Visits())
+        visits.count += count
+        if last_visit is not None and (visits.last_visit is None or last_visit > visits.last_visit):
+            visits.last_visit = last_visit
+
+        household = self.family_of.get(patient_id)
+        if household is not None and family_id and family_id != household:
+            self.family_alias.setdefault(family_id, household)
+
+        family_key = self.family_key(patient_id, family_id)
+        if family_key is not None:
+            self.family_of.setdefault(patient_id, family_key)
+            self.family_caregivers.setdefault(family_key, set()).add(caregiver_id)
+
+    def family_key(self, patient_id: str | None, family_id: str | None) -> str | None:
+        """The family a patient's visits are filed under: their household if known, else their family_id (or its alias)."""
+        if patient_id is not None and patient_id in self.family_of:
+            return self.family_of[patient_id]
+        if family_id:
+            return self.family_alias.get(family_id, family_id)
+        return None
+
+    def record_visit(self, patient_id: str, caregiver_id: str, when: datetime | None = None, family_id: str | None = None) -> None:
+        """Adds one appointment, e.g. one just booked by match."""
+        with self._lock:
+            self._add(patient_id, caregiver_id, 1, when, family_id)
+
+    def visit_count(self, patient_id: str, caregiver_id: str) -> int:
+        visits = self.visits.get(patient_id, {}).get(caregiver_id)
+        return visits.count if visits else 0
+
+    def last_visit(self, patient_id: str, caregiver_id: str) -> datetime | None:
+        visits = self.visits.get(patient_id, {}).get(caregiver_id)
+        return visits.last_visit if visits else None
+
+    def caregivers_seen(self, patient_id: str) -> dict[str, Visits]:
+        return self.visits.get(patient_id, {})
+
+    def family_has_seen(self, family_id: str | None, caregiver_id: str, patient_id: str | None = None) -> bool:
+        return caregiver_id in self.family_caregivers.get(self.family_key(patient_id, family_id), ())
+
+    def include_caregiver(self, caregiver) -> None:
+        """Merges a Caregiver's completed_appts not yet in the index (all of them, the first time it is seen)."""
+        merged = self._merged_appts.get(caregiver.id, 0)
+        if merged >= len(caregiver.completed_appts):
+            return
+        with self._lock:
+            merged = self._merged_appts.get(caregiver.id, 0)
+            for appt in caregiver.completed_appts[merged:]:
+                self._add(appt.patient_id, caregiver.id, 1, None, None)
+            self._merged_appts[caregiver.id] = len(caregiver.completed_appts)
+
+    @classmethod
+    def from_caregivers(cls, caregivers: Iterable) -> "ContinuityIndex":
+        """Builds an index from in-memory Caregiver objects (their completed_appts and families)."""
+        index = cls()
+        for caregiver in caregivers:
+            index.include_caregiver(caregiver)
+            for family_id in caregiver.families:
+                index.family_caregivers.setdefault(family_id, set()).add(caregiver.id)
+        return index
+
+    @classmethod
+    def from_csv(
+        cls,
+        appointments_path: str = APPOINTMENTS_PATH,
+        clinics_path: str = CLINICS_PATH,
+        patients_path: str | None = PATIENTS_PATH,
+        chunksize: int = 100_000,
+    ) -> "ContinuityIndex":
+        index = cls()
+
+        caregiver_of = caregiver_of_clinic(clinics_path)
+
+        if patients_path and os.path.exists(patients_path):
+            patients = pd.read_csv(patients_path, usecols=["person_id", "postcode", "address_line_1"], dtype=str).dropna()
+            index.family_of = dict(zip(
+                patients["person_id"],
+                (household_id(p, a) for p, a in zip(patients["postcode"], patients["address_line_1"])),
+            ))
+
+        for chunk in read_appointments(["clinic_id", "start_date_time", "booking_status"], appointments_path, chunksize):
+            chunk = completed(chunk)
+            chunk = chunk.assign(caregiver_id=chunk["clinic_id"].map(caregiver_of)).dropna(subset=["caregiver_id"])
+
+            grouped = chunk.groupby(["patient_id", "caregiver_id"])["start_date_time"].agg(["size", "max"])
+            for (patient_id, caregiver_id), count, last_visit in zip(grouped.index, grouped["size"], grouped["max"]):
+                index._add(patient_id, caregiver_id, int(count), None if pd.isna(last_visit) else last_visit.to_pydatetime(), None)
+
+        return index
+
+
+_index: ContinuityIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_continuity_index() -> ContinuityIndex:
+    """
+    Returns the shared index. It starts empty; call set_continuity_index with
+    ContinuityIndex.from_csv() (or from_caregivers) to load history.
+    """
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ContinuityIndex()
+
+    return _index
+
+
+def set_continuity_index(index: ContinuityIndex | None) -> None:
+    global _index
+
+    with _index_lock:
+        _index = index
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m matcher.continuity
+    start = time.perf_counter()
+    index = ContinuityIndex.from_csv()
+    print(f"Built continuity index in {time.perf_counter() - start:.1f}s: {len(index.visits)} patients, {len(index.family_caregivers)} families")
+
+    patient_id, seen = next(iter(index.visits.items()))
+    caregiver_id = next(iter(seen))
+    start = time.perf_counter()
+    for _ in range(100_000):
+        index.visit_count(patient_id, caregiver_id)
+    print(f"visit_count: {(time.perf_counter() - start) / 100_000 * 1e6:.2f}us per lookup")
@@ -0,0 +1,148 @@
+"""
+Weekly demand per practice x professional type x priority.
+
+rolling_average.compute_weekly_demand builds one global weekly series with
+isocalendar() per row. weekly_demand builds every series in one pass: each
+referral date becomes an integer week number (days since the epoch, shifted
+so weeks start on Monday like ISO weeks), every series gets an integer code,
+and one bincount over series x week fills a dense count matrix. Rolling
+averages for all series then come from a single cumulative sum along the
+weeks. Weeks with no referrals count as zero demand, from a series' first
+referral up to the last week in the data.
+
+The result is a tidy table, one row per series and week. forecast_next_week
+takes each series' latest rolling average as its forecast for the week after.
+Run `python -m matcher.demand_forecast` from the repository root for the
+series built from datasets/gp_request.csv and a benchmark on synthetic data.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.tables import load_path, load_table
+
+SERIES_KEYS = ("practice", "professional_type", "priority")
+DEFAULT_WINDOW = 4
+UNKNOWN = "Unknown"
+# 1970-01-01 was a Thursday; three days on, week numbers turn over on Mondays
+EPOCH_TO_MONDAY_DAYS = 3
+
+
+def week_number(dates: pd.Series) -> np.ndarray:
+    """Monday-based week number since the epoch per date (dates must not be missing)."""
+    days = dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+    return (days + EPOCH_TO_MONDAY_DAYS) // 7
+
+
+def week_start(weeks: np.ndarray) -> np.ndarray:
+    """The Monday each week number starts on."""
+    return (np.asarray(weeks, dtype=np.int64) * 7 - EPOCH_TO_MONDAY_DAYS).astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def professional_type(appointment_types: pd.Series) -> np.ndarray:
+    """GP or Nurse from requested_appointment_type, as the professional-type model labels it."""
+    appointment_types = appointment_types.astype(str)
+    return np.select(
+        [appointment_types.str.contains("GP", regex=False), appointment_types.str.contains("Nurse", regex=False)],
+        ["GP", "Nurse"],
+        default=UNKNOWN,
+    )
+
+
+def attach_series_keys(requests: pd.DataFrame, registrations: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Adds professional_type and, from the patients' latest GP registration,
+    practice to the requests. Patients without a registration get "Unknown".
+    """
+    requests = requests.assign(professional_type=professional_type(requests["requested_appointment_type"]))
+    if "practice" in requests.columns:
+        return requests
+
+    if registrations is None:
+        registrations = load_table("gp_registration", columns=["patient_id", "general_medical_practice", "is_latest_registration"])
+    latest = registrations[registrations["is_latest_registration"] == True]
+    practice_of = latest.drop_duplicates("patient_id").set_index("patient_id")["general_medical_practice"].astype(object)
+    return requests.assign(practice=requests["patient_id"].astype(str).map(practice_of).fillna(UNKNOWN))
+
+
+def weekly_demand(
+    requests: pd.DataFrame,
+    keys: tuple[str, ...] = SERIES_KEYS,
+    date_col: str = "date_referral_received",
+    window: int = DEFAULT_WINDOW,
+) -> pd.DataFrame:
+    """
+    One row per series (keys) and week: week_start, referral_count,
+    rolling_avg_demand (mean of the last `window` weeks, fewer at the start of
+    a series) and predicted_next_week_demand (that average, as the forecast
+    for the following week).
+    """
+    keys = list(keys)
+    dates = pd.to_datetime(requests[date_col], errors="coerce", utc=True).dt.tz_localize(None)
+    valid = dates.notna().to_numpy()
+    series = requests.loc[valid, keys].astype(object).fillna(UNKNOWN)
+    weeks = week_number(dates[valid])
+
+    columns = keys + ["week_start", "referral_count", "rolling_avg_demand", "predicted_next_week_demand"]
+    if not len(series):
+        return pd.DataFrame(columns=columns)
+
+    codes = series.groupby(keys, sort=True).ngroup().to_numpy()
+    labels = series.assign(_code=codes).drop_duplicates("_code").set_index("_code").sort_index()
+    n_series = len(labels)
+    first_week = weeks.min()
+    n_weeks = int(weeks.max() - first_week + 1)
+
+    counts = np.bincount(codes * n_weeks + (weeks - first_week), minlength=n_series * n_weeks).reshape(n_series, n_weeks)
+
+    # Rolling sums from one cumulative sum per series; windows start no earlier than the series' first referral
+    cumulative = np.concatenate([np.zeros((n_series, 1), dtype=np.int64), np.cumsum(counts, axis=1)], axis=1)
+    series_start = (counts > 0).argmax(axis=1)
+    week = np.arange(n_weeks)
+    window_start = np.maximum(week[None, :] + 1 - window, series_start[:, None])
+    window_sum = cumulative[:, 1:] - np.take_along_axis(cumulative, window_start, axis=1)
+    rolling = window_sum / (week[None, :] + 1 - window_start)
+
+    row, col = np.nonzero(week[None, :] >= series_start[:, None])
+    table = labels.iloc[row].reset_index(drop=True)
+    table["week_start"] = week_start(first_week + col)
+    table["referral_count"] = counts[row, col]
+    table["rolling_avg_demand"] = rolling[row, col]
+    table["predicted_next_week_demand"] = table["rolling_avg_demand"]
+    return table[columns]
+
+
+def forecast_next_week(demand: pd.DataFrame, keys: tuple[str, ...] = SERIES_KEYS) -> pd.DataFrame:
+    """Each series' forecast for the week after the data ends."""
+    latest = demand.groupby(list(keys), sort=False).tail(1)
+    return pd.DataFrame({
+        **{key: latest[key].to_numpy() for key in keys},
+        "week_start": latest["week_start"].to_numpy() + np.timedelta64(7, "D"),
+        "predicted_demand": latest["predicted_next_week_demand"].to_numpy(),
+    })
+
+
+if __name__ == "__main__":
+    requests = attach_series_keys(load_path("datasets/gp_request.csv"))
+    start = time.perf_counter()
+    demand = weekly_demand(requests)
+    elapsed = time.perf_counter() - start
+    n_series = len(demand.groupby(list(SERIES_KEYS), sort=False))
+    print(f"{len(requests)} requests -> {n_series} series, {len(demand)} rows in {elapsed * 1000:.0f}ms")
+    print(forecast_next_week(demand).sort_values("predicted_demand", ascending=False).head(10))
+
+    rng = np.random.default_rng(0)
+    n = 2_000_000
+    synthetic = pd.DataFrame({
+        "practice": rng.integers(0, 1_000, n).astype(str),
+        "professional_type": rng.choice(["GP", "Nurse"], n),
+        "priority": rng.choice(["Routine", "Urgent", "Urgent 2WW"], n),
+        "date_referral_received": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, n), unit="D"),
+    })
+    start = time.perf_counter()
+    demand = weekly_demand(synthetic)
+    print(f"Synthetic: {n} requests -> {len(demand)} rows over 6000 series in {time.perf_counter() - start:.2f}s")
@@ -1,12 +1,18 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Literal
 from datetime import datetime, timedelta
 from dataclasses import dataclass
-from pydantic_ai import Agent
+from .slots import SlotIndex
+from .affinity import get_affinity_scorer
+from .continuity import get_continuity_index
 
 class Timeslot(BaseModel):
     free: bool 
     time: datetime
+    contact_type: Literal["face-to-face", "virtual"] | None = Field(
+        default=None,
+        description="How the slot is offered. None falls back to the caregiver's contact type.",
+    )
 
 class Appt(BaseModel):
     patient_id: str
@@ -17,22 +23,31 @@ class Caregiver(BaseModel):
         default=None,
         description="Doctor's contact type. None indicates both are available.",
     )
-    timetable: list[Timeslot] # this must be ordered, maybe use a min heap
+    timetable: list[Timeslot] # any order, bookings go through slot_index
     patient_ids: set[str] = set()
     specialisms: str | None = None
     families: set[str] = set()
     completed_appts: list[Appt] = []
 
-    def attempt_match(self, latest_date: datetime) -> Timeslot | None:
-        for timeslot in self.timetable:
-            if timeslot.time > latest_date:
-                return None
-        
-            if timeslot.free:
-                timeslot.free = False
-                return timeslot
-            
-        return None
+    _slot_index: SlotIndex | None = PrivateAttr(default=None)
+
+    @property
+    def slot_index(self) -> SlotIndex:
+        if self._slot_index is None:
+            self._slot_index = SlotIndex(self.timetable, default_contact_type=self.contact_type)
+        return self._slot_index
+
+    def add_timeslot(self, timeslot: Timeslot) -> None:
+        self.timetable.append(timeslot)
+        if self._slot_index is not None:
+            self._slot_index.add(timeslot)
+
+    def attempt_match(self, latest_date: datetime, contact_type: Literal["face-to-face", "virtual"] | None = None) -> Timeslot | None:
+        # Books the earliest free slot at or before latest_date, optionally restricted to a contact type
+        return self.slot_index.book(latest_date, contact_type)
+
+    def release(self, timeslot: Timeslot) -> None:
+        self.slot_index.release(timeslot)
 
 @dataclass
 class PrimaryCareGroup:
@@ -92,7 +107,8 @@ class Urgency(BaseModel):
     max_wait_days: int = Field(
         description="Max number of days the patient may wait for an appointment.",
     )
-    required_caregiver: Literal["doctor", "nurse"] = Field(
+    required_caregiver: Literal["doctor", "nurse"] | None = Field(
+        default=None,
         description="The kind of professional required for the appointment.",
     )
     urgency_level: int = Field(
@@ -103,33 +119,54 @@ routine = Urgency(max_wait_days=30, urgency_level=0)
 urgent_2ww = Urgency(max_wait_days=14, urgency_level=1)
 urgent = Urgency(max_wait_days=2, urgency_level=2)
 
-def match(patient: Patient, gp_practice: GPPractice, required_caregiver: Literal["doctor", "nurse"], max_days_to_appt: int) -> Timeslot:
-    # max_days_to_appt denotes the number of days we have to schedule the appointment
-    # we also could factor in analytics about the GP practice
-
+def get_professional_and_remaining(patient: Patient, gp_practice: GPPractice, required_caregiver: Literal["doctor", "nurse"]) -> tuple[Caregiver, list[Caregiver]]:
+    if required_caregiver == "doctor":
+        main = gp_practice.doctors[patient.primary_care_group.doctor_id]
+        others = [v for k, v in gp_practice.doctors.items() if k != patient.primary_care_group.doctor_id]
+        return main, others
+    else:
+        main = gp_practice.nurses[patient.primary_care_group.nurse_id]
+        others = [v for k, v in gp_practice.nurses.items() if k != patient.primary_care_group.nurse_id]
+        return main, others
+
+def book_greedy(
+    patient: Patient,
+    gp_practice: GPPractice,
+    required_caregiver: Literal["doctor", "nurse"],
+    max_days_to_appt: int,
+    strict_contact_preferences: bool = False,
+) -> tuple[Caregiver, Timeslot] | None:
+    # Books the first free slot with the patient's own caregiver, else with the best ranked other one.
+    # Contact preference only ranks caregivers, unless strict_contact_preferences limits booking
+    # to slots offered the way the patient prefers (or either way)
     final_date = datetime.today() + timedelta(days=max_days_to_appt)
+    contact_type = patient.contact_preferences if strict_contact_preferences else None
 
     if not patient.id in gp_practice.patients:
         patient = sign_patient_up(patient, gp_practice)
 
-    def get_professional_and_remaining() -> tuple[Caregiver, list[Caregiver]]:
-        if required_caregiver == "doctor":
-            main = gp_practice.doctors[patient.primary_care_group.doctor_id]
-            others = [v for k, v in gp_practice.doctors.items() if k != patient.primary_care_group.doctor_id]
-            return main, others
-        else:
-            main = gp_practice.nurses[patient.primary_care_group.nurse_id]
-            others = [v for k, v in gp_practice.nurses.items() if k != patient.primary_care_group.nurse_id]
-            return main, others
-
-    main, others = get_professional_and_remaining()
-    if timeslot := main.attempt_match(final_date):
-        return timeslot
+    main, others = get_professional_and_remaining(patient, gp_practice, required_caregiver)
+    if timeslot := main.attempt_match(final_date, contact_type):
+        record_booking(patient, main, timeslot)
+        return main, timeslot
     
     others = rank_professionals(patient, others)
     for other in others:
-        if timeslot := other.attempt_match(final_date):
-            return timeslot
+        if timeslot := other.attempt_match(final_date, contact_type):
+            record_booking(patient, other, timeslot)
+            return other, timeslot
+
+    return None
+
+def record_booking(patient: Patient, caregiver: Caregiver, timeslot: Timeslot) -> None:
+    # Keeps the continuity index current so later rankings see this appointment
+    get_continuity_index().record_visit(patient.id, caregiver.id, timeslot.time, patient.family_id)
+
+def match(patient: Patient, gp_practice: GPPractice, required_caregiver: Literal["doctor", "nurse"], max_days_to_appt: int) -> Timeslot:
+    # max_days_to_appt denotes the number of days we have to schedule the appointment
+    # we also could factor in analytics about the GP practice
+    if booking := book_greedy(patient, gp_practice, required_caregiver, max_days_to_appt):
+        return booking[1]
         
     raise ValueError("Could not book you in.")
     
@@ -137,8 +174,8 @@ def sign_patient_up(patient: Patient, gp_practice: GPPractice) -> Patient:
     # order potential professionals by 
     gp_practice.patients.add(patient.id)
 
-    doctors = rank_professionals(patient=patient, issue=None, professionals=gp_practice.doctors)
-    nurses = rank_professionals(patient=patient, issue=None, professionals=gp_practice.nurses)
+    doctors = rank_professionals(patient=patient, professionals=list(gp_practice.doctors.values()))
+    nurses = rank_professionals(patient=patient, professionals=list(gp_practice.nurses.values()))
 
     patient.primary_care_group = PrimaryCareGroup(
         doctors[0].id,
@@ -147,32 +184,12 @@ def sign_patient_up(patient: Patient, gp_practice: GPPractice) -> Patient:
 
     return patient
 
-class PatientContext(BaseModel):
-    patient_issue: str | None = Field(
-        description="Optional, the issue the patient currently has and would like to book an appointment for right now.",
-    )
-    patient_history: list[str] | None = Field(
-        description="A summary of the patient's history.",
-    )
-    caregiver_specialty: str = Field(
-        description="A summary of the caregiver's specialty.",
-    )
-
-def assign_affinity_score(patient_issue: str | None, patient_history: str, caregiver_specialty: str) -> int:
+def assign_affinity_score(patient_issue: str | None, patient_history: list[str] | None, caregiver_specialty: str | None) -> int:
     if not patient_issue and not patient_history and not caregiver_specialty:
         return 1
     
-    agent = Agent(
-        model="claude-3-haiku-20240307",
-        instructions="You are a medical assistant. Give a score from 1-5 of how well the patient and caregiver are matched based on the patient's history, current issue, and caregiver's specialty. 1 means average.",
-        output_type=int,
-    )
-
-    result = agent.run_sync(
-        PatientContext(patient_issue=patient_issue, patient_history=patient_history, caregiver_specialty=caregiver_specialty)
-    )
-
-    return result.output
+    # Goes through the shared scorer so single lookups hit the same cache and fallback
+    return get_affinity_scorer().score(patient_issue, patient_history, caregiver_specialty)
 
 def assign_preference_score(patient: Patient, professional: Caregiver) -> int:
     if not patient.contact_preferences or not professional.contact_type:
@@ -182,14 +199,24 @@ def assign_preference_score(patient: Patient, professional: Caregiver) -> int:
     return 1 if match else 0
 
 def assign_family_score(patient: Patient, professional: Caregiver) -> int:
-    return 1 if patient.family_id in professional.families else 0
+    seen = patient.family_id in professional.families or get_continuity_index().family_has_seen(patient.family_id, professional.id, patient.id)
+    return 1 if seen else 0
 
 def assign_continuity_score(patient: Patient, professional: Caregiver) -> int:
-    return sum(1 for appt in professional.completed_appts if appt.patient_id == patient.id)
+    # Previous visits come from the continuity index (history from ContinuityIndex.from_csv, plus bookings),
+    # with the caregiver's own completed_appts merged in the first time it is scored
+    index = get_continuity_index()
+    index.include_caregiver(professional)
+    return index.visit_count(patient.id, professional.id)
     
+def assign_affinity_scores(patient: Patient, professionals: list[Caregiver]) -> dict[str, int]:
+    # One batched, cached call for every professional rather than one LLM call each
+    scores = get_affinity_scorer().scores(patient.issue, patient.comorbidities, [professional.specialisms for professional in professionals])
+    return {professional.id: score for professional, score in zip(professionals, scores)}
+
 def rank_professionals(patient: Patient, professionals: list[Caregiver]) -> list[Caregiver]:
     family_score = {professional.id: assign_family_score(patient, professional) for professional in professionals}
-    affinity_score = {professional.id: assign_affinity_score(patient.issue, patient.comorbidities, professional.specialisms) for professional in professionals}
+    affinity_score = assign_affinity_scores(patient, professionals)
     preference_score = {professional.id: assign_preference_score(patient, professional) for professional in professionals}
     prev_visits_score = {professional.id: assign_continuity_score(patient, professional) for professional in professionals}
 
@@ -215,10 +242,32 @@ caregiver_mappings = {
 }
 
 # This will be run with some interval every day
-def match_all(patients: list[Patient], gp_practice: GPPractice, urgencies: list[int], required_caregivers: list[int]):
+def match_all(
+    patients: list[Patient],
+    gp_practice: GPPractice,
+    urgencies: list[int],
+    required_caregivers: list[int],
+    mode: Literal["greedy", "optimal"] = "greedy",
+    strict_contact_preferences: bool = False,
+) -> list[tuple[Patient, Caregiver | None, Timeslot | None]]:
+    """
+    Books every patient, returning (patient, caregiver, timeslot) in input order,
+    with caregiver and timeslot None for patients who could not be booked.
+    "greedy" books in urgency order, first free slot first; "optimal" solves
+    the whole inbox as one assignment problem (see matcher/optimise.py).
+    Contact preference is a soft criterion unless strict_contact_preferences.
+    """
+    if mode == "optimal":
+        from .optimise import assign_optimal
+        return assign_optimal(patients, gp_practice, urgencies, required_caregivers, strict_contact_preferences=strict_contact_preferences).bookings
+
     # rank it by urgency and then match all in that order
-    reordered_patients = reorder_patients(patients, urgencies)
-    for patient, urgency, caregiver in zip(reordered_patients, urgencies, required_caregivers):
-        required_caregiver = caregiver_mappings[caregiver]
-        urgency = urgency_mappings[urgency]
-        match(patient, gp_practice, required_caregiver, urgency.max_wait_days)
\ No newline at end of file
+    order = sorted(range(len(patients)), key=lambda i: urgency_mappings[urgencies[i]].urgency_level, reverse=True)
+    bookings: list[tuple[Patient, Caregiver | None, Timeslot | None]] = [None] * len(patients)
+    for i in order:
+        required_caregiver = caregiver_mappings[required_caregivers[i]]
+        urgency = urgency_mappings[urgencies[i]]
+        booking = book_greedy(patients[i], gp_practice, required_caregiver, urgency.max_wait_days, strict_contact_preferences)
+        bookings[i] = (patients[i], *booking) if booking else (patients[i], None, None)
+
+    return bookings
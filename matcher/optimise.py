@@ -0,0 +1,322 @@
+"""
+Globally optimal booking for a day's inbox.
+
+match_all's greedy path books patients one at a time in urgency order, each
+taking the earliest free slot with the best caregiver still available, so an
+early patient can take the only slot a later patient's own doctor had left.
+assign_optimal instead solves the whole inbox as one assignment problem
+(scipy's linear_sum_assignment) over patients x candidate slots:
+
+- the score of a patient/caregiver pair mirrors rank_professionals (own
+  caregiver, family, continuity, contact preference, affinity), weighted so
+  the order of those criteria is kept;
+- a slot after the patient's Urgency.max_wait_days deadline is infeasible;
+  contact preference only counts through the score, unless
+  strict_contact_preferences also makes slots offered only the other way
+  infeasible (as book_greedy does with the same flag);
+- waiting costs a little, more for urgent patients, but never enough across
+  the whole inbox to outweigh one step of any score criterion, so it only
+  breaks ties towards earlier slots;
+- leaving a patient unbooked costs far more than any score, scaled by urgency,
+  so the solver books as many patients as possible, urgent ones first.
+
+Only the earliest n free slots per caregiver (and, when strict, per contact
+type) a patient can take are candidates (n = patients needing that kind of caregiver); a later
+slot can always be swapped for an unused earlier one the patient could also
+take, so this loses nothing.
+"""
+import copy
+import sys
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matcher.continuity import get_continuity_index, set_continuity_index
+from matcher.match import (
+    Caregiver,
+    GPPractice,
+    Patient,
+    Timeslot,
+    assign_affinity_scores,
+    assign_continuity_score,
+    assign_family_score,
+    assign_preference_score,
+    caregiver_mappings,
+    record_booking,
+    sign_patient_up,
+    urgency_mappings,
+)
+
+# Weights keep rank_professionals' order: own caregiver, then family,
+# then previous visits, then contact preference, then affinity (1-5)
+PRIMARY_WEIGHT = 32.0
+FAMILY_WEIGHT = 16.0
+CONTINUITY_WEIGHT = 4.0
+MAX_CONTINUITY_VISITS = 3
+PREFERENCE_WEIGHT = 2.0
+AFFINITY_WEIGHT = 0.25
+
+# Per urgency level + 1; larger than any achievable score
+UNBOOKED_PENALTY = 1000.0
+# Total waiting cost over the whole inbox if everyone waited the full horizon at the top
+# urgency. Kept below the smallest score step, so waiting only breaks ties towards earlier slots
+WAIT_PENALTY = 0.2
+assert WAIT_PENALTY < AFFINITY_WEIGHT
+# Contact types as codes for the strict slot filter; 0 is no preference / offered either way
+CONTACT_TYPE_CODES = {None: 0, "face-to-face": 1, "virtual": 2}
+INFEASIBLE = 1e9
+
+
+class ScoreTable:
+    """Memoised patient/caregiver scores, shared between runs so affinity is only asked for once per pair."""
+
+    def __init__(self, use_affinity: bool = True):
+        self.use_affinity = use_affinity
+        self._scores: dict[tuple[str, str], float] = {}
+
+    def score(self, patient: Patient, caregiver: Caregiver) -> float:
+        return self.scores(patient, [caregiver])[0]
+
+    def scores(self, patient: Patient, caregivers: list[Caregiver]) -> list[float]:
+        missing = [caregiver for caregiver in caregivers if (patient.id, caregiver.id) not in self._scores]
+        if missing:
+            # Affinity for all missing caregivers in one batched call
+            affinity = assign_affinity_scores(patient, missing) if self.use_affinity else {}
+            for caregiver in missing:
+                self._scores[(patient.id, caregiver.id)] = self._score(patient, caregiver, affinity.get(caregiver.id, 1))
+        return [self._scores[(patient.id, caregiver.id)] for caregiver in caregivers]
+
+    def _score(self, patient: Patient, caregiver: Caregiver, affinity: int) -> float:
+        group = patient.primary_care_group
+        is_primary = group is not None and caregiver.id in (group.doctor_id, group.nurse_id)
+
+        return (
+            PRIMARY_WEIGHT * is_primary
+            + FAMILY_WEIGHT * assign_family_score(patient, caregiver)
+            + CONTINUITY_WEIGHT * min(assign_continuity_score(patient, caregiver), MAX_CONTINUITY_VISITS)
+            + PREFERENCE_WEIGHT * assign_preference_score(patient, caregiver)
+            + AFFINITY_WEIGHT * (affinity - 1)
+        )
+
+
+@dataclass
+class AssignmentResult:
+    # (patient, caregiver, timeslot) in input order; caregiver and timeslot are None if unbooked
+    bookings: list[tuple[Patient, Caregiver | None, Timeslot | None]]
+    total_score: float
+    unbooked: int
+    seconds: float
+    unbooked_by_urgency: dict[int, int] = field(default_factory=dict)
+
+
+def score_bookings(bookings: list[tuple[Patient, Caregiver | None, Timeslot | None]], urgencies: list[int], scores: ScoreTable) -> tuple[float, int, dict[int, int]]:
+    total_score = 0.0
+    unbooked_by_urgency: dict[int, int] = {}
+    for (patient, caregiver, timeslot), urgency in zip(bookings, urgencies):
+        if timeslot is None:
+            unbooked_by_urgency[urgency] = unbooked_by_urgency.get(urgency, 0) + 1
+        else:
+            total_score += scores.score(patient, caregiver)
+    return total_score, sum(unbooked_by_urgency.values()), unbooked_by_urgency
+
+
+def _caregivers_for(gp_practice: GPPractice, required_caregiver: str) -> list[Caregiver]:
+    return list(gp_practice.doctors.values() if required_caregiver == "doctor" else gp_practice.nurses.values())
+
+
+def assign_optimal(
+    patients: list[Patient],
+    gp_practice: GPPractice,
+    urgencies: list[int],
+    required_caregivers: list[int],
+    scores: ScoreTable | None = None,
+    now: datetime | None = None,
+    strict_contact_preferences: bool = False,
+) -> AssignmentResult:
+    """Books the inbox so the number of patients seen (weighted by urgency), then the total score, is maximal."""
+    start = time.perf_counter()
+    scores = scores or ScoreTable()
+    now = now or datetime.today()
+
+    for i, patient in enumerate(patients):
+        if patient.id not in gp_practice.patients:
+            patients[i] = sign_patient_up(patient, gp_practice)
+
+    n = len(patients)
+    levels = np.array([urgency_mappings[u].urgency_level for u in urgencies], dtype=float)
+    deadlines = [now + timedelta(days=urgency_mappings[u].max_wait_days) for u in urgencies]
+    kinds = [caregiver_mappings[c] for c in required_caregivers]
+    # Without the strict filter every patient can take any slot, whatever its contact type
+    preferences = [patient.contact_preferences if strict_contact_preferences else None for patient in patients]
+
+    # Candidate slots, one block of columns per kind of caregiver
+    slot_caregivers: list[Caregiver] = []
+    slots: list[Timeslot] = []
+    blocks: dict[str, tuple[np.ndarray, int, int]] = {}
+    for kind in ("doctor", "nurse"):
+        rows = np.array([i for i in range(n) if kinds[i] == kind], dtype=int)
+        if len(rows) == 0:
+            continue
+        latest = max(deadlines[i] for i in rows)
+        first = len(slots)
+        for caregiver in _caregivers_for(gp_practice, kind):
+            # The earliest slots each contact preference in this block can take, each slot once
+            candidates = {}
+            for preference in dict.fromkeys(preferences[i] for i in rows):
+                for timeslot in caregiver.slot_index.earliest_free_slots(latest, limit=len(rows), contact_type=preference):
+                    candidates.setdefault(id(timeslot), timeslot)
+            for timeslot in sorted(candidates.values(), key=lambda timeslot: timeslot.time):
+                slot_caregivers.append(caregiver)
+                slots.append(timeslot)
+        blocks[kind] = (rows, first, len(slots))
+
+    # One dummy "unbooked" column per patient, so every row can always be assigned
+    cost = np.full((n, len(slots) + n), INFEASIBLE)
+    cost[:, len(slots):] = (UNBOOKED_PENALTY * (levels + 1))[:, None]
+
+    slot_days = np.array([(timeslot.time - now).total_seconds() / 86400 for timeslot in slots], dtype=float)
+    slot_times = np.array([timeslot.time for timeslot in slots], dtype="datetime64[us]")
+    deadline_times = np.array(deadlines, dtype="datetime64[us]")
+    # A slot without its own contact type is offered the way its caregiver works
+    slot_contact_types = np.array([
+        CONTACT_TYPE_CODES[timeslot.contact_type if timeslot.contact_type is not None else caregiver.contact_type]
+        for caregiver, timeslot in zip(slot_caregivers, slots)
+    ], dtype=int)
+    preference_codes = np.array([CONTACT_TYPE_CODES[preference] for preference in preferences], dtype=int)
+
+    # Feasible slots are within the patient's deadline, so their wait is at most the horizon;
+    # each patient's share of WAIT_PENALTY is scaled by urgency and the wait as a fraction of that
+    horizon_days = max(urgency.max_wait_days for urgency in urgency_mappings.values())
+    max_level = max(urgency.urgency_level for urgency in urgency_mappings.values())
+    wait_per_day = WAIT_PENALTY / max(n, 1) * (levels + 1) / (max_level + 1) / horizon_days
+
+    for kind, (rows, first, last) in blocks.items():
+        if first == last:
+            continue
+        caregivers = _caregivers_for(gp_practice, kind)
+        column_of = {caregiver.id: j for j, caregiver in enumerate(caregivers)}
+        pair_scores = np.array([scores.scores(patients[i], caregivers) for i in rows])
+
+        block = -pair_scores[:, [column_of[c.id] for c in slot_caregivers[first:last]]]
+        block += wait_per_day[rows][:, None] * np.clip(slot_days[first:last], 0, horizon_days)[None, :]
+        block[slot_times[first:last][None, :] > deadline_times[rows][:, None]] = INFEASIBLE
+
+        # Under the strict filter, a patient with a contact preference can only take slots offered that way or either way
+        block_preferences = preference_codes[rows][:, None]
+        block_contact_types = slot_contact_types[first:last][None, :]
+        block[(block_preferences > 0) & (block_contact_types > 0) & (block_preferences != block_contact_types)] = INFEASIBLE
+        cost[np.ix_(rows, np.arange(first, last))] = block
+
+    assigned_rows, assigned_cols = linear_sum_assignment(cost)
+
+    bookings: list[tuple[Patient, Caregiver | None, Timeslot | None]] = [(patient, None, None) for patient in patients]
+    for i, j in zip(assigned_rows, assigned_cols):
+        if j < len(slots) and cost[i, j] < INFEASIBLE:
+            caregiver, timeslot = slot_caregivers[j], slots[j]
+            caregiver.slot_index.book_slot(timeslot)
+            record_booking(patients[i], caregiver, timeslot)
+            bookings[i] = (patients[i], caregiver, timeslot)
+
+    total_score, unbooked, unbooked_by_urgency = score_bookings(bookings, urgencies, scores)
+    return AssignmentResult(bookings, total_score, unbooked, time.perf_counter() - start, unbooked_by_urgency)
+
+
+def compare_assignments(
+    patients: list[Patient],
+    gp_practice: GPPractice,
+    urgencies: list[int],
+    required_caregivers: list[int],
+    scores: ScoreTable | None = None,
+    strict_contact_preferences: bool = False,
+) -> dict:
+    """
+    Runs the greedy and optimal paths on copies of the same inbox and practice
+    and reports total score and unbooked patients for each. Nothing is booked
+    on the objects passed in.
+    """
+    from matcher.match import match_all
+
+    scores = scores or ScoreTable()
+    report = {}
+
+    # Each run books against its own copy of the continuity index; both are scored against the history before booking
+    index = get_continuity_index()
+    try:
+        set_continuity_index(copy.deepcopy(index))
+        greedy_patients, greedy_practice = copy.deepcopy((patients, gp_practice))
+        start = time.perf_counter()
+        bookings = match_all(greedy_patients, greedy_practice, urgencies, required_caregivers, mode="greedy", strict_contact_preferences=strict_contact_preferences)
+        seconds = time.perf_counter() - start
+
+        set_continuity_index(index)
+        total_score, unbooked, unbooked_by_urgency = score_bookings(bookings, urgencies, scores)
+        report["greedy"] = dict(total_score=total_score, unbooked=unbooked, unbooked_by_urgency=unbooked_by_urgency, seconds=seconds)
+
+        set_continuity_index(copy.deepcopy(index))
+        optimal_patients, optimal_practice = copy.deepcopy((patients, gp_practice))
+        result = assign_optimal(optimal_patients, optimal_practice, urgencies, required_caregivers, scores=scores, strict_contact_preferences=strict_contact_preferences)
+        report["optimal"] = dict(total_score=result.total_score, unbooked=result.unbooked, unbooked_by_urgency=result.unbooked_by_urgency, seconds=result.seconds)
+    finally:
+        set_continuity_index(index)
+
+    return report
+
+
+def _synthetic_inbox(n_patients: int, n_doctors: int, n_nurses: int, slots_per_day: int, days: int, seed: int = 0):
+    from matcher.match import PrimaryCareGroup
+
+    rng = np.random.default_rng(seed)
+    contact_types = ["face-to-face", "virtual", None]
+    start = datetime.today().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def caregiver(prefix: str, k: int) -> Caregiver:
+        return Caregiver(
+            id=f"{prefix}{k}",
+            contact_type=contact_types[rng.integers(0, 3)],
+            timetable=[
+                Timeslot(free=bool(rng.random() < 0.3), time=start + timedelta(days=day, minutes=15 * slot))
+                for day in range(days)
+                for slot in range(slots_per_day)
+            ],
+            families={str(f) for f in rng.integers(0, n_patients // 3, size=20)},
+        )
+
+    doctors = {c.id: c for c in (caregiver("d", k) for k in range(n_doctors))}
+    nurses = {c.id: c for c in (caregiver("n", k) for k in range(n_nurses))}
+    patients = [
+        Patient(
+            family_id=str(rng.integers(0, n_patients // 3)),
+            id=str(i),
+            request="",
+            date_of_birth=datetime(1980, 1, 1),
+            sex="female" if rng.random() < 0.5 else "male",
+            contact_preferences=contact_types[rng.integers(0, 3)],
+            primary_care_group=PrimaryCareGroup(f"d{rng.integers(0, n_doctors)}", f"n{rng.integers(0, n_nurses)}"),
+        )
+        for i in range(n_patients)
+    ]
+    practice = GPPractice(id="practice", doctors=doctors, nurses=nurses, patients={p.id for p in patients})
+    urgencies = [int(u) for u in rng.choice([0, 1, 2], size=n_patients, p=[0.7, 0.2, 0.1])]
+    required_caregivers = [int(c) for c in rng.choice([0, 1], size=n_patients, p=[0.7, 0.3])]
+    return patients, practice, urgencies, required_caregivers
+
+
+if __name__ == "__main__":
+    # Greedy vs optimal on synthetic inboxes, with local affinity scores so no LLM is called
+    # Run from the repository root: python -m matcher.optimise
+    from matcher.affinity import AffinityScorer, set_affinity_scorer
+
+    set_affinity_scorer(AffinityScorer(use_llm=False))
+
+    for n_patients in (50, 200, 500):
+        inbox = _synthetic_inbox(n_patients, n_doctors=8, n_nurses=4, slots_per_day=24, days=30)
+        report = compare_assignments(*inbox)
+
+        print(f"{n_patients} patients")
+        for mode, row in report.items():
+            print(f"  {mode:>7}: score {row['total_score']:8.1f}, unbooked {row['unbooked']:3d} {row['unbooked_by_urgency']}, {row['seconds']:.2f}s")
@@ -0,0 +1,142 @@
+"""
+Free-slot index for a caregiver's timetable.
+
+Free slots are kept in one min-heap per contact type ("face-to-face",
+"virtual", and None for slots offered either way), ordered by time. Finding
+and booking the earliest free slot before a deadline is O(log n). Slots booked
+or released directly are handled lazily: heap entries whose slot is no longer
+free are discarded when they reach the top.
+"""
+import heapq
+import itertools
+from datetime import datetime
+from typing import Iterable, Literal, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .match import Timeslot
+
+ContactType = Literal["face-to-face", "virtual"] | None
+
+CONTACT_TYPES: tuple[ContactType, ...] = ("face-to-face", "virtual", None)
+
+
+class SlotIndex:
+    def __init__(self, timeslots: Iterable["Timeslot"] = (), default_contact_type: ContactType = None):
+        # Contact type for slots that do not set their own, i.e. the caregiver's
+        self.default_contact_type = default_contact_type
+        self._heaps: dict[ContactType, list[tuple[datetime, int, "Timeslot"]]] = {c: [] for c in CONTACT_TYPES}
+        # Tie-breaker so heap entries never compare Timeslot objects
+        self._counter = itertools.count()
+
+        for timeslot in timeslots:
+            self.add(timeslot)
+
+    def _contact_type(self, timeslot: "Timeslot") -> ContactType:
+        return timeslot.contact_type if timeslot.contact_type is not None else self.default_contact_type
+
+    def add(self, timeslot: "Timeslot") -> None:
+        """Indexes a slot; booked slots are ignored until released."""
+        if timeslot.free:
+            heap = self._heaps[self._contact_type(timeslot)]
+            heapq.heappush(heap, (timeslot.time, next(self._counter), timeslot))
+
+    def _top(self, contact_type: ContactType) -> "Timeslot | None":
+        heap = self._heaps[contact_type]
+        # Drop entries for slots that were booked since they were pushed
+        while heap and not heap[0][2].free:
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def _candidate_types(self, contact_type: ContactType) -> tuple[ContactType, ...]:
+        # No preference can take any slot; a preference can take matching or either-way slots
+        return CONTACT_TYPES if contact_type is None else (contact_type, None)
+
+    def earliest_free(self, latest_date: datetime, contact_type: ContactType = None) -> "Timeslot | None":
+        """Returns, without booking, the earliest free slot at or before latest_date."""
+        best = None
+        for candidate_type in self._candidate_types(contact_type):
+            top = self._top(candidate_type)
+            if top is not None and top.time <= latest_date and (best is None or top.time < best.time):
+                best = top
+        return best
+
+    def earliest_free_slots(self, latest_date: datetime, limit: int, contact_type: ContactType = None) -> list["Timeslot"]:
+        """Returns, without booking, up to limit earliest free slots at or before latest_date."""
+        candidates = {}
+        for candidate_type in self._candidate_types(contact_type):
+            for slot_time, order, timeslot in self._heaps[candidate_type]:
+                # A released slot can have a stale entry next to its fresh one
+                if timeslot.free and slot_time <= latest_date:
+                    candidates.setdefault(id(timeslot), (slot_time, order, timeslot))
+        return [timeslot for _, _, timeslot in heapq.nsmallest(limit, candidates.values())]
+
+    def book(self, latest_date: datetime, contact_type: ContactType = None) -> "Timeslot | None":
+        """Books and returns the earliest free slot at or before latest_date, or None if there is none."""
+        timeslot = self.earliest_free(latest_date, contact_type)
+        if timeslot is not None:
+            # The heap entry is now stale and gets dropped the next time it is on top
+            timeslot.free = False
+        return timeslot
+
+    def book_slot(self, timeslot: "Timeslot") -> bool:
+        """Books a specific slot. Returns False if it was already taken."""
+        if not timeslot.free:
+            return False
+        timeslot.free = False
+        return True
+
+    def release(self, timeslot: "Timeslot") -> None:
+        """Frees a booked slot (e.g. a cancellation) and makes it bookable again."""
+        if timeslot.free:
+            return
+        timeslot.free = True
+        self.add(timeslot)
+
+    def free_count(self) -> int:
+        # A released slot can still have its stale entry next to the fresh one, so count slots, not entries
+        return len({id(timeslot) for heap in self._heaps.values() for _, _, timeslot in heap if timeslot.free})
+
+
+if __name__ == "__main__":
+    # Benchmark against the original linear scan over the timetable
+    # Run from the repository root: python -m matcher.slots
+    import time
+    from datetime import timedelta
+
+    from matcher.match import Timeslot
+
+    def scan_attempt_match(timetable: list[Timeslot], latest_date: datetime) -> Timeslot | None:
+        for timeslot in timetable:
+            if timeslot.time > latest_date:
+                return None
+            if timeslot.free:
+                timeslot.free = False
+                return timeslot
+        return None
+
+    def make_timetable(days: int) -> list[Timeslot]:
+        start = datetime(2025, 1, 6, 9)
+        return [
+            Timeslot(free=True, time=start + timedelta(days=day, minutes=10 * slot))
+            for day in range(days)
+            for slot in range(48)
+        ]
+
+    for days in (30, 90, 180):
+        timetable = make_timetable(days)
+        deadline = timetable[-1].time
+        bookings = len(timetable)
+
+        start = time.perf_counter()
+        for _ in range(bookings):
+            scan_attempt_match(timetable, deadline)
+        scan_time = time.perf_counter() - start
+
+        timetable = make_timetable(days)
+        start = time.perf_counter()
+        index = SlotIndex(timetable)
+        for _ in range(bookings):
+            index.book(deadline)
+        index_time = time.perf_counter() - start
+
+        print(f"{len(timetable):>6} slots, booking all: scan {scan_time:.3f}s, index {index_time:.3f}s ({scan_time / index_time:.0f}x)")
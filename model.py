@@ -7,6 +7,7 @@ import json
 import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
+from modelling.registry import write_schema
 
 def train_and_evaluate_priority_model(
     dataset_path="enhanced_numerical_dataset_for_priority.csv",
@@ -103,6 +104,9 @@ def train_and_evaluate_priority_model(
     # --- 6. Save the Trained Model ---
     print(f"\n💾 Saving trained model to {model_output_path}...")
     joblib.dump(model, model_output_path)
+    schema_path = model_output_path.replace("_model.joblib", "_feature_schema.json")
+    write_schema(schema_path, model, list(X.columns))
+    print(f"Saved feature schema to {schema_path}")
     print(f"✅ Model successfully saved.")
     
     print("\n🎉 Process complete!")
@@ -0,0 +1,186 @@
+"""
+Per-patient appointment behaviour features from GP Appointment.csv.
+
+The appointment extract (~500k rows, ~140MB) is streamed in chunks of only
+the needed columns (modelling/appointments.py). Each chunk is reduced to per-patient sums that are added
+to a running total, so memory grows with the number of patients, not rows.
+Per patient this gives:
+
+    appointment_count        appointments on record
+    cancellation_rate        share with booking_status Cancelled
+    dna_rate                 share recorded as did-not-attend (DNA) in booking_status or outcome
+    virtual_ratio            virtual / (virtual + face-to-face), NaN when neither is known
+    last_seen_caregiver_id   care_professional_id of the clinic of the latest attended appointment
+    last_seen_at             when that appointment started
+
+The table is materialised under .cache/features keyed by a hash of the source
+files. join_appointment_features adds it to engineer_features output for
+analysis; the training datasets and models do not use these columns yet, so
+nothing in the pipeline calls it.
+"""
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.appointments import APPOINTMENTS_PATH, CLINICS_PATH, caregiver_of_clinic, completed, read_appointments
+from modelling.feature_store import FEATURE_STORE_DIR
+from modelling.tables import file_checksum
+
+# Bump when the aggregation changes so materialised tables are rebuilt
+APPOINTMENT_FEATURES_VERSION = 1
+
+USE_COLUMNS = [
+    "patient_id", "clinic_id", "start_date_time", "booking_status", "outcome",
+    "Appointment_Name", "category", "clinic_type_name",
+]
+DNA_PATTERN = r"\bdna\b|did not attend|did not arrive|no[ -]show"
+VIRTUAL_PATTERN = r"virtual|phone|video|online|remote|e-consult"
+FACE_TO_FACE_PATTERN = r"face[ -]to[ -]face|f2f|in[ -]person"
+
+COUNT_COLUMNS = ["appointment_count", "cancelled", "dna", "virtual", "face_to_face"]
+APPOINTMENT_FEATURE_COLUMNS = [
+    "appointment_count",
+    "cancellation_rate",
+    "dna_rate",
+    "virtual_ratio",
+    "last_seen_caregiver_id",
+    "last_seen_at",
+]
+# Used for patients with no appointment history when joining
+MISSING_VALUES = {"appointment_count": 0, "cancellation_rate": 0.0, "dna_rate": 0.0}
+
+
+def _text(chunk: pd.DataFrame, columns: list[str]) -> pd.Series:
+    text = chunk[columns[0]].fillna("").astype(str)
+    for column in columns[1:]:
+        text = text + " " + chunk[column].fillna("").astype(str)
+    return text.str.lower()
+
+
+def _chunk_counts(chunk: pd.DataFrame) -> pd.DataFrame:
+    mode = _text(chunk, ["Appointment_Name", "category", "clinic_type_name"])
+    status = _text(chunk, ["booking_status", "outcome"])
+    flags = pd.DataFrame({
+        "patient_id": chunk["patient_id"],
+        "appointment_count": 1,
+        "cancelled": (chunk["booking_status"] == "Cancelled").astype(int),
+        "dna": status.str.contains(DNA_PATTERN, regex=True).astype(int),
+        # Face-to-face wins if both match, e.g. "Face to face (telephone triage)"
+        "face_to_face": mode.str.contains(FACE_TO_FACE_PATTERN, regex=True).astype(int),
+    })
+    flags["virtual"] = (mode.str.contains(VIRTUAL_PATTERN, regex=True) & (flags["face_to_face"] == 0)).astype(int)
+    return flags.groupby("patient_id")[COUNT_COLUMNS].sum()
+
+
+def _chunk_last_seen(chunk: pd.DataFrame) -> pd.DataFrame:
+    seen = completed(chunk)[["patient_id", "clinic_id", "start_date_time"]].dropna()
+    return seen.sort_values("start_date_time", kind="stable").groupby("patient_id").last()
+
+
+def aggregate_appointments(
+    appointments_path: str = APPOINTMENTS_PATH,
+    clinics_path: str = CLINICS_PATH,
+    chunksize: int = 100_000,
+) -> pd.DataFrame:
+    """Streams the appointments and returns one row of APPOINTMENT_FEATURE_COLUMNS per patient_id."""
+    totals: pd.DataFrame | None = None
+    last_seen: pd.DataFrame | None = None
+
+    for chunk in read_appointments(USE_COLUMNS, appointments_path, chunksize):
+        counts = _chunk_counts(chunk)
+        totals = counts if totals is None else totals.add(counts, fill_value=0)
+
+        latest = _chunk_last_seen(chunk)
+        if last_seen is None:
+            last_seen = latest
+        else:
+            # Keep the later of the running and the chunk's latest visit per patient
+            last_seen = (
+                pd.concat([last_seen, latest])
+                .sort_values("start_date_time", kind="stable")
+                .groupby(level=0).last()
+            )
+
+    if totals is None:
+        return pd.DataFrame(columns=APPOINTMENT_FEATURE_COLUMNS, index=pd.Index([], name="patient_id"))
+
+    totals = totals.astype(int)
+    features = pd.DataFrame(index=totals.index)
+    features["appointment_count"] = totals["appointment_count"]
+    features["cancellation_rate"] = totals["cancelled"] / totals["appointment_count"]
+    features["dna_rate"] = totals["dna"] / totals["appointment_count"]
+    known_mode = totals["virtual"] + totals["face_to_face"]
+    features["virtual_ratio"] = (totals["virtual"] / known_mode.replace(0, np.nan)).astype(float)
+
+    last_seen = last_seen.reindex(features.index)
+    features["last_seen_caregiver_id"] = last_seen["clinic_id"].map(caregiver_of_clinic(clinics_path))
+    features["last_seen_at"] = last_seen["start_date_time"]
+
+    features.index.name = "patient_id"
+    return features[APPOINTMENT_FEATURE_COLUMNS]
+
+
+def _path(appointments_path: str, clinics_path: str, root: str) -> str:
+    digest = hashlib.sha256(str(APPOINTMENT_FEATURES_VERSION).encode())
+    for path in (appointments_path, clinics_path):
+        digest.update(file_checksum(path).encode())
+    return os.path.join(root, f"appointment_features-{digest.hexdigest()[:16]}.parquet")
+
+
+def load_appointment_features(
+    appointments_path: str = APPOINTMENTS_PATH,
+    clinics_path: str = CLINICS_PATH,
+    root: str = FEATURE_STORE_DIR,
+) -> pd.DataFrame:
+    """The per-patient table, aggregated on first use and read from .cache/features after that."""
+    path = _path(appointments_path, clinics_path, root)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+
+    features = aggregate_appointments(appointments_path, clinics_path)
+    os.makedirs(root, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    features.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+    return features
+
+
+def join_appointment_features(
+    features: pd.DataFrame,
+    patient_ids: pd.Series,
+    appointment_features: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """
+    Adds the appointment columns to engineer_features output. patient_ids gives
+    each row's patient, aligned on the index (e.g. the patient_id column of the
+    frame passed to engineer_features).
+    """
+    if appointment_features is None:
+        appointment_features = load_appointment_features()
+
+    joined = appointment_features.reindex(patient_ids.loc[features.index].astype(str).values)
+    joined.index = features.index
+    return pd.concat([features, joined.fillna(MISSING_VALUES)], axis=1)
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m modelling.appointment_features
+    import resource
+    import tracemalloc
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    features = aggregate_appointments()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Aggregated {int(features['appointment_count'].sum())} appointments for {len(features)} patients in {seconds:.1f}s")
+    print(f"Peak traced memory {peak / 1e6:.0f}MB, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
+    print(f"Table size {features.memory_usage(deep=True).sum() / 1e6:.1f}MB")
+    print(features.describe(include="all").T)
@@ -0,0 +1,52 @@
+"""
+Streaming reader for GP Appointment.csv.
+
+The appointment extract (~500k rows, ~140MB) is read in chunks of only the
+needed columns, with ids kept as strings. completed() keeps the appointments
+the patient attended, with start_date_time parsed to naive UTC (only those
+rows are parsed, as parsing is most of the cost). Shared by the per-patient appointment features
+(modelling/appointment_features.py) and the continuity index
+(matcher/continuity.py), so both agree on which rows count and how they are
+typed.
+"""
+from typing import Iterator
+
+import pandas as pd
+
+APPOINTMENTS_PATH = "data/GP Appointment.csv"
+CLINICS_PATH = "data/GP Clinics.csv"
+
+# Appointments that count as the patient having seen the caregiver
+COMPLETED_STATUSES = ("Attended", "Checked In")
+
+
+def read_appointments(
+    columns: list[str],
+    appointments_path: str = APPOINTMENTS_PATH,
+    chunksize: int = 100_000,
+) -> Iterator[pd.DataFrame]:
+    """Yields chunks of the given columns, skipping rows without a patient_id."""
+    columns = list(dict.fromkeys(["patient_id", *columns]))
+    for chunk in pd.read_csv(
+        appointments_path,
+        usecols=columns,
+        dtype={"patient_id": str, "clinic_id": str},
+        chunksize=chunksize,
+    ):
+        yield chunk.dropna(subset=["patient_id"])
+
+
+def completed(chunk: pd.DataFrame) -> pd.DataFrame:
+    """The appointments in a chunk where the patient saw the caregiver, with start_date_time parsed if present."""
+    chunk = chunk[chunk["booking_status"].isin(COMPLETED_STATUSES)]
+    if "start_date_time" in chunk.columns:
+        chunk = chunk.assign(
+            start_date_time=pd.to_datetime(chunk["start_date_time"], errors="coerce", utc=True).dt.tz_localize(None)
+        )
+    return chunk
+
+
+def caregiver_of_clinic(clinics_path: str = CLINICS_PATH) -> pd.Series:
+    """care_professional_id per clinic_id, from GP Clinics.csv."""
+    clinics = pd.read_csv(clinics_path, usecols=["clinic_id", "care_professional_id"], dtype=str).dropna()
+    return clinics.drop_duplicates("clinic_id").set_index("clinic_id")["care_professional_id"]
@@ -0,0 +1,252 @@
+"""
+Per-patient feature store shared by training and inference.
+
+The per-patient aggregates (sex and date of birth, one-hot comorbidities,
+comorbidity_count, total_requests) are computed once from the request,
+patient and comorbidity extracts and materialised under .cache/features,
+keyed by a hash of those sources, so a rebuild only happens when the data
+changes. Both training datasets are built from the same merged frame, and
+inference looks patients up by patient_id.
+
+engineer_features, the urgency keyword lists and the model feature columns
+used to be copy-pasted between priority_prepare.py and
+professional_prepare.py and now live here.
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.age import ages, get_reference_date
+from modelling.patient import ALL_COMORBIDITIES
+from modelling.tables import REPO_ROOT, file_checksum, load_path
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", os.path.join(REPO_ROOT, ".cache", "features"))
+# Bump when the feature computation changes so materialised features are rebuilt
+FEATURE_STORE_VERSION = 1
+
+GP_REQUEST_PATH = "datasets/gp_request.csv"
+PATIENTS_PATH = "datasets/patients.csv"
+COMORBIDITIES_PATH = "datasets/comorbidities.csv"
+
+URGENCY_KEYWORDS = ['urgent', 'severe', 'worsening', 'immediate', 'asap', 'concerning']
+# The trained models differ here: the priority model also counted 'hypertension'
+PRIORITY_URGENCY_KEYWORDS = URGENCY_KEYWORDS + ['hypertension']
+PROFESSIONAL_URGENCY_KEYWORDS = URGENCY_KEYWORDS
+
+FEATURE_COLUMNS = [
+    "sex_female",
+    "age",
+    "has_cardiovascular_disease",
+    "has_digestive_disease",
+    "has_musculoskeletal_disease",
+    "has_respiratory_disease",
+    "comorbidity_count",
+    "patient_is_on_cancer_pathway",
+    "urgency_keyword_count",
+    "total_requests",
+]
+
+COMORBIDITY_COLUMNS = [f"has_{comorbidity}" for comorbidity in ALL_COMORBIDITIES]
+
+
+def normalise_column(column: str) -> str:
+    return column.strip().lower().replace(" ", "_")
+
+
+def comorbidity_features(comorbidities: pd.DataFrame, category_col: str = "Condition_Category") -> pd.DataFrame:
+    """comorbidity_count and one has_<category> column per category, one row per patient_id."""
+    counts = comorbidities.groupby("patient_id").size().rename("comorbidity_count")
+    pivot = (
+        comorbidities.assign(value=1)
+        .pivot_table(index="patient_id", columns=category_col, values="value", fill_value=0)
+        .add_prefix("has_")
+    )
+    pivot.columns = [str(c) for c in pivot.columns]
+    return pd.concat([counts, pivot], axis=1).reset_index()
+
+
+def request_counts(gp_request: pd.DataFrame) -> pd.DataFrame:
+    return gp_request.groupby("patient_id").size().reset_index(name="total_requests")
+
+
+def build_patient_features(gp_request: pd.DataFrame, patients: pd.DataFrame, comorbidities: pd.DataFrame) -> pd.DataFrame:
+    """One row per patient in the patient or request extracts, indexed by patient_id."""
+    patients = patients[["person_id", "date_of_birth", "sex"]].rename(columns={"person_id": "patient_id"})
+    comorbidities = comorbidities.rename(columns=normalise_column)
+
+    patient_ids = pd.Index(patients["patient_id"]).union(pd.Index(gp_request["patient_id"].dropna().unique()))
+    features = (
+        pd.DataFrame(index=patient_ids.rename("patient_id"))
+        .join(patients.drop_duplicates("patient_id").set_index("patient_id"))
+        .join(comorbidity_features(comorbidities, category_col="condition_category").set_index("patient_id"))
+        .join(request_counts(gp_request).set_index("patient_id"))
+    )
+    features = features.rename(columns=normalise_column)
+
+    for column in COMORBIDITY_COLUMNS:
+        if column not in features.columns:
+            features[column] = 0
+    count_columns = [c for c in features.columns if c.startswith("has_")] + ["comorbidity_count", "total_requests"]
+    features[count_columns] = features[count_columns].fillna(0).astype(int)
+    features["date_of_birth"] = pd.to_datetime(features["date_of_birth"], errors="coerce")
+
+    return features
+
+
+def urgency_pattern(keywords) -> str:
+    """Regex alternation counting keywords as plain, non-overlapping substrings, longest first at each position."""
+    return "|".join(re.escape(keyword.lower()) for keyword in sorted(keywords, key=len, reverse=True))
+
+
+def count_urgency_keywords(texts: pd.Series, keywords) -> pd.Series:
+    """
+    Urgency keyword count per text, missing text counting as empty. Substring
+    counts, as the trained models were built on, done in one C regex pass
+    rather than a Python loop per row.
+    """
+    return texts.fillna("").astype(str).str.lower().str.count(urgency_pattern(keywords)).astype("int64")
+
+
+def engineer_features(df: pd.DataFrame, urgency_keywords: list[str], target: str | None = None, reference_date=None) -> pd.DataFrame:
+    """Turns merged request + patient rows into the model feature columns (plus the target, if present)."""
+    df = df.copy()
+
+    df["age"] = ages(df["date_of_birth"], reference_date or get_reference_date())
+
+    # Request timing features
+    df['date_referral_received'] = pd.to_datetime(df['date_referral_received'], errors="coerce")
+    df['request_month'] = df['date_referral_received'].dt.month
+    df['request_day_of_week'] = df['date_referral_received'].dt.dayofweek
+
+    # Text features from notes
+    notes_series = df['new_referral_notes'].fillna('').astype(str)
+    df['note_length'] = notes_series.str.len()
+    df['urgency_keyword_count'] = count_urgency_keywords(notes_series, urgency_keywords)
+
+    df = df.rename(columns=normalise_column)
+
+    # Fill comorbidity columns
+    comorb_cols = [c for c in df.columns if c.startswith("has_")]
+    df[comorb_cols] = df[comorb_cols].fillna(0)
+    df[['comorbidity_count', 'total_requests']] = df[['comorbidity_count', 'total_requests']].fillna(0)
+    if 'patient_is_on_cancer_pathway' in df.columns:
+        df['patient_is_on_cancer_pathway'] = df['patient_is_on_cancer_pathway'].fillna(0).astype(int)
+
+    categorical_cols = ['sex']
+    df = pd.get_dummies(df, columns=[c for c in categorical_cols if c in df.columns])
+    # A batch of only male patients (e.g. an incremental update) has no sex_female dummy
+    if "sex_female" not in df.columns:
+        df["sex_female"] = False
+
+    if target is not None and target in df.columns:
+        return df[FEATURE_COLUMNS + [target]]
+
+    return df[FEATURE_COLUMNS]
+
+
+class FeatureStore:
+    def __init__(
+        self,
+        gp_request_path: str = GP_REQUEST_PATH,
+        patients_path: str = PATIENTS_PATH,
+        comorbidities_path: str = COMORBIDITIES_PATH,
+        root: str = FEATURE_STORE_DIR,
+    ):
+        self.gp_request_path = gp_request_path
+        self.patients_path = patients_path
+        self.comorbidities_path = comorbidities_path
+        self.root = root
+
+        self._version: str | None = None
+        self._gp_request: pd.DataFrame | None = None
+        self._patient_features: pd.DataFrame | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def source_paths(self) -> list[str]:
+        return [self.gp_request_path, self.patients_path, self.comorbidities_path]
+
+    def version(self) -> str:
+        """Hash of the source files and the feature code version."""
+        if self._version is None:
+            digest = hashlib.sha256(str(FEATURE_STORE_VERSION).encode())
+            for path in self.source_paths:
+                digest.update(file_checksum(path).encode())
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def refresh(self) -> None:
+        """Forgets everything loaded, so the next access re-checks the sources."""
+        with self._lock:
+            self._version = None
+            self._gp_request = None
+            self._patient_features = None
+
+    def _path(self) -> str:
+        return os.path.join(self.root, f"patient_features-{self.version()}.parquet")
+
+    def gp_requests(self) -> pd.DataFrame:
+        if self._gp_request is None:
+            self._gp_request = load_path(self.gp_request_path)
+        return self._gp_request
+
+    def patient_features(self) -> pd.DataFrame:
+        """Per-patient features indexed by patient_id, built and materialised on first use."""
+        if self._patient_features is not None:
+            return self._patient_features
+
+        with self._lock:
+            if self._patient_features is None:
+                path = self._path()
+                if os.path.exists(path):
+                    self._patient_features = pd.read_parquet(path)
+                else:
+                    features = build_patient_features(
+                        self.gp_requests(),
+                        load_path(self.patients_path),
+                        load_path(self.comorbidities_path),
+                    )
+                    os.makedirs(self.root, exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    features.to_parquet(tmp_path)
+                    os.replace(tmp_path, path)
+                    self._patient_features = features
+
+        return self._patient_features
+
+    def training_frame(self) -> pd.DataFrame:
+        """Every request joined with its patient's features, the input to both training datasets."""
+        return self.gp_requests().merge(self.patient_features(), left_on="patient_id", right_index=True, how="left")
+
+    def get(self, patient_ids: list[str]) -> pd.DataFrame:
+        """Features for the given patients, in order; unknown patients get NaN rows."""
+        return self.patient_features().reindex(pd.Index(patient_ids, name="patient_id"))
+
+    def get_patient(self, patient_id: str) -> dict | None:
+        features = self.patient_features()
+        if patient_id not in features.index:
+            return None
+        return features.loc[patient_id].to_dict()
+
+
+_stores: dict[tuple[str, str, str], FeatureStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_feature_store(
+    gp_request_path: str = GP_REQUEST_PATH,
+    patients_path: str = PATIENTS_PATH,
+    comorbidities_path: str = COMORBIDITIES_PATH,
+) -> FeatureStore:
+    """Shared store per set of sources, so every dataset built in a process reuses one load."""
+    key = (gp_request_path, patients_path, comorbidities_path)
+
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = FeatureStore(*key)
+        return _stores[key]
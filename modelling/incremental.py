@@ -0,0 +1,208 @@
+"""
+Incremental rebuild of the training datasets.
+
+The training CSVs hold only features and the encoded target, so each dataset
+keeps a keyed copy (referral_id, patient_id, row position, features, decoded
+target) in .cache/datasets, plus the referral_ids of every request seen so far,
+including those dropped from the dataset (no target, no date of birth, not a GP
+or Nurse appointment). On update only requests whose referral_id has not been
+seen are new; every row of the patients they belong to is rebuilt from just
+those patients' requests and comorbidities, so total_requests and the
+comorbidity aggregates stay correct, and all other rows are kept as they are. Target labels keep the codes in the existing *_label_mapping.json and
+new labels get the next free code, so the trained models stay valid.
+
+The first update without a state builds the whole dataset through the same path.
+"""
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.feature_store import (
+    PRIORITY_URGENCY_KEYWORDS,
+    PROFESSIONAL_URGENCY_KEYWORDS,
+    build_patient_features,
+    engineer_features,
+)
+from modelling.tables import REPO_ROOT, load_path
+
+STATE_DIR = os.getenv("DATASET_STATE_DIR", os.path.join(REPO_ROOT, ".cache", "datasets"))
+KEY_COLUMNS = ["referral_id", "patient_id", "row"]
+
+
+def assign_professional(appointment_type):
+    if pd.isna(appointment_type):
+        return None
+    if 'GP' in str(appointment_type):
+        return 'GP'
+    if 'Nurse' in str(appointment_type):
+        return 'Nurse'
+    return None
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    name: str
+    target: str
+    urgency_keywords: tuple[str, ...]
+    label_mapping_path: str
+    # Rows missing any of these after feature engineering are dropped
+    required_columns: tuple[str, ...]
+    # Derives the target column on the merged rows, if it is not a request column
+    make_target: Callable[[pd.DataFrame], pd.Series] | None = None
+
+
+PRIORITY_DATASET = DatasetSpec(
+    name="priority",
+    target="priority",
+    urgency_keywords=tuple(PRIORITY_URGENCY_KEYWORDS),
+    label_mapping_path="priority_label_mapping.json",
+    required_columns=("priority", "age"),
+)
+
+PROFESSIONAL_DATASET = DatasetSpec(
+    name="professional_type",
+    target="care_professional_type",
+    urgency_keywords=tuple(PROFESSIONAL_URGENCY_KEYWORDS),
+    label_mapping_path="professional_type_label_mapping.json",
+    required_columns=("care_professional_type",),
+    make_target=lambda df: df["requested_appointment_type"].apply(assign_professional),
+)
+
+
+def _state_path(spec: DatasetSpec) -> str:
+    return os.path.join(STATE_DIR, f"{spec.name}.parquet")
+
+
+def _seen_path(spec: DatasetSpec) -> str:
+    return os.path.join(STATE_DIR, f"{spec.name}.seen.parquet")
+
+
+def _write_parquet(df: pd.DataFrame, path: str) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def reset_state(spec: DatasetSpec) -> None:
+    """Drops the saved state, e.g. after a full rebuild, so the next update starts over."""
+    for path in (_state_path(spec), _seen_path(spec)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_label_mapping(path: str) -> dict[int, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+
+def encode_labels(labels: pd.Series, mapping: dict[int, str]) -> tuple[pd.Series, dict[int, str]]:
+    """Encodes with the existing codes; unseen labels get new codes in order of appearance."""
+    mapping = dict(mapping)
+    codes = {label: code for code, label in mapping.items()}
+    for label in pd.unique(labels):
+        if label not in codes:
+            codes[label] = len(mapping)
+            mapping[codes[label]] = label
+    return labels.map(codes).astype(int), mapping
+
+
+def build_rows(
+    spec: DatasetSpec,
+    gp_request: pd.DataFrame,
+    patients: pd.DataFrame,
+    comorbidities: pd.DataFrame,
+    reference_date: datetime | None = None,
+) -> pd.DataFrame:
+    """Keyed, engineered rows (target still decoded) for every request in gp_request."""
+    features = build_patient_features(gp_request, patients, comorbidities).reset_index()
+    # Merging on a column gives a fresh index that engineer_features keeps, to re-attach the keys
+    df = gp_request.merge(features, on="patient_id", how="left")
+    if spec.make_target is not None:
+        df[spec.target] = spec.make_target(df)
+
+    rows = engineer_features(df, list(spec.urgency_keywords), target=spec.target, reference_date=reference_date)
+    rows = rows.dropna(subset=list(spec.required_columns))
+    keys = df.loc[rows.index, ["referral_id", "patient_id"]].astype(str)
+    return pd.concat([keys.assign(row=df.loc[rows.index, "row"]), rows], axis=1)
+
+
+def update_dataset(
+    spec: DatasetSpec,
+    gp_request_path: str,
+    patients_path: str,
+    comorbidities_path: str,
+    output_path: str,
+    reference_date: datetime | None = None,
+) -> pd.DataFrame | None:
+    """Brings the dataset at output_path up to date with gp_request, rebuilding only affected patients."""
+    start = time.perf_counter()
+    try:
+        gp_request = load_path(gp_request_path)
+        patients = load_path(patients_path)
+        comorbidities = load_path(comorbidities_path)
+    except FileNotFoundError as e:
+        print(f"Error loading files: {e}")
+        return None
+
+    gp_request = gp_request.assign(
+        row=np.arange(len(gp_request)),
+        referral_id=gp_request["referral_id"].astype(str),
+        patient_id=gp_request["patient_id"].astype(str),
+    )
+    patients = patients.assign(person_id=patients["person_id"].astype(str))
+    comorbidities = comorbidities.assign(patient_id=comorbidities["patient_id"].astype(str))
+
+    state_path, seen_path = _state_path(spec), _seen_path(spec)
+    state = pd.read_parquet(state_path) if os.path.exists(state_path) and os.path.exists(output_path) else None
+
+    if state is None:
+        print(f"No saved state for the {spec.name} dataset, building it in full...")
+        affected = pd.Index(gp_request["patient_id"].unique())
+        kept = None
+    else:
+        # States saved before seen ids were kept only know their own rows
+        seen = pd.read_parquet(seen_path)["referral_id"] if os.path.exists(seen_path) else state["referral_id"]
+        new_requests = gp_request[~gp_request["referral_id"].isin(seen)]
+        if new_requests.empty:
+            print(f"{spec.name} dataset is up to date ({len(state)} rows)")
+            return None
+        affected = pd.Index(new_requests["patient_id"].unique())
+        kept = state[~state["patient_id"].isin(affected)]
+        print(f"{len(new_requests)} new requests for {len(affected)} patients")
+
+    rebuilt = build_rows(
+        spec,
+        gp_request[gp_request["patient_id"].isin(affected)],
+        patients[patients["person_id"].isin(affected)],
+        comorbidities[comorbidities["patient_id"].isin(affected)],
+        reference_date=reference_date,
+    )
+    state = rebuilt if kept is None else pd.concat([kept, rebuilt], ignore_index=True)
+    state = state.sort_values("row", kind="stable").reset_index(drop=True)
+
+    encoded, mapping = encode_labels(state[spec.target], load_label_mapping(spec.label_mapping_path))
+    with open(spec.label_mapping_path, 'w') as f:
+        json.dump(mapping, f)
+
+    training_df = state.drop(columns=KEY_COLUMNS).assign(**{spec.target: encoded})
+    training_df = training_df.select_dtypes(include=(np.number, np.bool))
+    training_df.to_csv(output_path, index=False)
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    _write_parquet(state, state_path)
+    _write_parquet(gp_request[["referral_id"]].drop_duplicates(), seen_path)
+
+    print(f"Rebuilt {len(rebuilt)} rows, kept {0 if kept is None else len(kept)}, in {time.perf_counter() - start:.2f}s")
+    print(f"Final dataset shape: {training_df.shape}")
+    return training_df
+
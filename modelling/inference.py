@@ -0,0 +1,124 @@
+"""
+Batch inference for the priority and professional-type models.
+
+predict_batch turns a list of Patient objects into one columnar feature
+matrix (the prio_feature_columns both models are trained on), runs both
+models over it and decodes their labels via the registry's label mappings.
+"""
+import sys
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.age import ages, get_reference_date
+from modelling.feature_store import (
+    FEATURE_COLUMNS as prio_feature_columns,
+    FeatureStore,
+    PRIORITY_URGENCY_KEYWORDS,
+    PROFESSIONAL_URGENCY_KEYWORDS,
+    count_urgency_keywords,
+)
+from modelling.patient import ALL_COMORBIDITIES, Patient
+from modelling.registry import ModelRegistry, get_registry
+
+
+def patients_to_features(patients: list[Patient], reference_date: datetime | None = None, store: FeatureStore | None = None) -> pd.DataFrame:
+    """
+    Builds the model feature matrix for a batch of patients in one pass, reading
+    attributes column by column instead of going through model_dump per patient.
+    With a feature store, comorbidities and request counts of known patients
+    come from the store by patient_id instead of the Patient objects.
+    """
+    age = ages([patient.date_of_birth for patient in patients], reference_date or get_reference_date())
+
+    comorbidities = {
+        f"has_{comorbidity}": np.fromiter((getattr(patient, f"has_{comorbidity}") for patient in patients), dtype=np.int64, count=len(patients))
+        for comorbidity in ALL_COMORBIDITIES
+    }
+    total_requests = np.fromiter((patient.total_requests for patient in patients), dtype=np.int64, count=len(patients))
+    comorbidity_count = np.sum(list(comorbidities.values()), axis=0) if patients else np.zeros(0, dtype=np.int64)
+
+    if store is not None and patients:
+        stored = store.get([patient.id for patient in patients])
+        known = stored["total_requests"].notna().to_numpy()
+        for column in comorbidities:
+            comorbidities[column] = np.where(known, stored[column].fillna(0).to_numpy(), comorbidities[column]).astype(np.int64)
+        total_requests = np.where(known, stored["total_requests"].fillna(0).to_numpy(), total_requests).astype(np.int64)
+        # The store counts every comorbidity category, not only the four model columns
+        comorbidity_count = np.where(known, stored["comorbidity_count"].fillna(0).to_numpy(), np.sum(list(comorbidities.values()), axis=0)).astype(np.int64)
+
+    issues = pd.Series([patient.issue for patient in patients], dtype=object)
+
+    features = pd.DataFrame({
+        "sex_female": np.fromiter((patient.sex == "female" for patient in patients), dtype=bool, count=len(patients)),
+        "age": np.asarray(age, dtype=np.int64),
+        **comorbidities,
+        "comorbidity_count": comorbidity_count,
+        "patient_is_on_cancer_pathway": np.fromiter((patient.patient_is_on_cancer_pathway for patient in patients), dtype=np.int64, count=len(patients)),
+        "urgency_keyword_count": count_urgency_keywords(issues, PRIORITY_URGENCY_KEYWORDS).to_numpy(),
+        "total_requests": total_requests,
+    })
+
+    return features[prio_feature_columns]
+
+
+def predict_batch(patients: list[Patient], registry: ModelRegistry | None = None, reference_date: datetime | None = None, store: FeatureStore | None = None) -> pd.DataFrame:
+    """Returns one row per patient with its predicted priority and professional type."""
+    registry = registry or get_registry()
+    features = patients_to_features(patients, reference_date=reference_date, store=store)
+
+    priorities = registry.get("priority").predict(features)
+
+    # The professional-type model was trained with a slightly different urgency
+    # keyword list, so only that column is recomputed for it
+    professional_features = features.assign(
+        urgency_keyword_count=count_urgency_keywords(
+            pd.Series([patient.issue for patient in patients], dtype=object), PROFESSIONAL_URGENCY_KEYWORDS
+        ).to_numpy()
+    )
+    professional_types = registry.get("professional_type").predict(professional_features)
+
+    return pd.DataFrame({
+        "patient_id": [patient.id for patient in patients],
+        "priority": priorities,
+        "professional_type": professional_types,
+    })
+
+
+def _synthetic_patients(n: int, seed: int = 0) -> list[Patient]:
+    rng = np.random.default_rng(seed)
+    issues = ["urgent chest pain", "repeat prescription", "worsening hypertension", "flu vaccine", "sore throat"]
+    return [
+        Patient(
+            family_id=str(i),
+            id=str(i),
+            issue=issues[i % len(issues)],
+            date_of_birth=datetime(int(rng.integers(1930, 2020)), int(rng.integers(1, 13)), int(rng.integers(1, 29))),
+            sex="female" if rng.random() < 0.5 else "male",
+            has_cardiovascular_disease=int(rng.random() < 0.1),
+            has_respiratory_disease=int(rng.random() < 0.05),
+            total_requests=int(rng.integers(1, 5)),
+        )
+        for i in range(n)
+    ]
+
+
+if __name__ == "__main__":
+    registry = get_registry().load_all()
+
+    for n in (1, 100, 10_000, 100_000):
+        patients = _synthetic_patients(n)
+
+        start = time.perf_counter()
+        patients_to_features(patients)
+        features_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        predict_batch(patients, registry=registry)
+        total_time = time.perf_counter() - start
+
+        print(f"{n:>7} patients: features {features_time * 1e3:8.1f}ms, features + both models {total_time * 1e3:8.1f}ms ({n / total_time:,.0f} patients/s)")
@@ -0,0 +1,154 @@
+"""
+Multi-pattern keyword matching with an Aho-Corasick automaton.
+
+The automaton is built once from a keyword list and then finds every keyword
+in a single pass over the text, however many keywords there are. Used by the
+router (mock_route, the rule pre-filter), where matches need word boundaries
+and positions. The batch urgency counts in feature engineering are plain
+substring counts and use one regex pass instead
+(feature_store.count_urgency_keywords), which is several times faster than
+this per-row Python loop.
+"""
+from collections import Counter, deque
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str], word_boundaries: bool = True, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self.word_boundaries = word_boundaries
+        self.keywords = list(dict.fromkeys(k if case_sensitive else k.lower() for k in keywords if k))
+
+        # Trie transitions, failure links and the keyword indices ending at each state
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[list[int]] = [[]]
+
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+        self._lengths = [len(k) for k in self.keywords]
+
+    def _is_boundary(self, text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not (before.isalnum() or before == "_") and not (after.isalnum() or after == "_")
+
+    def _raw_matches(self, text: str) -> Iterator[tuple[int, int, int]]:
+        goto, fail, out, lengths = self._goto, self._fail, self._out, self._lengths
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                end = i + 1
+                start = end - lengths[index]
+                if not self.word_boundaries or self._is_boundary(text, start, end):
+                    yield start, end, index
+
+    def finditer(self, text: str, overlapping: bool = False) -> Iterator[tuple[int, int, str]]:
+        """
+        Yields (start, end, keyword) for each match, in order of position. Unless
+        overlapping is set, overlapping matches are resolved leftmost-longest.
+        """
+        if not text:
+            return
+        if not self.case_sensitive:
+            text = text.lower()
+
+        matches = self._raw_matches(text)
+        if overlapping:
+            for start, end, index in matches:
+                yield start, end, self.keywords[index]
+            return
+
+        last_end = 0
+        for start, end, index in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+            if start >= last_end:
+                last_end = end
+                yield start, end, self.keywords[index]
+
+    def counts(self, text: str) -> Counter:
+        """Number of (non-overlapping) occurrences of each keyword found in text."""
+        return Counter(keyword for _, _, keyword in self.finditer(text))
+
+    def matched(self, text: str) -> list[str]:
+        """Distinct keywords found in text, in order of first appearance."""
+        return list(dict.fromkeys(keyword for _, _, keyword in self.finditer(text)))
+
+    def count(self, text: str) -> int:
+        return sum(1 for _ in self.finditer(text))
+
+    def count_series(self, texts: pd.Series) -> pd.Series:
+        """Total keyword count per row, treating missing values as empty text."""
+        return pd.Series(
+            [self.count(text) if isinstance(text, str) else 0 for text in texts],
+            index=texts.index,
+            dtype="int64",
+        )
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m modelling.keyword_matcher
+    import time
+
+    from modelling.feature_store import count_urgency_keywords
+    from modelling.priority_prepare import URGENCY_KEYWORDS
+
+    notes = pd.read_csv("datasets/gp_request.csv", usecols=["new_referral_notes"])["new_referral_notes"].fillna("").astype(str)
+    lowered = notes.str.lower()
+    print(f"Benchmarking on {len(notes)} requests")
+
+    start = time.perf_counter()
+    regex_counts = count_urgency_keywords(notes, URGENCY_KEYWORDS)
+    regex_time = time.perf_counter() - start
+    print(f"regex str.count: {regex_time:.3f}s ({len(notes) / regex_time:,.0f} rows/s)")
+
+    matcher = KeywordMatcher(URGENCY_KEYWORDS, word_boundaries=False)
+    start = time.perf_counter()
+    matcher_counts = matcher.count_series(notes)
+    matcher_time = time.perf_counter() - start
+    print(f"KeywordMatcher: {matcher_time:.3f}s ({len(notes) / matcher_time:,.0f} rows/s), identical counts: {(regex_counts == matcher_counts).all()}")
+
+    # Routing-style lookup: many keyword lists checked against each request
+    from pharmacy_route.rules import GUARD_KEYWORDS, NURSE_CONDITION_KEYWORDS, PHARMACY_CONDITION_KEYWORDS, RED_FLAG_KEYWORDS
+
+    routing_keywords = RED_FLAG_KEYWORDS + GUARD_KEYWORDS + [
+        k for keywords in (*PHARMACY_CONDITION_KEYWORDS.values(), *NURSE_CONDITION_KEYWORDS.values()) for k in keywords
+    ]
+    start = time.perf_counter()
+    for text in lowered:
+        [keyword for keyword in routing_keywords if keyword in text]
+    scan_time = time.perf_counter() - start
+    print(f"any(keyword in text) over {len(routing_keywords)} keywords: {scan_time:.3f}s ({len(notes) / scan_time:,.0f} rows/s)")
+
+    matcher = KeywordMatcher(routing_keywords)
+    start = time.perf_counter()
+    for text in lowered:
+        matcher.matched(text)
+    matcher_time = time.perf_counter() - start
+    print(f"KeywordMatcher over {len(routing_keywords)} keywords: {matcher_time:.3f}s ({len(notes) / matcher_time:,.0f} rows/s)")
@@ -1,8 +1,10 @@
 from datetime import datetime
 from typing import Literal
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field, PrivateAttr, computed_field
 from dataclasses import dataclass
 
+from modelling.age import age_on, get_reference_date
+
 @dataclass
 class PrimaryCareGroup:
     doctor_id: str
@@ -34,12 +36,20 @@ class Patient(BaseModel):
     sex: Literal["male", "female"]
     history: str | None = Field(default=None, description="Patient's medical history")
 
+    # Ages already worked out, keyed by (reference date, date of birth)
+    _ages: dict[tuple[datetime, datetime], int] = PrivateAttr(default_factory=dict)
+
     @computed_field
     @property
     def age(self) -> int:
-        """Calculate age from date of birth"""
-        today = datetime.now()
-        return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
+        """Age today, or on the pinned reference date (modelling.age.get_reference_date)"""
+        return self.age_on(get_reference_date())
+
+    def age_on(self, reference_date: datetime) -> int:
+        key = (reference_date, self.date_of_birth)
+        if key not in self._ages:
+            self._ages[key] = age_on(self.date_of_birth, reference_date)
+        return self._ages[key]
 
     @property
     def comorbidities(self) -> list[str]:
@@ -0,0 +1,225 @@
+"""
+Polars lazy-frame backend for building the training datasets.
+
+build_training_table(spec, ..., backend="polars") scans the sources (the
+Parquet files from modelling/tables.py where there is one), joins the
+per-patient aggregates and computes the model features as one lazy query,
+so polars plans the whole pipeline and no intermediate pandas copies are
+made. The result matches the pandas path (feature store + engineer_features)
+value for value and dtype for dtype, so the CSVs written from either are
+byte-identical. They are written with the same pandas writer, as polars
+formats floats and booleans differently in CSV.
+
+Select it with backend="polars" on the prepare functions or
+PREPARE_BACKEND=polars. `python -m modelling.polars_pipeline [gp_request.csv
+patients.csv comorbidities.csv]` checks both backends produce identical files
+and compares runtime and peak memory, on the datasets/ extracts by default.
+"""
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import polars as pl
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.age import get_reference_date
+from modelling.feature_store import COMORBIDITY_COLUMNS, FEATURE_COLUMNS, engineer_features, get_feature_store, urgency_pattern
+from modelling.incremental import DatasetSpec
+from modelling.tables import table_for_path, table_path
+
+DEFAULT_BACKEND = os.getenv("PREPARE_BACKEND", "pandas")
+
+# Columns that come out of the pandas path as int64, or float64 if a request matched no patient features
+COUNT_COLUMNS = COMORBIDITY_COLUMNS + ["comorbidity_count", "total_requests"]
+
+
+def scan(path: str) -> pl.LazyFrame:
+    name = table_for_path(path)
+    if name is not None:
+        return pl.scan_parquet(table_path(name))
+    # Dates are parsed where they are used; trying every CSV column for dates is most of the scan time
+    return pl.scan_csv(path, infer_schema_length=10_000)
+
+
+def _normalised(column: str) -> str:
+    return column.strip().lower().replace(" ", "_")
+
+
+def _find_column(frame: pl.LazyFrame, normalised_name: str) -> str:
+    for column in frame.collect_schema().names():
+        if _normalised(column) == normalised_name:
+            return column
+    raise KeyError(normalised_name)
+
+
+def _target_expression(spec: DatasetSpec) -> pl.Expr:
+    if spec.name == "professional_type":
+        appointment_type = pl.col("requested_appointment_type").cast(pl.String)
+        return (
+            pl.when(appointment_type.str.contains("GP", literal=True)).then(pl.lit("GP"))
+            .when(appointment_type.str.contains("Nurse", literal=True)).then(pl.lit("Nurse"))
+            .otherwise(pl.lit(None, dtype=pl.String))
+        )
+    return pl.col(spec.target)
+
+
+def training_table_lazy(
+    spec: DatasetSpec,
+    gp_request_path: str,
+    patients_path: str,
+    comorbidities_path: str,
+    reference_date: datetime,
+) -> pl.LazyFrame:
+    requests = scan(gp_request_path).with_row_index("_row")
+    patients = scan(patients_path)
+    date_of_birth = pl.col("date_of_birth")
+    if patients.collect_schema()["date_of_birth"] == pl.String:
+        date_of_birth = date_of_birth.str.to_datetime(strict=False)
+    patients = (
+        patients
+        .select(pl.col("person_id").alias("patient_id"), date_of_birth, "sex")
+        .unique("patient_id", keep="first", maintain_order=True)
+    )
+
+    comorbidities = scan(comorbidities_path)
+    category = _find_column(comorbidities, "condition_category")
+    patient_id = _find_column(comorbidities, "patient_id")
+    # Same column naming as the pandas pivot ("has_<category>", normalised)
+    comorbidity_column = (
+        pl.concat_str([pl.lit("has_"), pl.col(category).cast(pl.String)])
+        .str.strip_chars().str.to_lowercase().str.replace_all(" ", "_", literal=True)
+    )
+    comorbidity_features = (
+        comorbidities
+        .select(pl.col(patient_id).alias("patient_id"), comorbidity_column.alias("_column"))
+        .group_by("patient_id")
+        .agg(
+            pl.len().cast(pl.Int64).alias("comorbidity_count"),
+            *[(pl.col("_column") == column).any().cast(pl.Int64).alias(column) for column in COMORBIDITY_COLUMNS],
+        )
+    )
+    request_counts = requests.group_by("patient_id").agg(pl.len().cast(pl.Int64).alias("total_requests"))
+
+    dob = pl.col("date_of_birth")
+    birthday_not_passed = (pl.lit(reference_date.month) < dob.dt.month()) | (
+        (pl.lit(reference_date.month) == dob.dt.month()) & (pl.lit(reference_date.day) < dob.dt.day())
+    )
+
+    frame = (
+        requests
+        .join(patients, on="patient_id", how="left")
+        .join(comorbidity_features, on="patient_id", how="left")
+        .join(request_counts, on="patient_id", how="left")
+        .with_columns(
+            # Dtype flags for matching pandas, taken over all rows before any are dropped
+            _dob_missing=dob.is_null().any(),
+            _unmatched=pl.col("total_requests").is_null().any(),
+        )
+        .select(
+            "_row",
+            "_dob_missing",
+            "_unmatched",
+            (pl.col("sex").cast(pl.String) == "female").fill_null(False).alias("sex_female"),
+            (pl.lit(reference_date.year) - dob.dt.year().cast(pl.Int64) - birthday_not_passed.cast(pl.Int64)).alias("age"),
+            *[pl.col(column).fill_null(0) for column in COUNT_COLUMNS],
+            pl.col("patient_is_on_cancer_pathway").cast(pl.Int64).fill_null(0),
+            pl.col("new_referral_notes").cast(pl.String).fill_null("").str.to_lowercase()
+            .str.count_matches(urgency_pattern(spec.urgency_keywords)).cast(pl.Int64).alias("urgency_keyword_count"),
+            _target_expression(spec).alias(spec.target),
+        )
+        .drop_nulls(subset=list(spec.required_columns))
+        .sort("_row")
+    )
+    return frame
+
+
+def _to_pandas_dtypes(table: pl.DataFrame, spec: DatasetSpec) -> pd.DataFrame:
+    dob_missing = bool(table["_dob_missing"][0]) if len(table) else False
+    unmatched = bool(table["_unmatched"][0]) if len(table) else False
+
+    df = table.drop("_row", "_dob_missing", "_unmatched").to_pandas()
+    df["sex_female"] = df["sex_female"].astype(bool)
+    df["age"] = df["age"].astype("float64" if dob_missing else "int64")
+    for column in COUNT_COLUMNS:
+        df[column] = df[column].astype("float64" if unmatched else "int64")
+    for column in ("patient_is_on_cancer_pathway", "urgency_keyword_count"):
+        df[column] = df[column].astype("int64")
+    df[spec.target] = df[spec.target].astype(object)
+    return df[FEATURE_COLUMNS + [spec.target]]
+
+
+def build_training_table(
+    spec: DatasetSpec,
+    gp_request_path: str,
+    patients_path: str,
+    comorbidities_path: str,
+    backend: str = DEFAULT_BACKEND,
+    reference_date: datetime | None = None,
+) -> pd.DataFrame:
+    """Engineered feature rows with the target still decoded, from either backend."""
+    reference_date = reference_date or get_reference_date()
+
+    if backend == "polars":
+        table = training_table_lazy(spec, gp_request_path, patients_path, comorbidities_path, reference_date).collect()
+        return _to_pandas_dtypes(table, spec)
+
+    if backend != "pandas":
+        raise ValueError(f"Unknown backend '{backend}', expected 'pandas' or 'polars'")
+
+    df = get_feature_store(gp_request_path, patients_path, comorbidities_path).training_frame()
+    if spec.make_target is not None:
+        df[spec.target] = spec.make_target(df)
+    df = engineer_features(df, list(spec.urgency_keywords), target=spec.target, reference_date=reference_date)
+    return df.dropna(subset=list(spec.required_columns))
+
+
+def _run_backend(backend: str, spec_name: str, sources: tuple[str, str, str], reference_date: datetime, output_path: str, queue) -> None:
+    # Runs in a fresh process so peak memory is measured per backend
+    import resource
+    import time
+
+    from modelling.incremental import PRIORITY_DATASET, PROFESSIONAL_DATASET, encode_labels, load_label_mapping
+
+    spec = {"priority": PRIORITY_DATASET, "professional_type": PROFESSIONAL_DATASET}[spec_name]
+    start = time.perf_counter()
+    df = build_training_table(spec, *sources, backend=backend, reference_date=reference_date)
+    df[spec.target], _ = encode_labels(df[spec.target], load_label_mapping(spec.label_mapping_path))
+    df.to_csv(output_path, index=False)
+    seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == "__main__":
+    # Run from the repository root: python -m modelling.polars_pipeline
+    import filecmp
+    import multiprocessing
+    import tempfile
+
+    from modelling.tables import load_table
+
+    sources = tuple(sys.argv[1:4]) if len(sys.argv) > 3 else ("datasets/gp_request.csv", "datasets/patients.csv", "datasets/comorbidities.csv")
+
+    # Build the Parquet cache first so neither backend pays for the conversion
+    for path in sources:
+        if (name := table_for_path(path)) is not None:
+            load_table(name)
+
+    context = multiprocessing.get_context("spawn")
+    reference_date = get_reference_date()
+    with tempfile.TemporaryDirectory() as tmp:
+        for spec_name in ("priority", "professional_type"):
+            paths = {}
+            for backend in ("pandas", "polars"):
+                paths[backend] = os.path.join(tmp, f"{spec_name}_{backend}.csv")
+                queue = context.Queue()
+                process = context.Process(target=_run_backend, args=(backend, spec_name, sources, reference_date, paths[backend], queue))
+                process.start()
+                seconds, peak_mb = queue.get()
+                process.join()
+                print(f"{spec_name:>17} {backend:>6}: {seconds:.2f}s, peak RSS {peak_mb:.0f}MB")
+
+            identical = filecmp.cmp(paths["pandas"], paths["polars"], shallow=False)
+            print(f"{spec_name:>17} outputs byte-identical: {identical}")
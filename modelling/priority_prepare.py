@@ -1,141 +1,60 @@
 import pandas as pd
 import numpy as np
 import json
-from datetime import datetime
-
-prio_feature_columns = [
-    "sex_female",
-    "age",
-    "has_cardiovascular_disease",
-    "has_digestive_disease",
-    "has_musculoskeletal_disease",
-    "has_respiratory_disease",
-    "comorbidity_count",
-    "patient_is_on_cancer_pathway",
-    "urgency_keyword_count",
-    "total_requests",
-]
+import sys
+import os
+
+# Add parent directory to path so the modelling package resolves when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.feature_store import (
+    FEATURE_COLUMNS,
+    PRIORITY_URGENCY_KEYWORDS,
+    engineer_features as engineer_store_features,
+)
+from modelling.incremental import PRIORITY_DATASET, encode_labels, load_label_mapping, reset_state, update_dataset
+from modelling.polars_pipeline import DEFAULT_BACKEND, build_training_table
+
+# Kept under their old names for modelling.inference and the keyword benchmark
+URGENCY_KEYWORDS = PRIORITY_URGENCY_KEYWORDS
+prio_feature_columns = FEATURE_COLUMNS
 
 def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-
-    df["date_of_birth"] = pd.to_datetime(df["date_of_birth"], errors="coerce")
-    today = datetime.now()
-    age = today.year - df["date_of_birth"].dt.year
-    birthday_not_passed = (
-        (today.month < df["date_of_birth"].dt.month) |
-        ((today.month == df["date_of_birth"].dt.month) & (today.day < df["date_of_birth"].dt.day))
-    )
-    df["age"] = age - birthday_not_passed.astype(int)
-
-    # Request timing features
-    df['date_referral_received'] = pd.to_datetime(df['date_referral_received'], errors="coerce")
-    df['request_month'] = df['date_referral_received'].dt.month
-    df['request_day_of_week'] = df['date_referral_received'].dt.dayofweek
-
-    # Text features from notes
-    notes_series = df['new_referral_notes'].fillna('').astype(str)
-    df['note_length'] = notes_series.str.len()
-    urgency_keywords = ['urgent', 'severe', 'worsening', 'immediate', 'asap', 'concerning', 'hypertension']
-    df['urgency_keyword_count'] = notes_series.str.lower().str.count('|'.join(urgency_keywords))
-
-    df = df.rename(
-        columns=lambda col: col.strip().lower().replace(" ", "_")
-    )
-
-    # Fill comorbidity columns
-    comorb_cols = [c for c in df.columns if c.startswith("has_")]
-    df[comorb_cols] = df[comorb_cols].fillna(0)
-    df[['comorbidity_count', 'total_requests']] = df[['comorbidity_count', 'total_requests']].fillna(0)
-    if 'patient_is_on_cancer_pathway' in df.columns:
-        df['patient_is_on_cancer_pathway'] = df['patient_is_on_cancer_pathway'].fillna(0).astype(int)
-
-    categorical_cols = ['sex']
-    df = pd.get_dummies(df, columns=[c for c in categorical_cols if c in df.columns])
-    
-    if "priority" in df.columns:
-        return df[prio_feature_columns + ["priority"]]
-
-    return df[prio_feature_columns]
+    return engineer_store_features(df, URGENCY_KEYWORDS, target="priority")
 
 def create_enhanced_numerical_dataset_for_priority(
     gp_request_path="datasets/gp_request.csv",
     patients_path="datasets/patients.csv",
     comorbidities_path="datasets/comorbidities.csv",
     output_path="generated_datasets/priority_training.csv",
+    incremental=False,
+    backend=DEFAULT_BACKEND,
+    reference_date=None,
 ):
     """
     Loads, merges, and engineers features to create a numerical dataset
-    with 'priority' as the target variable.
+    with 'priority' as the target variable. With incremental=True only new
+    referral_ids are added and their patients' rows refreshed (see
+    modelling/incremental.py). backend="polars" builds the same table with
+    the lazy polars pipeline (see modelling/polars_pipeline.py). Ages are
+    taken on reference_date, today by default.
     """
+    if incremental:
+        return update_dataset(PRIORITY_DATASET, gp_request_path, patients_path, comorbidities_path, output_path, reference_date=reference_date)
 
     print("Starting dataset creation process for priority prediction...")
 
+    # Per-patient features come from the shared feature store (or one polars query), computed once for both datasets
+    target_col = "priority"
     try:
-        gp_request = pd.read_csv(gp_request_path)
-        patients = pd.read_csv(patients_path)
-        comorbidities = pd.read_csv(comorbidities_path)
+        print(f"Loading data and engineering features ({backend} backend)...")
+        df = build_training_table(PRIORITY_DATASET, gp_request_path, patients_path, comorbidities_path, backend=backend, reference_date=reference_date)
         print("All datasets loaded successfully.")
     except FileNotFoundError as e:
         print(f"Error loading files: {e}")
         return None
 
-    # -----------------------------
-    # 2. Prepare each dataset (light preprocessing only)
-    # -----------------------------
-    # Patients — keep only ID, DOB, sex
-    patients = patients[["person_id", "date_of_birth", "sex"]].rename(
-        columns={"person_id": "patient_id"}
-    )
-
-    comorbidities = comorbidities.rename(
-        columns=lambda col: col.strip().lower().replace(" ", "_")
-    )
-
-    # Comorbidities — prepare two tables: counts and one-hot pivot
-    comorbidity_counts = (
-        comorbidities.groupby("patient_id")
-        .size()
-        .reset_index(name="comorbidity_count")
-    )
-
-    comorb_pivot = (
-        comorbidities.assign(value=1)
-        .pivot_table(index="patient_id", columns="condition_category", values="value", fill_value=0)
-        .add_prefix("has_")
-        .reset_index()
-    )
-
-    # Request counts
-    request_counts = (
-        gp_request.groupby("patient_id")
-        .size()
-        .reset_index(name="total_requests")
-    )
-
-    # -----------------------------
-    # 3. Merge all datasets first
-    # -----------------------------
-    print("Merging all data sources...")
-
-    df = gp_request.merge(patients, on="patient_id", how="left")
-    df = df.merge(comorbidity_counts, on="patient_id", how="left")
-    df = df.merge(comorb_pivot, on="patient_id", how="left")
-    df = df.merge(request_counts, on="patient_id", how="left")
-
-    # -----------------------------
-    # 4. Feature engineering (do AFTER merging)
-    # -----------------------------
-    print("Engineering features...")
-
-    df = engineer_features(df)
-
-    target_col = "priority"
-    df.dropna(subset=[target_col, 'age'], inplace=True)
-
-    # Encode target
-    df[target_col], labels = pd.factorize(df[target_col])
-    label_mapping = {i: label for i, label in enumerate(labels)}
+    # Encode target, keeping the codes of labels seen in earlier runs
+    df[target_col], label_mapping = encode_labels(df[target_col], load_label_mapping('priority_label_mapping.json'))
     with open('priority_label_mapping.json', 'w') as f:
         json.dump(label_mapping, f)
     print(f"Target variable '{target_col}' encoded. Mapping saved to priority_label_mapping.json")
@@ -144,6 +63,7 @@ def create_enhanced_numerical_dataset_for_priority(
     training_df = df.select_dtypes(include=(np.number, np.bool))
 
     training_df.to_csv(output_path, index=False)
+    reset_state(PRIORITY_DATASET)
     print(f"\n✅ Successfully created and saved the dataset to {output_path}")
     print(f"Final dataset shape: {training_df.shape}")
 
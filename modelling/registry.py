@@ -0,0 +1,156 @@
+"""
+Registry of the trained triage models.
+
+Each model is persisted as three artefacts: the fitted XGBoost classifier
+(*_registry_model.joblib), its label mapping (*_label_mapping.json, as written
+by the prepare scripts) and its feature schema (*_registry_feature_schema.json,
+the ordered feature columns it was trained on). The registry loads them once
+per process and serves predictions; training lives in modelling/train.py.
+
+The registry has its own artefact names: the *_triage_model.joblib files at
+the root are written by model.py / model_apt.py from a different feature set,
+and loading one of those here would fail (or worse, zero-fill) at predict time.
+"""
+import json
+import os
+import threading
+from dataclasses import dataclass
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Artefacts live at the repository root, next to the existing models
+ARTEFACT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# One-hot columns a batch can lack when none of its rows have that value; any other missing column is an error
+ZERO_FILL_PREFIXES = ("has_", "sex_")
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    model_path: str
+    label_mapping_path: str
+    schema_path: str
+
+
+MODEL_SPECS = {
+    "priority": ModelSpec(
+        model_path="priority_registry_model.joblib",
+        label_mapping_path="priority_label_mapping.json",
+        schema_path="priority_registry_feature_schema.json",
+    ),
+    "professional_type": ModelSpec(
+        model_path="professional_type_registry_model.joblib",
+        label_mapping_path="professional_type_label_mapping.json",
+        schema_path="professional_type_registry_feature_schema.json",
+    ),
+}
+
+
+class LoadedModel:
+    def __init__(self, name: str, model, feature_columns: list[str], label_mapping: dict[int, str]):
+        self.name = name
+        self.model = model
+        self.feature_columns = feature_columns
+        self.label_mapping = label_mapping
+
+    def align(self, features: pd.DataFrame) -> pd.DataFrame:
+        """
+        Orders columns as in training. One-hot columns absent from the batch
+        (no row has that value) are 0; any other missing feature raises.
+        """
+        missing = [column for column in self.feature_columns if column not in features.columns]
+        not_one_hot = [column for column in missing if not column.startswith(ZERO_FILL_PREFIXES)]
+        if not_one_hot:
+            raise ValueError(f"{self.name} model: features missing from the batch: {not_one_hot}")
+        return features.reindex(columns=self.feature_columns, fill_value=0)
+
+    def predict_codes(self, features: pd.DataFrame) -> np.ndarray:
+        return np.asarray(self.model.predict(self.align(features))).astype(int)
+
+    def decode(self, codes: np.ndarray) -> list[str]:
+        return [self.label_mapping[int(code)] for code in codes]
+
+    def predict(self, features: pd.DataFrame) -> list[str]:
+        return self.decode(self.predict_codes(features))
+
+
+def _path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(ARTEFACT_DIR, path)
+
+
+def check_schema(model, feature_columns: list[str], source: str) -> None:
+    """Raises if the model was not trained on exactly these columns, in this order."""
+    trained_on = model.get_booster().feature_names
+    if trained_on is not None and list(trained_on) != list(feature_columns):
+        raise ValueError(f"{source}: feature schema does not match the columns the model was trained on")
+
+
+def write_schema(schema_path: str, model, feature_columns: list[str]) -> None:
+    """Writes the feature schema of a trained model, checking it first."""
+    check_schema(model, feature_columns, schema_path)
+    with open(schema_path, "w") as f:
+        json.dump({"feature_columns": list(feature_columns)}, f, indent=2)
+
+
+def load_model(name: str) -> LoadedModel:
+    spec = MODEL_SPECS[name]
+    schema_path = _path(spec.schema_path)
+    if not os.path.exists(schema_path):
+        # Without a schema there is no telling which features the model expects
+        raise FileNotFoundError(f"{name} model: no feature schema at {schema_path}; retrain with `python -m modelling.train`")
+
+    model = joblib.load(_path(spec.model_path))
+
+    with open(_path(spec.label_mapping_path)) as f:
+        label_mapping = {int(k): v for k, v in json.load(f).items()}
+
+    with open(schema_path) as f:
+        feature_columns = json.load(f)["feature_columns"]
+    check_schema(model, feature_columns, schema_path)
+
+    return LoadedModel(name, model, feature_columns, label_mapping)
+
+
+def save_model(name: str, model, feature_columns: list[str]) -> None:
+    """Persists a trained model and its feature schema. The label mapping is written by the prepare step."""
+    spec = MODEL_SPECS[name]
+    write_schema(_path(spec.schema_path), model, feature_columns)
+    joblib.dump(model, _path(spec.model_path))
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._models: dict[str, LoadedModel] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> LoadedModel:
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = load_model(name)
+
+        return self._models[name]
+
+    def load_all(self) -> "ModelRegistry":
+        for name in MODEL_SPECS:
+            self.get(name)
+        return self
+
+    def reload(self, name: str | None = None) -> None:
+        """Drops cached models so the next get() picks up freshly trained artefacts."""
+        with self._lock:
+            if name is None:
+                self._models.clear()
+            else:
+                self._models.pop(name, None)
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
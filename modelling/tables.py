@@ -0,0 +1,263 @@
+"""
+Columnar cache for the raw CSVs in data/, datasets/ and the scripts' own data folders.
+
+load_table(name, columns=...) converts a source CSV once to a compressed
+Parquet file under .cache/tables (dates parsed, low-cardinality text columns
+stored as categoricals) and reads only the requested columns from it after
+that. A cached table is rebuilt when the SHA-256 of its source changes; the
+hash is only recomputed when the source's size or modification time moves.
+
+Run `python -m modelling.tables` from the repository root to convert every
+table up front and compare load times against the CSVs.
+"""
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("TABLE_CACHE_DIR", os.path.join(REPO_ROOT, ".cache", "tables"))
+# Bump when the conversion itself changes so old cache files are rebuilt
+CONVERSION_VERSION = 1
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    path: str
+    date_columns: tuple[str, ...] = ()
+    categorical_columns: tuple[str, ...] = ()
+    # Columns read as strings so ids keep their exact form
+    string_columns: tuple[str, ...] = ()
+    read_options: dict = field(default_factory=dict)
+
+
+TABLES = {
+    "gp_appointment": TableSpec(
+        path="data/GP Appointment.csv",
+        date_columns=("start_date_time", "end_date_time", "date_time_booked", "date_time_cancelled"),
+        categorical_columns=("Appointment_Name", "booking_status", "cancellation_reason", "outcome", "category", "priority", "clinic_type_name"),
+        string_columns=("patient_id", "clinic_id", "referral_id"),
+    ),
+    "gp_clinics": TableSpec(
+        path="data/GP Clinics.csv",
+        date_columns=("clinic_start_timestamp", "clinic_end_timestamp", "cancellation_timestamp"),
+        categorical_columns=("Clinic_Care_Professional", "clinic_type_name", "location", "status", "status_reason", "cancellation_reason"),
+        string_columns=("clinic_id", "care_professional_id"),
+    ),
+    "gp_request": TableSpec(
+        path="data/GP Request.csv",
+        date_columns=("date_referral_received", "date_referral_accepted", "earliest_due_date", "due_date", "date_referral_created"),
+        categorical_columns=("requested_appointment_type", "status", "rtt_pathway_status", "referral_source", "source"),
+        string_columns=("patient_id", "referral_id"),
+    ),
+    "patient": TableSpec(
+        path="data/Patient.csv",
+        date_columns=("date_of_birth", "date_of_death"),
+        categorical_columns=("sex", "title", "contact_preferences", "preferred_spoken_language", "address_city"),
+        string_columns=("person_id",),
+    ),
+    "comorbidities": TableSpec(path="data/Co-morbidities.csv", string_columns=("patient_id",)),
+    "gp_registration": TableSpec(
+        path="data/GP Registration.csv",
+        date_columns=("registration_start_date", "registration_end_date"),
+        categorical_columns=("High_Level_Health_Geography", "National_Grouping", "general_medical_practice"),
+        string_columns=("patient_id",),
+    ),
+    "care_professional": TableSpec(path="data/Care Professional.csv", categorical_columns=("role",)),
+    "gp_practices": TableSpec(path="data/GP Practices.csv"),
+    "ons_gp_survey": TableSpec(path="data/ONS GP Survey.csv"),
+    "ons_gp_survey_demographics": TableSpec(path="data/ONS GP Survey Demographics.csv"),
+    # Hackathon extracts used by the modelling scripts
+    "datasets/gp_request": TableSpec(
+        path="datasets/gp_request.csv",
+        date_columns=("date_referral_received",),
+        string_columns=("patient_id", "referral_id"),
+    ),
+    "datasets/patients": TableSpec(path="datasets/patients.csv", date_columns=("date_of_birth",), string_columns=("person_id",)),
+    "datasets/comorbidities": TableSpec(path="datasets/comorbidities.csv", string_columns=("patient_id",)),
+    # The clinic assignment script's own copies; its GP Request.csv carries the faked appointment_type_recommendation
+    "assign_patients_to_clinic/gp_request": TableSpec(
+        path="assign_patients_to_clinic/data/GP Request.csv",
+        date_columns=("date_referral_received", "date_referral_accepted", "earliest_due_date", "due_date", "date_referral_created"),
+        categorical_columns=("requested_appointment_type", "status", "rtt_pathway_status", "referral_source", "source"),
+        string_columns=("patient_id", "referral_id"),
+    ),
+    "assign_patients_to_clinic/gp_clinics": TableSpec(
+        path="assign_patients_to_clinic/data/GP Clinics.csv",
+        date_columns=("clinic_start_timestamp", "clinic_end_timestamp", "cancellation_timestamp"),
+        categorical_columns=("Clinic_Care_Professional", "clinic_type_name", "location", "status", "status_reason", "cancellation_reason"),
+        string_columns=("clinic_id", "care_professional_id"),
+    ),
+    "assign_patients_to_clinic/patients_plus_lat_long": TableSpec(
+        path="assign_patients_to_clinic/data/patients_plus_lat_long.csv",
+        string_columns=("person_id",),
+    ),
+}
+
+
+def source_path(name: str) -> str:
+    path = TABLES[name].path
+    return path if os.path.isabs(path) else os.path.join(REPO_ROOT, path)
+
+
+def _cache_paths(name: str) -> tuple[str, str]:
+    stem = os.path.join(CACHE_DIR, name.replace("/", "__"))
+    return f"{stem}.parquet", f"{stem}.meta.json"
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _parse_dates(series: pd.Series) -> pd.Series:
+    parsed = pd.to_datetime(series, errors="coerce")
+    # Mixed UTC offsets come back as objects; normalise those to UTC
+    return pd.to_datetime(series, errors="coerce", utc=True) if parsed.dtype == object else parsed
+
+
+def read_source(name: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """Reads and types a table straight from its CSV, as stored in the cache."""
+    spec = TABLES[name]
+    df = pd.read_csv(
+        source_path(name),
+        usecols=columns,
+        dtype={c: str for c in spec.string_columns if columns is None or c in columns},
+        low_memory=False,
+        **spec.read_options,
+    )
+    for column in spec.date_columns:
+        if column in df.columns:
+            df[column] = _parse_dates(df[column])
+    for column in spec.categorical_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _is_fresh(name: str) -> bool:
+    parquet_path, meta_path = _cache_paths(name)
+    if not (os.path.exists(parquet_path) and os.path.exists(meta_path)):
+        return False
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get("conversion_version") != CONVERSION_VERSION:
+        return False
+
+    stat = os.stat(source_path(name))
+    if meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+        return True
+
+    # Touched but possibly unchanged (e.g. a fresh checkout): compare contents
+    if meta["size"] != stat.st_size or meta["sha256"] != file_checksum(source_path(name)):
+        return False
+
+    meta.update(mtime_ns=stat.st_mtime_ns)
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    return True
+
+
+def build_table(name: str) -> str:
+    """Converts a source CSV to the cache and returns the Parquet path."""
+    parquet_path, meta_path = _cache_paths(name)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    stat = os.stat(source_path(name))
+    df = read_source(name)
+
+    # Write then rename so a concurrent reader never sees a partial file
+    tmp_path = f"{parquet_path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, engine="pyarrow", compression="zstd", index=False)
+    os.replace(tmp_path, parquet_path)
+
+    with open(meta_path, "w") as f:
+        json.dump(
+            {
+                "source": TABLES[name].path,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": file_checksum(source_path(name)),
+                "conversion_version": CONVERSION_VERSION,
+                "rows": len(df),
+            },
+            f,
+            indent=2,
+        )
+    return parquet_path
+
+
+def table_path(name: str) -> str:
+    """Path of the cached Parquet file for a table, (re)building it if needed, e.g. for polars.scan_parquet."""
+    if not _is_fresh(name):
+        build_table(name)
+    return _cache_paths(name)[0]
+
+
+def load_table(name: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Returns the named table, reading only the given columns. Falls back to the
+    CSV if the table cannot be cached (e.g. pyarrow is missing).
+    """
+    if name not in TABLES:
+        raise KeyError(f"Unknown table '{name}'. Known tables: {', '.join(TABLES)}")
+
+    try:
+        return pd.read_parquet(table_path(name), columns=columns, engine="pyarrow")
+    except ImportError as e:
+        print(f"Columnar cache unavailable ({e}), reading {TABLES[name].path} directly")
+        return read_source(name, columns=columns)
+
+
+def table_for_path(path: str) -> str | None:
+    """Name of the table whose source is path, if it is one of TABLES."""
+    full_path = os.path.normpath(path if os.path.isabs(path) else os.path.join(REPO_ROOT, path))
+    for name in TABLES:
+        if os.path.normpath(source_path(name)) == full_path:
+            return name
+    return None
+
+
+def load_path(path: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Drop-in for pd.read_csv(path) in scripts that take file paths: known
+    sources go through the columnar cache, anything else is read as CSV.
+    Relative paths are taken from the repository root, like the scripts' defaults.
+    """
+    name = table_for_path(path)
+    if name is None:
+        return pd.read_csv(path, usecols=columns)
+    return load_table(name, columns=columns)
+
+
+if __name__ == "__main__":
+    for name in TABLES:
+        if not os.path.exists(source_path(name)):
+            print(f"{name}: source {TABLES[name].path} missing, skipped")
+            continue
+
+        start = time.perf_counter()
+        pd.read_csv(source_path(name), low_memory=False)
+        csv_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_table(name)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df = load_table(name)
+        cached_time = time.perf_counter() - start
+
+        csv_size = os.path.getsize(source_path(name)) / 1e6
+        parquet_size = os.path.getsize(_cache_paths(name)[0]) / 1e6
+        print(
+            f"{name}: {len(df):>7} rows, csv {csv_time:.2f}s ({csv_size:.1f}MB), "
+            f"first load {build_time:.2f}s, cached {cached_time:.3f}s ({parquet_size:.1f}MB)"
+        )
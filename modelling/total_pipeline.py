@@ -1,12 +1,11 @@
-import pandas as pd
 from datetime import datetime
+import sys
+import os
 
-from patient import Patient
-from priority_prepare import engineer_features, create_enhanced_numerical_dataset_for_priority
-from priority_run import train_and_evaluate_priority_model
-
-from professional_prepare import create_dataset_for_professional_type
-from professional_run import train_and_evaluate_professional_type_model
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.patient import Patient
+from modelling.inference import predict_batch
+from modelling.registry import ModelRegistry, get_registry
 
 patients: list[Patient] = [
     Patient(
@@ -27,48 +26,20 @@ patients: list[Patient] = [
     ),
 ]
 
-patient_columns = [
-    "sex",
-    "date_of_birth",
-    "date_referral_received",
-    "new_referral_notes",
-    "has_cardiovascular_disease",
-    "has_digestive_disease",
-    "has_musculoskeletal_disease",
-    "has_respiratory_disease",
-    "comorbidity_count",
-    "total_requests",
-    "patient_is_on_cancer_pathway",
-]
-
-
-def run_whole_pipeline():
+def run_whole_pipeline(registry: ModelRegistry | None = None):
     # remaining_patients = [patient for patient in patients if not route_patient(patient)]
     remaining_patients = patients
 
-    create_enhanced_numerical_dataset_for_priority()
-    create_dataset_for_professional_type()
-
-    df = pd.DataFrame.from_records([patient.model_dump() for patient in remaining_patients])
-    df["date_referral_received"] = datetime.today()
-    df["new_referral_notes"] = df["issue"]
+    # Models are trained separately (python -m modelling.train) and only loaded here
+    registry = registry or get_registry()
 
-    comorb_cols = [c for c in df.columns if c.startswith("has_")]
-    df["comorbidity_count"] = df[comorb_cols].sum(axis=1)
-
-    df = df[patient_columns]
-
-    df_prio = engineer_features(df)
-    model_prio = train_and_evaluate_priority_model()
-    priorities = model_prio.predict(df_prio)
-
-    df_prof = engineer_features(df)
-    model_prof = train_and_evaluate_professional_type_model()
-    caregivers = model_prof.predict(df_prof)
+    predictions = predict_batch(remaining_patients, registry=registry)
+    priorities = predictions["priority"].tolist()
+    caregivers = predictions["professional_type"].tolist()
 
     print(priorities, caregivers)
-    # match_all(patients, priorities, caregivers)
-
-run_whole_pipeline()
-
+    # match_all(patients, priorities, caregivers)
 
+if __name__ == "__main__":
+    get_registry().load_all()
+    run_whole_pipeline()
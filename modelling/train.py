@@ -0,0 +1,43 @@
+"""
+Retrains the triage models and saves them for the model registry.
+
+Run from the repository root with `python -m modelling.train`, adding
+`--incremental` to only fold new GP requests into the datasets. Inference
+(modelling/total_pipeline.py, modelling/registry.py) only ever loads the saved
+artefacts, so this is the one place training happens.
+"""
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.priority_prepare import create_enhanced_numerical_dataset_for_priority
+from modelling.priority_run import train_and_evaluate_priority_model
+from modelling.professional_prepare import create_dataset_for_professional_type
+from modelling.professional_run import train_and_evaluate_professional_type_model
+from modelling.registry import get_registry, save_model
+
+
+def train_priority_model(incremental: bool = False):
+    create_enhanced_numerical_dataset_for_priority(incremental=incremental)
+    model = train_and_evaluate_priority_model()
+    if model is not None:
+        save_model("priority", model, model.get_booster().feature_names)
+    return model
+
+
+def train_professional_type_model(incremental: bool = False):
+    create_dataset_for_professional_type(incremental=incremental)
+    model = train_and_evaluate_professional_type_model()
+    if model is not None:
+        save_model("professional_type", model, model.get_booster().feature_names)
+    return model
+
+
+def train_all(incremental: bool = False):
+    train_priority_model(incremental=incremental)
+    train_professional_type_model(incremental=incremental)
+    get_registry().reload()
+
+
+if __name__ == "__main__":
+    train_all(incremental="--incremental" in sys.argv[1:])
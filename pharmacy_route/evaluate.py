@@ -0,0 +1,75 @@
+"""
+Bulk evaluation of the router over every GP request.
+
+Run from the repository root with `python -m pharmacy_route.evaluate`. Prints
+the fraction of requests resolved by the rule pre-filter alone (no LLM call),
+then the fraction that could have been handled by a pharmacist.
+"""
+import pandas as pd
+from pydantic import ValidationError
+
+from .pharmacy import RULE_ENGINE, get_nearest_pharmacies, load_all_requests, pharmacy_conditions_dict
+from agent.agent import get_cache, run_agent_sync
+from modelling.patient import Patient
+
+
+def evaluate_rules(limit: int | None = None) -> dict:
+    """Runs the rule pre-filter over the GP requests and returns its stats."""
+    requests = load_all_requests()
+    if limit is not None:
+        requests = requests[:limit]
+
+    RULE_ENGINE.reset_stats()
+    for request in requests:
+        try:
+            patient = Patient(
+                family_id="",
+                id=str(request["patient_id"]),
+                issue=request["new_referral_notes"] if isinstance(request["new_referral_notes"], str) else None,
+                date_of_birth=pd.to_datetime(request["date_of_birth"]),
+                sex=str(request["sex"]).lower(),
+                # numpy bools and 0/1 ints too, not only Python True; missing counts as not on the pathway
+                patient_is_on_cancer_pathway=bool(pd.notna(request["patient_is_on_cancer_pathway"]) and request["patient_is_on_cancer_pathway"]),
+            )
+        except (ValidationError, ValueError):
+            continue
+
+        RULE_ENGINE.evaluate(patient)
+
+    return RULE_ENGINE.stats()
+
+
+def evaluate_pharmacy_agent(limit: int | None = None) -> float:
+    requests = load_all_requests()
+    if limit is not None:
+        requests = requests[:limit]
+
+    total = len(requests)
+    could_use_pharmacist = 0
+    for request in requests:
+        output = run_agent_sync("pharmacy", request["new_referral_notes"])
+
+        can_use_pharmacist = False
+        output_condition = None
+
+        if output.condition:
+            if condition := pharmacy_conditions_dict.get(output.condition):
+                output_condition = condition.condition
+                if not condition.requirement_matcher or condition.requirement_matcher(input_df={"age": 20, "sex": request["sex"]}):
+                    can_use_pharmacist = True
+
+        if can_use_pharmacist:
+            could_use_pharmacist += 1
+            print(f"You are able to visit a pharmacist for {output_condition}, loading nearest pharmacies...")
+            get_nearest_pharmacies(request["patient_id"])
+
+    return could_use_pharmacist / total if total else 0.0
+
+
+if __name__ == "__main__":
+    rule_stats = evaluate_rules()
+    print(f"Resolved without an LLM call: {rule_stats['resolved_fraction']:.1%} of {rule_stats['evaluated']} requests")
+    print(rule_stats["by_rule"])
+
+    print(evaluate_pharmacy_agent())
+    print(f"LLM cache: {get_cache().stats()}")
@@ -5,6 +5,16 @@ import os
 # Add parent directory to path to import Patient
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from modelling.patient import Patient
+from modelling.keyword_matcher import KeywordMatcher
+
+# Simple keyword-based routing for demonstration
+PHARMACY_KEYWORDS = ["hay fever", "sneezing", "allergies", "cold", "headache", "sore throat"]
+NURSE_KEYWORDS = ["vaccine", "vaccination", "blood test", "blood pressure", "diabetes", "routine"]
+URGENT_KEYWORDS = ["chest pain", "difficulty breathing", "severe", "urgent", "emergency", "blood"]
+
+# One automaton over all three lists, so each issue is scanned once. Substring
+# matches, as before, so "vaccinations", "bloody" and "severely" still count
+ROUTE_KEYWORD_MATCHER = KeywordMatcher(PHARMACY_KEYWORDS + NURSE_KEYWORDS + URGENT_KEYWORDS, word_boundaries=False)
 
 
 class MockUrgencyOutput:
@@ -18,24 +28,20 @@ def mock_route_patient(patient: Patient) -> Tuple[Literal["pharmacist", "nurse",
     """
     Mock version of route_patient for testing without requiring API keys
     """
-    issue = patient.issue.lower() if patient.issue else ""
-
-    # Simple keyword-based routing for demonstration
-    pharmacy_keywords = ["hay fever", "sneezing", "allergies", "cold", "headache", "sore throat"]
-    nurse_keywords = ["vaccine", "vaccination", "blood test", "blood pressure", "diabetes", "routine"]
-    urgent_keywords = ["chest pain", "difficulty breathing", "severe", "urgent", "emergency", "blood"]
+    # Overlapping so "blood" is still seen inside "blood test"
+    matched = {keyword for _, _, keyword in ROUTE_KEYWORD_MATCHER.finditer(patient.issue or "", overlapping=True)}
 
     # Check for pharmacy conditions
-    if any(keyword in issue for keyword in pharmacy_keywords):
+    if matched.intersection(PHARMACY_KEYWORDS):
         return "pharmacist", None
 
     # Check for nurse conditions
-    if any(keyword in issue for keyword in nurse_keywords):
+    if matched.intersection(NURSE_KEYWORDS):
         urgency = MockUrgencyOutput(0, ["routine care"])
         return "nurse", urgency
 
     # Check for urgent conditions
-    if any(keyword in issue for keyword in urgent_keywords):
+    if matched.intersection(URGENT_KEYWORDS):
         urgency = MockUrgencyOutput(2, ["urgent", "severe symptoms"])
         return "GP", urgency
 
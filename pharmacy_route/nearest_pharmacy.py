@@ -0,0 +1,181 @@
+"""
+Prebuilt nearest-pharmacy lookup.
+
+datasets/patients_nearest_pharmacies.csv holds one row per (patient, nearby
+point of interest). Rather than re-reading it for every routing decision, it is
+converted once into a directory of .npy arrays: patient ids sorted for binary
+search, plus per-patient slices of pharmacy names and distances ranked nearest
+first. The arrays are memory-mapped, so loading is near-instant and a lookup is
+a single searchsorted.
+
+meta.json records what the index was built from. An index converted from the
+CSV is rebuilt only when the CSV's contents change (size, then SHA-256), not
+when it is merely touched or checked out again. An index written by
+pharmacy_builder.py is never replaced by the CSV. If the CSV cannot be read
+(e.g. it is a Git LFS pointer), the persisted index is served with a warning.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.tables import file_checksum
+
+NEAREST_PHARMACIES_CSV = "datasets/patients_nearest_pharmacies.csv"
+NEAREST_PHARMACIES_INDEX = "datasets/patients_nearest_pharmacies_index"
+DEFAULT_K = 5
+# meta.json "built_from" of indexes converted from NEAREST_PHARMACIES_CSV
+BUILT_FROM_CSV = "csv"
+
+_ARRAYS = ("person_ids", "offsets", "names", "distances")
+
+
+class NearestPharmacyIndex:
+    def __init__(self, person_ids: np.ndarray, offsets: np.ndarray, names: np.ndarray, distances: np.ndarray):
+        # person_ids[i]'s pharmacies are names[offsets[i]:offsets[i + 1]], nearest first
+        self.person_ids = person_ids
+        self.offsets = offsets
+        self.names = names
+        self.distances = distances
+
+    def __len__(self) -> int:
+        return len(self.person_ids)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, k: int | None = DEFAULT_K, distance_col: str = "distance") -> "NearestPharmacyIndex":
+        """
+        Builds the index from a frame with person_id, fclass and name columns.
+        Rows are ranked by distance_col when present, otherwise the order of the
+        frame is assumed to already be nearest first. Only the k nearest
+        pharmacies per patient are kept (all of them if k is None).
+        """
+        df = df[df["fclass"] == "pharmacy"]
+        has_distance = distance_col in df.columns
+
+        sort_cols = ["person_id", distance_col] if has_distance else ["person_id"]
+        df = df.sort_values(sort_cols, kind="stable")
+        if k is not None:
+            df = df.groupby("person_id", sort=False).head(k)
+
+        person_ids, starts = np.unique(df["person_id"].astype(str).to_numpy(), return_index=True)
+        offsets = np.append(starts, len(df)).astype(np.int64)
+        names = df["name"].fillna("").astype(str).to_numpy().astype(str)
+        distances = df[distance_col].to_numpy(dtype=np.float64) if has_distance else np.full(len(df), np.nan)
+
+        return cls(person_ids.astype(str), offsets, names, distances)
+
+    @classmethod
+    def from_csv(cls, path: str = NEAREST_PHARMACIES_CSV, k: int | None = DEFAULT_K, distance_col: str = "distance") -> "NearestPharmacyIndex":
+        return cls.from_frame(pd.read_csv(path), k=k, distance_col=distance_col)
+
+    def save(self, path: str = NEAREST_PHARMACIES_INDEX, built_from: str = BUILT_FROM_CSV, source: dict | None = None) -> None:
+        """Writes the arrays and meta.json; source describes the file the index was built from, if any."""
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"patients": len(self), "rows": len(self.names), "built_from": built_from, "source": source}, f)
+
+    @classmethod
+    def load(cls, path: str = NEAREST_PHARMACIES_INDEX, mmap: bool = True) -> "NearestPharmacyIndex":
+        mmap_mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in _ARRAYS}
+        return cls(**arrays)
+
+    def lookup(self, person_id: str, k: int = 3) -> list[dict]:
+        """Returns up to k pharmacies nearest to the patient, nearest first."""
+        i = np.searchsorted(self.person_ids, person_id)
+        if i == len(self.person_ids) or self.person_ids[i] != person_id:
+            return []
+
+        start = int(self.offsets[i])
+        end = min(int(self.offsets[i + 1]), start + k)
+
+        return [
+            {
+                "name": str(self.names[j]),
+                "distance": None if np.isnan(self.distances[j]) else float(self.distances[j]),
+            }
+            for j in range(start, end)
+        ]
+
+
+_index: NearestPharmacyIndex | None = None
+_index_lock = threading.Lock()
+
+
+def csv_source(csv_path: str) -> dict:
+    return {"path": csv_path, "size": os.path.getsize(csv_path), "sha256": file_checksum(csv_path)}
+
+
+def _has_index(index_path: str) -> bool:
+    return all(os.path.exists(os.path.join(index_path, f"{name}.npy")) for name in _ARRAYS)
+
+
+def _index_is_stale(csv_path: str, index_path: str) -> bool:
+    meta_path = os.path.join(index_path, "meta.json")
+    if not (os.path.exists(meta_path) and _has_index(index_path)):
+        return True
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    # Indexes from pharmacy_builder.py are not derived from the CSV
+    if meta.get("built_from", BUILT_FROM_CSV) != BUILT_FROM_CSV or not os.path.exists(csv_path):
+        return False
+
+    source = meta.get("source") or {}
+    if source.get("size") != os.path.getsize(csv_path):
+        return True
+    return source.get("sha256") != file_checksum(csv_path)
+
+
+def get_nearest_pharmacy_index(csv_path: str = NEAREST_PHARMACIES_CSV, index_path: str = NEAREST_PHARMACIES_INDEX) -> NearestPharmacyIndex:
+    """
+    Returns the process-wide index, loading it on first use. The persisted
+    index is (re)built from the CSV if missing or if the CSV's contents
+    changed since it was converted.
+    """
+    global _index
+
+    if _index is not None:
+        return _index
+
+    with _index_lock:
+        if _index is None:
+            if _index_is_stale(csv_path, index_path):
+                print(f"Building nearest pharmacy index from {csv_path}...")
+                try:
+                    index = NearestPharmacyIndex.from_csv(csv_path)
+                except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+                    if not _has_index(index_path):
+                        raise
+                    print(f"Warning: could not build the nearest pharmacy index from {csv_path} ({e!r}), using the existing index at {index_path}")
+                else:
+                    index.save(index_path, source=csv_source(csv_path))
+
+            _index = NearestPharmacyIndex.load(index_path)
+
+    return _index
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    index = NearestPharmacyIndex.from_csv()
+    index.save(source=csv_source(NEAREST_PHARMACIES_CSV))
+    print(f"Built index for {len(index)} patients in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    index = NearestPharmacyIndex.load()
+    print(f"Loaded index in {(time.perf_counter() - start) * 1e3:.2f}ms")
+
+    sample = index.person_ids[np.random.default_rng(0).integers(0, len(index), size=10_000)]
+    start = time.perf_counter()
+    for person_id in sample:
+        index.lookup(str(person_id))
+    print(f"Average lookup: {(time.perf_counter() - start) / len(sample) * 1e6:.1f}us")
@@ -3,23 +3,26 @@ from pydantic_ai import Agent
 from pydantic import BaseModel, Field, ConfigDict
 import pandas as pd
 from typing import Callable, Literal
-from functools import partial
+from functools import lru_cache, partial
 from datetime import datetime
 from .cancer_symptom_context import CANCER_SYMPTOMS_CONTEXT
+from .nearest_pharmacy import get_nearest_pharmacy_index
+from .rules import RuleDecision, build_default_rule_engine
+import asyncio
 import sys
 import os
 
 # Add parent directory to path to import Patient
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from modelling.patient import Patient
+from agent.agent import get_agent, register_agent, run_agent, run_agent_sync
 
-def get_nearest_pharmacies(patient_id: str):
-    df = pd.read_csv("datasets/patients_nearest_pharmacies.csv")
-    try:
-        df = df[(df["person_id"] == patient_id) & (df["fclass"] == "pharmacy")]
-        print(f"Your nearest pharmacy is {df.iloc[0]['name']}")
-    except Exception as e:
-        pass
+def get_nearest_pharmacies(patient_id: str, k: int = 3) -> list[dict]:
+    pharmacies = get_nearest_pharmacy_index().lookup(patient_id, k=k)
+    if pharmacies:
+        print(f"Your nearest pharmacy is {pharmacies[0]['name']}")
+
+    return pharmacies
 
 class PharmacyCondition(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -48,6 +51,8 @@ def matcher(min_age: int, max_age: int | None, sexes_allowed: Literal["male", "f
     if not sexes_allowed == "both":
         return sex == sexes_allowed
 
+    return True
+
 impetigo = PharmacyCondition(
     condition="impetigo",
     requirement_matcher=partial(matcher, min_age=1, max_age=None, sexes_allowed="both"),
@@ -132,6 +137,8 @@ pharmacy_conditions_dict = {condition.condition: condition for condition in all_
 all_nurse_conditions = [long_term_condition_management, vaccinations, screenings, minor_injuries, blood_tests, routine]
 nurse_conditions_dict = {condition.condition: condition for condition in all_nurse_conditions}
 
+RULE_ENGINE = build_default_rule_engine(all_pharmacy_conditions, all_nurse_conditions)
+
 class NurseConditionOutput(BaseModel):
     condition: str | None = Field(
         description=f"One of {', '.join(condition.condition for condition in all_nurse_conditions)} if the treatment applies to the issue, else return None"
@@ -147,67 +154,111 @@ INPUT_DATA = {
     "patient_id": "oT8E8MACMMNXTRj0",
 }
 
-gp_request = pd.read_csv("./datasets/gp_request.csv")
-patient = pd.read_csv("./datasets/patients.csv")
+@lru_cache(maxsize=None)
+def load_all_requests(gp_request_path: str = "./datasets/gp_request.csv", patients_path: str = "./datasets/patients.csv") -> list[dict]:
+    """Every GP request joined to the requesting patient's sex and date of birth, read on first use and cached."""
+    gp_request = pd.read_csv(gp_request_path, usecols=["patient_id", "new_referral_notes", "patient_is_on_cancer_pathway"])
+    patients = pd.read_csv(patients_path, usecols=["person_id", "sex", "date_of_birth"])
 
-all = gp_request.merge(patient, left_on="patient_id", right_on="person_id")
+    merged = gp_request.merge(patients, left_on="patient_id", right_on="person_id")
 
-ALL_REQUESTS = all[["sex", "new_referral_notes"]].to_dict(orient="records")
+    return merged[["patient_id", "sex", "date_of_birth", "patient_is_on_cancer_pathway", "new_referral_notes"]].to_dict(orient="records")
 
-def run_pharmacy_agent(patient: Patient):
-    agent = Agent(
+def __getattr__(name: str):
+    # Keeps `from pharmacy_route.pharmacy import ALL_REQUESTS` working without loading it at import time
+    if name == "ALL_REQUESTS":
+        return load_all_requests()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@register_agent("pharmacy")
+def pharmacy_agent_config() -> dict:
+    return dict(
         model="claude-3-haiku-20240307",
         system_prompt="You are a medical assistant to determine whether the given symptoms from a patient may be solved by a pharmacist. If you determine no treatment suffices, return None.",
         output_type=PharmacyConditionOutput,
     )
 
-    result = agent.run_sync(
-        patient.issue,
-    )
+def pharmacy_agent() -> Agent:
+    return get_agent("pharmacy")
 
-    can_use_pharmacist = False
-    output_condition = None
-
-    if result.output.condition:
-        if condition := pharmacy_conditions_dict.get(result.output.condition):
-            output_condition = condition.condition
+def pharmacy_condition_for(patient: Patient, output: PharmacyConditionOutput) -> str | None:
+    """Returns the matched pharmacy condition if the patient is eligible to be treated for it by a pharmacist."""
+    if output.condition:
+        if condition := pharmacy_conditions_dict.get(output.condition):
             # if not condition.requirement_matcher or condition.requirement_matcher(input_df=INPUT_DATA["patient_info"]):
             if not condition.requirement_matcher or condition.requirement_matcher(input_df={"age": patient.age, "sex": patient.sex}):
-                can_use_pharmacist = True
+                return condition.condition
+
+    return None
+
+def run_pharmacy_agent(patient: Patient):
+    output = run_agent_sync("pharmacy", patient.issue)
+
+    output_condition = pharmacy_condition_for(patient, output)
 
-    if can_use_pharmacist:
+    if output_condition:
         print(f"You are able to visit a pharmacist for {output_condition}, loading nearest pharmacies...")
-        get_nearest_pharmacies(INPUT_DATA["patient_id"])
+        get_nearest_pharmacies(patient.id)
 
-    return "pharmacist" if can_use_pharmacist else None
+    return "pharmacist" if output_condition else None
 
-def run_nurse_agent(patient: Patient):
-    agent = Agent(
+async def run_pharmacy_agent_async(patient: Patient):
+    output = await run_agent("pharmacy", patient.issue)
+
+    output_condition = pharmacy_condition_for(patient, output)
+
+    if output_condition:
+        print(f"You are able to visit a pharmacist for {output_condition}, loading nearest pharmacies...")
+        # The lookup reads from disk, so keep it off the event loop
+        await asyncio.to_thread(get_nearest_pharmacies, patient.id)
+
+    return "pharmacist" if output_condition else None
+
+@register_agent("nurse")
+def nurse_agent_config() -> dict:
+    return dict(
         model="claude-3-haiku-20240307",
         system_prompt=f"You are a medical assistant to determine whether the given symptoms and details from a patient may be solved by a nurse. You can choose from: {', '.join(condition.condition for condition in all_nurse_conditions)}. If any indications of worsening conditions are shown in the issue or patient history, you MUST return None. If you determine no treatment suffices, return None.",
         output_type=NurseConditionOutput,
     )
 
-    result = agent.run_sync(
-        {
-            "history": patient.history,
-            "issue": patient.issue,
-            "age": patient.age,
-            "sex": patient.sex,
-            "existing_conditions": patient.comorbidities,
-        }
-    )
+def nurse_agent() -> Agent:
+    return get_agent("nurse")
+
+def nurse_prompt(patient: Patient) -> dict:
+    return {
+        "history": patient.history,
+        "issue": patient.issue,
+        "age": patient.age,
+        "sex": patient.sex,
+        "existing_conditions": patient.comorbidities,
+    }
+
+def nurse_condition_for(output: NurseConditionOutput) -> str | None:
+    if output.condition and output.condition != "None":
+        return output.condition
+
+    return None
+
+def run_nurse_agent(patient: Patient):
+    output = run_agent_sync("nurse", nurse_prompt(patient))
+
+    output_condition = nurse_condition_for(output)
 
-    can_use_nurse = False
-    output_condition = None
+    if output_condition:
+        print(f"You are able to visit a nurse for {output_condition}")
+
+    return "nurse" if output_condition else None
 
-    if result.output.condition and result.output.condition != "None":
-        can_use_nurse = True
+async def run_nurse_agent_async(patient: Patient):
+    output = await run_agent("nurse", nurse_prompt(patient))
 
-    if can_use_nurse:
+    output_condition = nurse_condition_for(output)
+
+    if output_condition:
         print(f"You are able to visit a nurse for {output_condition}")
 
-    return "nurse" if can_use_nurse else None    
+    return "nurse" if output_condition else None
 
 class PatientHistory(BaseModel):
     time_of_record: datetime | None = Field(
@@ -243,25 +294,33 @@ class ProfessionalOutput(BaseModel):
         description="A list of any relevant medical history entries that you find that inform your decision.",
     )
 
-def run_urgency_agent(patient: Patient) -> UrgencyOutput:
+@register_agent("urgency")
+def urgency_agent_config() -> dict:
     all_context = "\n".join([f"{k}: {v}" for k, v in urgency_mapping.items()]) + "\n" + CANCER_SYMPTOMS_CONTEXT + "\n"
 
-    agent = Agent(
+    return dict(
         model="claude-3-haiku-20240307",
         system_prompt=all_context + "You are a medical assistant trying to determine the level of urgency for a GP appointment request. Urgency should be extremely high if the issue given relates to existing health conditions and has worsened recently.",
         output_type=UrgencyOutput,
     )
 
-    result = agent.run_sync(f"""
+def urgency_agent() -> Agent:
+    return get_agent("urgency")
+
+def urgency_prompt(patient: Patient) -> str:
+    return f"""
 
         history: {patient.history}
         issue: {patient.issue}
         sex: {patient.sex}
         health_profile: {patient.comorbidities}
         """
-    )
 
-    return result.output
+def run_urgency_agent(patient: Patient) -> UrgencyOutput:
+    return run_agent_sync("urgency", urgency_prompt(patient))
+
+async def run_urgency_agent_async(patient: Patient) -> UrgencyOutput:
+    return await run_agent("urgency", urgency_prompt(patient))
 
 # def run_bloods_agent(patient: Patient):
 #     agent = Agent(
@@ -282,7 +341,24 @@ urgency_mapping = {
     "urgent": "Urgent. Highest level of urgency. ",
 }
 
+def route_from_rules(patient) -> tuple[Literal["pharmacist", "nurse", "GP"], UrgencyOutput | None] | None:
+    """Routes the patient with the deterministic rules alone, or returns None if the agents are needed."""
+    decision: RuleDecision | None = RULE_ENGINE.evaluate(patient)
+    if decision is None:
+        return None
+
+    if decision.provider == "pharmacist":
+        print(f"You are able to visit a pharmacist for {decision.condition}, loading nearest pharmacies...")
+        return "pharmacist", None
+
+    return decision.provider, UrgencyOutput(urgency=decision.urgency or 0, keywords=decision.keywords)
+
 def route_patient(patient) -> Literal["pharmacist", "nurse", "GP"]:
+    if routed := route_from_rules(patient):
+        if routed[0] == "pharmacist":
+            get_nearest_pharmacies(patient.id)
+        return routed
+
     if run_pharmacy_agent(patient):
         return "pharmacist", None
     
@@ -296,6 +372,40 @@ def route_patient(patient) -> Literal["pharmacist", "nurse", "GP"]:
     
     return "GP", urgency
 
+async def route_patient_async(patient) -> tuple[Literal["pharmacist", "nurse", "GP"], UrgencyOutput | None]:
+    """
+    Async version of route_patient. The pharmacy, urgency and nurse agents are
+    started together, so latency is roughly that of the slowest single call
+    instead of the sum of all three. The urgency and nurse calls are speculative
+    and get cancelled as soon as the pharmacy agent routes to a pharmacist.
+    """
+    if routed := route_from_rules(patient):
+        if routed[0] == "pharmacist":
+            await asyncio.to_thread(get_nearest_pharmacies, patient.id)
+        return routed
+
+    pharmacy_task = asyncio.create_task(run_pharmacy_agent_async(patient))
+    urgency_task = asyncio.create_task(run_urgency_agent_async(patient))
+    nurse_task = asyncio.create_task(run_nurse_agent_async(patient))
+
+    try:
+        if await pharmacy_task:
+            return "pharmacist", None
+
+        urgency, nurse = await asyncio.gather(urgency_task, nurse_task)
+    finally:
+        # Cancels the speculative calls on the pharmacist path, or whatever is
+        # still running if one of the agents raised
+        pending = [task for task in (urgency_task, nurse_task) if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if nurse:
+        return "nurse", urgency
+
+    return "GP", urgency
+
 if __name__ == "__main__":
     patients: list[Patient] = [
         Patient(
@@ -331,37 +441,3 @@ if __name__ == "__main__":
 
     for patient in patients:
         print(route_patient(patient))
-
-# if __name__ == "__main__":
-#     agent = Agent(
-#         model="claude-3-haiku-20240307",
-#         system_prompt="You are a medical assistant to determine whether the given symptoms from a patient may be solved by a pharmacist. If you determine no treatment suffices, return None.",
-#         output_type=PharmacyConditionOutput,
-#     )
-
-#     total = len(ALL_REQUESTS)
-#     could_use_pharmacist = 0
-#     for request in ALL_REQUESTS:
-#         # result = agent.run_sync(
-#         #     INPUT_DATA["free_text"]
-#         # )
-#         result = agent.run_sync(
-#             request["new_referral_notes"],
-#         )
-
-#         can_use_pharmacist = False
-#         output_condition = None
-
-#         if result.output.condition:
-#             if condition := pharmacy_conditions_dict.get(result.output.condition):
-#                 output_condition = condition.condition
-#                 # if not condition.requirement_matcher or condition.requirement_matcher(input_df=INPUT_DATA["patient_info"]):
-#                 if not condition.requirement_matcher or condition.requirement_matcher(input_df={"age": 20, "sex": request["sex"]}):
-#                     can_use_pharmacist = True
-
-#         if can_use_pharmacist:
-#             could_use_pharmacist += 1
-#             print(f"You are able to visit a pharmacist for {output_condition}, loading nearest pharmacies...")
-#             get_nearest_pharmacies(INPUT_DATA["patient_id"])
-    
-#     print(could_use_pharmacist / total)
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Builds the nearest-pharmacy index from patient and pharmacy coordinates.
+
+datasets/patients_nearest_pharmacies.csv was produced outside the repo. This
+rebuilds the same lookup from the patient coordinates in
+assign_patients_to_clinic/data/patients_plus_lat_long.csv and a local
+pharmacy points file (a CSV with a name and lat/long per point, e.g. an
+OpenStreetMap POI extract, filtered on fclass == "pharmacy" when it has that
+column). A haversine BallTree is built once over the pharmacies and queried
+for the k nearest per patient in batches on a thread pool; the tree query
+releases the GIL, so the batches run on all cores without copying the tree
+into worker processes. The result is written with NearestPharmacyIndex.save,
+so the router loads it directly and does not rebuild it from the CSV.
+
+Run from the repository root:
+    python -m pharmacy_route.pharmacy_builder path/to/pharmacies.csv [k] [path/to/patient_coords.csv]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.tables import load_path
+from pharmacy_route.nearest_pharmacy import DEFAULT_K, NEAREST_PHARMACIES_INDEX, NearestPharmacyIndex
+
+PATIENT_COORDS_PATH = "assign_patients_to_clinic/data/patients_plus_lat_long.csv"
+# Mean Earth radius, distances are in metres
+EARTH_RADIUS_M = 6_371_008.8
+BATCH_SIZE = 5_000
+
+
+def load_pharmacies(path: str, name_col: str = "name", lat_col: str = "lat", lon_col: str = "long", fclass_col: str = "fclass") -> pd.DataFrame:
+    """Pharmacy points as name, lat and long."""
+    pharmacies = pd.read_csv(path)
+    if fclass_col in pharmacies.columns:
+        pharmacies = pharmacies[pharmacies[fclass_col] == "pharmacy"]
+    pharmacies = pharmacies.rename(columns={name_col: "name", lat_col: "lat", lon_col: "long"})
+    return pharmacies[["name", "lat", "long"]].dropna(subset=["lat", "long"]).reset_index(drop=True)
+
+
+def load_patient_coords(path: str = PATIENT_COORDS_PATH) -> pd.DataFrame:
+    """One row per patient with person_id, lat and long."""
+    patients = load_path(path, columns=["person_id", "lat", "long"]).dropna()
+    return patients.assign(person_id=patients["person_id"].astype(str)).drop_duplicates("person_id").reset_index(drop=True)
+
+
+def _radians(df: pd.DataFrame) -> np.ndarray:
+    return np.radians(df[["lat", "long"]].to_numpy(dtype=np.float64))
+
+
+def nearest_pharmacies(
+    patients: pd.DataFrame,
+    pharmacies: pd.DataFrame,
+    k: int = DEFAULT_K,
+    batch_size: int = BATCH_SIZE,
+    workers: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Positions in pharmacies of the k nearest to each patient, nearest first,
+    and the distances in metres, both shaped (len(patients), k).
+    """
+    if pharmacies.empty:
+        raise ValueError("No pharmacy points to search")
+    k = min(k, len(pharmacies))
+    tree = BallTree(_radians(pharmacies), metric="haversine")
+    points = _radians(patients)
+
+    indices = np.empty((len(points), k), dtype=np.int64)
+    distances = np.empty((len(points), k), dtype=np.float64)
+
+    def query(start: int) -> None:
+        end = min(start + batch_size, len(points))
+        distances[start:end], indices[start:end] = tree.query(points[start:end], k=k, sort_results=True)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(query, range(0, len(points), batch_size)))
+
+    return indices, distances * EARTH_RADIUS_M
+
+
+def build_nearest_pharmacy_index(patients: pd.DataFrame, pharmacies: pd.DataFrame, k: int = DEFAULT_K, **kwargs) -> NearestPharmacyIndex:
+    indices, distances = nearest_pharmacies(patients, pharmacies, k=k, **kwargs)
+
+    # The index keeps patients sorted by id for binary search, each with a fixed run of k rows
+    order = np.argsort(patients["person_id"].to_numpy().astype(str), kind="stable")
+    k = indices.shape[1]
+    names = pharmacies["name"].fillna("").astype(str).to_numpy().astype(str)
+
+    return NearestPharmacyIndex(
+        person_ids=patients["person_id"].to_numpy().astype(str)[order],
+        offsets=np.arange(len(order) + 1, dtype=np.int64) * k,
+        names=names[indices[order].ravel()],
+        distances=distances[order].ravel(),
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_K
+    patients_path = sys.argv[3] if len(sys.argv) > 3 else PATIENT_COORDS_PATH
+    patients = load_patient_coords(patients_path)
+    pharmacies = load_pharmacies(sys.argv[1])
+
+    start = time.perf_counter()
+    index = build_nearest_pharmacy_index(patients, pharmacies, k=k)
+    build_time = time.perf_counter() - start
+
+    # Recorded as built here, so the router never replaces it with a conversion of the CSV
+    index.save(NEAREST_PHARMACIES_INDEX, built_from="pharmacy_builder", source={"pharmacies": sys.argv[1], "patients": patients_path, "k": k})
+    print(f"{len(patients)} patients x {len(pharmacies)} pharmacies, k={k}: built in {build_time:.2f}s on {os.cpu_count()} cores")
+    print(f"Saved to {NEAREST_PHARMACIES_INDEX}")
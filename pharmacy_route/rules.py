@@ -0,0 +1,248 @@
+"""
+Deterministic rules applied before any LLM call.
+
+High-confidence keyword rules (red-flag symptoms, pharmacy conditions with
+their age/sex requirements, routine nurse work) resolve a request on their
+own; anything ambiguous returns None and falls through to the agents. The
+engine keeps counters so the share of requests resolved without an LLM call
+can be tracked.
+"""
+import sys
+import os
+import re
+import threading
+from collections import Counter
+from typing import Callable, Literal
+
+from pydantic import BaseModel, ConfigDict, Field
+
+# Add parent directory to path to import the shared keyword matcher
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelling.keyword_matcher import KeywordMatcher
+
+
+class Rule(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str
+    keywords: list[str] = Field(
+        description="Phrases that trigger the rule, matched case-insensitively on word boundaries.",
+    )
+    provider: Literal["pharmacist", "nurse", "GP"]
+    urgency: Literal[0, 1, 2] | None = Field(
+        default=None,
+        description="Urgency to attach to the decision, if any.",
+    )
+    condition: str | None = Field(
+        default=None,
+        description="The pharmacy or nurse condition the rule stands for.",
+    )
+    requirement_matcher: Callable[..., bool] | None = Field(
+        default=None,
+        description="Age/sex requirement the patient must also meet, as on PharmacyCondition.",
+    )
+    guarded: bool = Field(
+        default=True,
+        description="Whether guard phrases (worsening symptoms, cancer pathway) stop the rule from firing.",
+    )
+    negatable: bool = Field(
+        default=True,
+        description="Whether a keyword negated earlier in its clause (\"no chest pain\", \"no sore throat\") is ignored.",
+    )
+
+
+class RuleDecision(BaseModel):
+    rule: str
+    provider: Literal["pharmacist", "nurse", "GP"]
+    urgency: Literal[0, 1, 2] | None = None
+    condition: str | None = None
+    keywords: list[str]
+
+
+class RuleEngine:
+    def __init__(self, rules: list[Rule], guard_keywords: list[str] | None = None, enabled: bool = True):
+        # Rules are tried in order; the first one that fires decides
+        self.rules = rules
+        self.guard_keywords = guard_keywords or []
+        self.enabled = enabled
+
+        # A single automaton over every rule and guard keyword, so each issue is scanned once
+        self._rule_keywords = [{k.lower() for k in rule.keywords} for rule in rules]
+        self._guard_keywords = {k.lower() for k in self.guard_keywords}
+        self._matcher = KeywordMatcher([k for rule in rules for k in rule.keywords] + self.guard_keywords)
+
+        self._lock = threading.Lock()
+        self._evaluated = 0
+        self._resolved = Counter()
+
+    def evaluate(self, patient) -> RuleDecision | None:
+        """Returns a decision if a rule confidently applies to the patient, else None."""
+        decision = self._evaluate(patient) if self.enabled else None
+
+        with self._lock:
+            self._evaluated += 1
+            if decision:
+                self._resolved[decision.rule] += 1
+
+        return decision
+
+    def _evaluate(self, patient) -> RuleDecision | None:
+        if not patient.issue:
+            return None
+
+        # Overlapping so a guard phrase cannot hide a rule keyword and vice versa
+        spans = list(self._matcher.finditer(patient.issue, overlapping=True))
+        found = [keyword for _, _, keyword in spans]
+        affirmed = [keyword for start, _, keyword in spans if not is_negated(patient.issue, start)]
+        guarded = bool(patient.patient_is_on_cancer_pathway) or not self._guard_keywords.isdisjoint(found)
+
+        for rule, rule_keywords in zip(self.rules, self._rule_keywords):
+            if rule.guarded and guarded:
+                continue
+
+            matches = [keyword for keyword in (affirmed if rule.negatable else found) if keyword in rule_keywords]
+            if not matches:
+                continue
+
+            if rule.requirement_matcher and not rule.requirement_matcher(input_df={"age": patient.age, "sex": patient.sex}):
+                continue
+
+            return RuleDecision(
+                rule=rule.name,
+                provider=rule.provider,
+                urgency=rule.urgency,
+                condition=rule.condition,
+                keywords=list(dict.fromkeys(matches)),
+            )
+
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            resolved = sum(self._resolved.values())
+            return {
+                "evaluated": self._evaluated,
+                "resolved_without_llm": resolved,
+                "resolved_fraction": resolved / self._evaluated if self._evaluated else 0.0,
+                "by_rule": dict(self._resolved),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._evaluated = 0
+            self._resolved.clear()
+
+
+# Words that negate a symptom named after them in the same clause
+NEGATION_CUES = ["no", "not", "denies", "denied", "denying", "without", "never", "nil", "negative for", "free of", "absence of"]
+NEGATION_WINDOW_WORDS = 4
+_CLAUSE_BREAK = re.compile(r"[.;:!?,()]|\bbut\b|\bhowever\b|\balthough\b")
+_NEGATION = re.compile(r"\b(?:" + "|".join(re.escape(cue) for cue in NEGATION_CUES) + r")\b")
+
+
+def is_negated(text: str, start: int) -> bool:
+    """Whether the phrase at text[start:] follows a negation cue within the last few words of its clause."""
+    before = text[:start].lower()
+    clause_breaks = list(_CLAUSE_BREAK.finditer(before))
+    if clause_breaks:
+        before = before[clause_breaks[-1].end():]
+    window = " ".join(before.split()[-NEGATION_WINDOW_WORDS:])
+    return bool(_NEGATION.search(window))
+
+
+RED_FLAG_KEYWORDS = [
+    "chest pain",
+    "difficulty breathing",
+    "struggling to breathe",
+    "can't breathe",
+    "coughing up blood",
+    "vomiting blood",
+    "slurred speech",
+    "facial drooping",
+    "seizure",
+    "unconscious",
+    "anaphylaxis",
+    "suicidal",
+    "overdose",
+]
+
+# Phrases that make an otherwise simple request ambiguous enough to need an agent
+GUARD_KEYWORDS = [
+    "worse",
+    "worsening",
+    "worsened",
+    "not improving",
+    "severe",
+    "persistent",
+    "recurring",
+    "blood in",
+    "lump",
+    "weight loss",
+    "pregnant",
+]
+
+PHARMACY_CONDITION_KEYWORDS = {
+    "impetigo": ["impetigo"],
+    "infected insect bites": ["infected insect bite", "infected insect bites", "infected bite"],
+    "earache": ["earache", "ear ache"],
+    "sore throat": ["sore throat"],
+    "sinusitis": ["sinusitis"],
+    "urinary tract infection": ["urinary tract infection", "uti", "cystitis"],
+    "shingles": ["shingles"],
+    "hay fever": ["hay fever", "hayfever"],
+}
+
+NURSE_CONDITION_KEYWORDS = {
+    "Immunisations, including flu and travel vaccinations": ["flu vaccine", "flu jab", "vaccination", "vaccine", "immunisation", "travel jabs"],
+    "Cervical screening (smear tests) and health checks": ["smear test", "cervical screening", "health check"],
+    "Taking blood samples (phlebotomy), performing electrocardiograms (ECGs) and taking other lab samples": ["blood test", "blood sample", "phlebotomy", "ecg"],
+    "Dressing wounds, removing stitches, minor injuries": ["stitches removed", "remove stitches", "removing stitches", "dressing change", "wound dressing"],
+    "Chronic condition care for asthma, diabetes, COPD": ["asthma review", "diabetes review", "copd review"],
+    "A routine appointment for an existing condition such as hypertension or diabetes that has showed no worsening.": ["blood pressure check", "medication review", "repeat prescription"],
+}
+
+
+# A vaccine request names the illness it protects against ("shingles vaccine", "flu jab"),
+# so these nurse rules are tried before the pharmacy condition rules
+NURSE_FIRST_CONDITIONS = ["Immunisations, including flu and travel vaccinations"]
+
+
+def build_default_rule_engine(pharmacy_conditions: list, nurse_conditions: list) -> RuleEngine:
+    """
+    Builds the default rule cascade: red flags first, then vaccinations, then
+    pharmacy conditions (with their requirement matchers), then the other
+    nurse conditions. Every rule ignores negated keywords, so "no sore throat"
+    falls through to the agents rather than to the sore throat rule.
+    """
+    rules = [
+        Rule(name="red_flag", keywords=RED_FLAG_KEYWORDS, provider="GP", urgency=2, guarded=False),
+    ]
+
+    def nurse_rule(condition) -> Rule:
+        return Rule(
+            name=f"nurse:{condition.condition}",
+            keywords=NURSE_CONDITION_KEYWORDS[condition.condition],
+            provider="nurse",
+            urgency=0,
+            condition=condition.condition,
+        )
+
+    for condition in nurse_conditions:
+        if condition.condition in NURSE_FIRST_CONDITIONS and condition.condition in NURSE_CONDITION_KEYWORDS:
+            rules.append(nurse_rule(condition))
+
+    for condition in pharmacy_conditions:
+        if keywords := PHARMACY_CONDITION_KEYWORDS.get(condition.condition):
+            rules.append(Rule(
+                name=f"pharmacy:{condition.condition}",
+                keywords=keywords,
+                provider="pharmacist",
+                condition=condition.condition,
+                requirement_matcher=condition.requirement_matcher,
+            ))
+
+    for condition in nurse_conditions:
+        if condition.condition not in NURSE_FIRST_CONDITIONS and condition.condition in NURSE_CONDITION_KEYWORDS:
+            rules.append(nurse_rule(condition))
+
+    return RuleEngine(rules, guard_keywords=GUARD_KEYWORDS)
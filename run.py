@@ -3,6 +3,8 @@ import numpy as np
 from anthropic import Anthropic
 from datetime import datetime
 
+from modelling.age import ages, get_reference_date
+
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
@@ -19,11 +21,7 @@ ROWS_LIMIT = 10
 
 def process_patient_data():
     patients["date_of_birth"] = pd.to_datetime(patients["date_of_birth"])
-
-    today = pd.to_datetime("today")
-    patients["age"] = (today.year - patients["date_of_birth"].dt.year) - (
-        (today.month, today.day) < (patients["date_of_birth"].dt.month, patients["date_of_birth"].dt.day)
-    )
+    patients["age"] = ages(patients["date_of_birth"], get_reference_date())
 
 
 def generate_comorbidity_column() -> pd.DataFrame:
@@ -0,0 +1,55 @@
+import dataclasses
+import os
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelling import incremental
+from modelling.incremental import PRIORITY_DATASET, PROFESSIONAL_DATASET, update_dataset
+
+REFERENCE_DATE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(incremental, "STATE_DIR", str(tmp_path / "state"))
+
+    pd.DataFrame({
+        "referral_id": ["r0", "r1", "r2", "r3", "r4", "r5"],
+        "patient_id": ["p0", "p0", "p1", "p2", "p3", "p1"],
+        "date_referral_received": ["2024-06-01"] * 6,
+        "new_referral_notes": ["urgent chest pain", "routine review", "cough", "rash", "fever", "repeat prescription"],
+        "patient_is_on_cancer_pathway": [False] * 6,
+        # r3 has no target, p3 (r4) has no date of birth, r5 is neither a GP nor a Nurse appointment
+        "priority": ["Urgent", "Routine", "Routine", None, "Routine", "Routine"],
+        "requested_appointment_type": ["GP Appointment", "Nurse Appointment", "GP Appointment", "GP Appointment", "GP Appointment", "Pharmacist"],
+    }).to_csv(tmp_path / "gp_request.csv", index=False)
+    pd.DataFrame({
+        "person_id": ["p0", "p1", "p2", "p3"],
+        "date_of_birth": ["1960-01-01", "1990-05-05", "1975-03-03", None],
+        "sex": ["male", "female", "female", "male"],
+    }).to_csv(tmp_path / "patients.csv", index=False)
+    pd.DataFrame({
+        "patient_id": ["p0", "p2"],
+        "Condition_Category": ["Respiratory Disease", "Cardiovascular disease"],
+    }).to_csv(tmp_path / "comorbidities.csv", index=False)
+
+    return tmp_path
+
+
+@pytest.mark.parametrize("spec", [PRIORITY_DATASET, PROFESSIONAL_DATASET])
+def test_second_run_without_new_requests_does_nothing(sources, spec, capsys):
+    spec = dataclasses.replace(spec, label_mapping_path=str(sources / f"{spec.name}_label_mapping.json"))
+    paths = [str(sources / name) for name in ("gp_request.csv", "patients.csv", "comorbidities.csv", "training.csv")]
+
+    first = update_dataset(spec, *paths, reference_date=REFERENCE_DATE)
+    assert first is not None
+    assert len(first) < 6  # some requests were dropped
+
+    capsys.readouterr()
+    assert update_dataset(spec, *paths, reference_date=REFERENCE_DATE) is None
+    assert "is up to date" in capsys.readouterr().out
@@ -0,0 +1,30 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pharmacy_route.mock_route import mock_route_patient
+
+
+# Routing of the original substring-based mock router
+@pytest.mark.parametrize(
+    "issue, provider, urgency",
+    [
+        ("I need my travel vaccinations", "nurse", 0),
+        ("I have a bloody nose", "GP", 2),
+        ("I feel severely dizzy", "GP", 2),
+        ("I routinely check my sugar levels", "nurse", 0),
+        ("I need a blood test", "nurse", 0),
+        ("I keep getting colds and headaches", "pharmacist", None),
+        ("I have chest pain", "GP", 2),
+        ("My knee hurts", "GP", 0),
+        ("", "GP", 0),
+    ],
+)
+def test_routes_like_substring_matching(issue, provider, urgency):
+    routed_to, output = mock_route_patient(SimpleNamespace(issue=issue))
+    assert routed_to == provider
+    assert (output.urgency if output else None) == urgency
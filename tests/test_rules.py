@@ -0,0 +1,29 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pharmacy_route.pharmacy import RULE_ENGINE
+
+
+def evaluate(issue: str):
+    return RULE_ENGINE.evaluate(SimpleNamespace(issue=issue, patient_is_on_cancer_pathway=False, age=30, sex="female"))
+
+
+def test_negated_pharmacy_keyword_falls_through():
+    assert evaluate("no sore throat; I need a review of my diabetes medication") is None
+
+
+def test_negated_red_flag_falls_through():
+    assert evaluate("no chest pain, just a routine check") is None
+
+
+def test_affirmed_keywords_still_match():
+    assert evaluate("I have a sore throat").rule == "pharmacy:sore throat"
+    assert evaluate("I have chest pain").rule == "red_flag"
+
+
+def test_negation_stops_at_the_clause():
+    decision = evaluate("I don't have a sore throat but I need my flu vaccination")
+    assert decision.rule.startswith("nurse:Immunisations")